@@ -0,0 +1,285 @@
+"""=== Camera service ==========================================================
+Long-lived camera session used by Engines.
+Opening, configuring and starting a sensor - and letting its exposure settle - costs seconds. CameraService does it
+once, then keeps the sensor streaming: every capture is served from the running stream, so after warm-up a capture
+costs a single frame interval.
+
+Backends are pluggable (see BACKENDS):
+- "picamera2": the RaspberryPi camera over Picamera2. Imported only when used.
+- "synthetic": generated frames at a fixed frame rate. No hardware needed: use it for tests, and on non-Pi machines.
+============================================================== by Sziller ==="""
+
+import time
+import logging
+import inspect
+import threading
+import numpy as np
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+ROTATIONS: tuple = (0, 180)  # degrees: the sensor can flip the image, not transpose it
+
+
+class CameraBackend:
+    """=== Class name: CameraBackend ===================================================================================
+    Interface every camera backend implements.
+    Frames are numpy arrays of shape (height, width, channels), dtype uint8, channels in RGB order.
+    ============================================================================================== by Sziller ==="""
+    frame_interval: float = 0.0  # seconds between two frames of the stream
+    frame_shape: tuple = ()  # shape of the arrays returned by capture_array()
+
+    def start(self):
+        """Opens, configures and starts streaming"""
+        raise NotImplementedError
+
+    def capture_array(self) -> np.ndarray:
+        """Returns the next frame of the running stream"""
+        raise NotImplementedError
+
+    def capture_into(self, buffer: np.ndarray):
+        """Copies the next frame of the running stream into the preallocated <buffer>"""
+        np.copyto(buffer, self.capture_array())
+
+    def capture_file(self, filename: str):
+        """Saves the next frame of the running stream as an image file"""
+        raise NotImplementedError
+
+    def save_frame(self, frame: np.ndarray, filename: str):
+        """Saves an already captured <frame> as an image file"""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stops streaming and releases the device"""
+        raise NotImplementedError
+
+
+class Picamera2Backend(CameraBackend):
+    """=== Class name: Picamera2Backend ================================================================================
+    RaspberryPi camera, accessed over Picamera2. Sensor is configured for continuous (video) streaming.
+    Format "BGR888" is requested: libcamera names formats by their little-endian word, so its "BGR888" frames are
+    R, G, B bytes in memory - the RGB arrays PIL and the motion detector expect. ("RGB888" would be BGR in memory.)
+    :param rotation: int - 0 or 180 degrees, applied by the sensor (libcamera Transform) - it can only flip
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, size: tuple = (1280, 960), fps: float = 10.0, rotation: int = 0, **kwargs):
+        rotation = int(rotation) % 360
+        if rotation not in ROTATIONS:
+            raise ValueError("invalid <rotation>: {} - choose from {}".format(rotation, ROTATIONS))
+        self.size: tuple            = size
+        self.fps: float             = fps
+        self.rotation: int          = rotation
+        self.frame_interval: float  = 1.0 / fps
+        self.frame_shape: tuple     = (size[1], size[0], 3)
+        self.camera                 = None
+
+    def start(self):
+        from picamera2 import Picamera2  # only available on RaspberryPi
+        from libcamera import Transform  # installed together with Picamera2
+        self.camera = Picamera2()
+        flip = int(self.rotation == 180)
+        cam_conf = self.camera.create_video_configuration(main={"size": self.size, "format": "BGR888"},
+                                                          transform=Transform(hflip=flip, vflip=flip),
+                                                          controls={"FrameRate": self.fps})
+        self.camera.configure(cam_conf)
+        self.camera.start()
+
+    def capture_array(self) -> np.ndarray:
+        return self.camera.capture_array("main")
+
+    def capture_file(self, filename: str):
+        self.camera.capture_file(filename)
+
+    def save_frame(self, frame: np.ndarray, filename: str):
+        from PIL import Image  # installed together with Picamera2
+        Image.fromarray(frame).save(filename)
+
+    def stop(self):
+        if self.camera is not None:
+            self.camera.close()
+        self.camera = None
+
+
+class SyntheticBackend(CameraBackend):
+    """=== Class name: SyntheticBackend ================================================================================
+    Fake camera producing generated frames at <fps>, following the timing of a real stream: capture_array() waits
+    for the next frame tick.
+    Frames show a gray gradient, with the frame counter encoded into the first row, so every frame is different.
+    <pattern> "moving_square" adds motion to test detection on: a white square crosses the frame during every second
+    <motion_period> frames, and the scene is still in between.
+    Image files are written by PIL if installed, otherwise raw numpy arrays are saved under the name entered.
+    <rotation> 180 turns the gradient, as the sensor of Picamera2Backend would turn the scene.
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, size: tuple = (320, 240), fps: float = 30.0, pattern: str = "gradient",
+                 motion_period: int = 30, rotation: int = 0, **kwargs):
+        if pattern not in ("gradient", "moving_square"):
+            raise ValueError("invalid <pattern>: {}".format(pattern))
+        rotation = int(rotation) % 360
+        if rotation not in ROTATIONS:
+            raise ValueError("invalid <rotation>: {} - choose from {}".format(rotation, ROTATIONS))
+        self.rotation: int          = rotation
+        self.size: tuple            = size
+        self.fps: float             = fps
+        self.pattern: str           = pattern
+        self.motion_period: int     = motion_period
+        self.frame_interval: float  = 1.0 / fps
+        self.frame_shape: tuple     = (size[1], size[0], 3)
+        self.frame_count: int       = 0
+        self.next_frame_at: float   = 0.0
+        self.base_frame             = None
+
+    def start(self):
+        width, height = self.size
+        gradient = np.linspace(0, 255, width, dtype=np.float32).astype(np.uint8)
+        self.base_frame = np.repeat(np.tile(gradient, (height, 1))[:, :, np.newaxis], 3, axis=2)
+        if self.rotation == 180:
+            self.base_frame = np.ascontiguousarray(self.base_frame[::-1, ::-1])
+        self.frame_count = 0
+        self.next_frame_at = time.monotonic()
+
+    def generate_frame(self, frame_nr: int, out: np.ndarray or None = None) -> np.ndarray:
+        """Writes frame number <frame_nr> of the synthetic stream into <out> (new array if None), and returns it"""
+        if out is None:
+            out = np.empty_like(self.base_frame)
+        np.copyto(out, self.base_frame)
+        out[0, :8, 0] = np.frombuffer(frame_nr.to_bytes(8, "little"), dtype=np.uint8)
+        if self.pattern == "moving_square" and (frame_nr // self.motion_period) % 2:
+            width, height = self.size
+            side = max(height // 6, 1)
+            x = (frame_nr % self.motion_period) * (width - side) // max(self.motion_period - 1, 1)
+            y = (height - side) // 2
+            out[y: y + side, x: x + side] = 255
+        return out
+
+    def wait_for_next_frame(self):
+        """Sleeps until the next frame tick of the stream"""
+        delay = self.next_frame_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame_at = max(self.next_frame_at + self.frame_interval, time.monotonic())
+        self.frame_count += 1
+
+    def capture_array(self) -> np.ndarray:
+        self.wait_for_next_frame()
+        return self.generate_frame(frame_nr=self.frame_count)
+
+    def capture_into(self, buffer: np.ndarray):
+        self.wait_for_next_frame()
+        self.generate_frame(frame_nr=self.frame_count, out=buffer)
+
+    def capture_file(self, filename: str):
+        self.save_frame(frame=self.capture_array(), filename=filename)
+
+    def save_frame(self, frame: np.ndarray, filename: str):
+        try:
+            from PIL import Image
+        except ImportError:
+            with open(filename, "wb") as file:
+                np.save(file, frame)
+            return
+        Image.fromarray(frame).save(filename)
+
+    def stop(self):
+        self.base_frame = None
+
+
+BACKENDS: dict = {"picamera2": Picamera2Backend,
+                  "synthetic": SyntheticBackend}
+
+
+class CameraService:
+    """=== Class name: CameraService ===================================================================================
+    Keeps one camera backend running for the lifetime of the Engine.
+    First call of any capture starts (and warms up) the sensor, if < start() > was not called before. Later captures
+    are served from the running stream. Access is serialized: instance can be shared between threads.
+    :param backend: str - key of BACKENDS
+    :param settle_time: float - seconds to let exposure settle after the sensor is started
+    :param backend_kwargs: dict - passed to the backend's constructor (e.g. size, fps)
+    :param rotation: int - degrees the image is turned by, see ROTATIONS
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self, backend: str = "picamera2", settle_time: float = 2.0, backend_kwargs: dict or None = None,
+                 rotation: int = 0):
+        self.backend_name: str          = backend
+        self.backend: CameraBackend     = BACKENDS[backend](**dict(backend_kwargs or {}, rotation=rotation))
+        self.settle_time: float         = settle_time
+        self.is_running: bool           = False
+        self.started_at: float          = 0.0
+        self.n_captures: int            = 0
+        self._lock                      = threading.RLock()
+
+    @property
+    def frame_interval(self) -> float:
+        return self.backend.frame_interval
+
+    @property
+    def frame_shape(self) -> tuple:
+        return self.backend.frame_shape
+
+    def start(self):
+        """=== Method name: start ======================================================================================
+        Starts the sensor and waits for exposure to settle. Does nothing if already running.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            if self.is_running:
+                return
+            lg.info("camera    : starting backend '{}' - says {}".format(self.backend_name, self.ccn))
+            self.backend.start()
+            time.sleep(self.settle_time)  # let the camera adjust to light levels - only once per session
+            self.is_running = True
+            self.started_at = time.time()
+
+    def capture_array(self) -> np.ndarray:
+        """=== Method name: capture_array ==============================================================================
+        :return: np.ndarray - next frame of the running stream
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            self.start()
+            self.n_captures += 1
+            return self.backend.capture_array()
+
+    def capture_into(self, buffer: np.ndarray):
+        """=== Method name: capture_into ===============================================================================
+        Copies next frame of the running stream into the preallocated <buffer> (shape: < self.frame_shape >).
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            self.start()
+            self.n_captures += 1
+            self.backend.capture_into(buffer)
+
+    def capture_file(self, filename: str):
+        """=== Method name: capture_file ===============================================================================
+        Saves next frame of the running stream into <filename>.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            self.start()
+            self.n_captures += 1
+            self.backend.capture_file(filename)
+
+    def save_frame(self, frame: np.ndarray, filename: str):
+        """=== Method name: save_frame =================================================================================
+        Encodes and saves an already captured <frame>. Does not touch the sensor, so it needs no lock.
+        ========================================================================================== by Sziller ==="""
+        self.backend.save_frame(frame=frame, filename=filename)
+
+    def close(self):
+        """=== Method name: close ======================================================================================
+        Stops the sensor and releases the device.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            if self.is_running:
+                self.backend.stop()
+                lg.info("camera    : backend '{}' stopped - says {}".format(self.backend_name, self.ccn))
+            self.is_running = False
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: state of the service
+        ========================================================================================== by Sziller ==="""
+        return {"backend": self.backend_name,
+                "is_running": self.is_running,
+                "started_at": self.started_at,
+                "frame_interval": self.frame_interval,
+                "n_captures": self.n_captures}
@@ -0,0 +1,255 @@
+"""=== Command executor ========================================================
+Runs long Engine commands on worker threads, so the Engine's loop keeps serving requests meanwhile.
+- Every run is a CommandJob, identified by its job_id: the timestamp of the request it was started by. Jobs can be
+  queried by id while running, and for a while after they are finished (bounded job store).
+- Commands are assigned to lanes. A lane limits the number of its jobs running at once - e.g. "camera": 1, so two
+  photo loops never share the sensor. Jobs over the limit wait in the lane, in order of arrival.
+- Jobs can be cancelled: a waiting job is dropped, a running one is asked to stop by its <cancel_event>, which the
+  command receives as keyword argument and is expected to check between steps.
+- CPU-bound work can be sent to a process pool by < run_in_process() >, from within a command: the GIL is not shared.
+  The Engine encodes GET_full_db_data pages this way.
+============================================================== by Sziller ==="""
+
+import time
+import logging
+import inspect
+import threading
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class CommandJob:
+    """=== Class name: CommandJob ======================================================================================
+    One run of an Engine command, and its state: "queued", "running", "done", "failed" or "cancelled".
+    ============================================================================================== by Sziller ==="""
+    FINAL_STATES = ("done", "failed", "cancelled")
+
+    def __init__(self, job_id: float, command: str, lane: str, function, kwargs: dict, on_done=None):
+        self.job_id: float              = job_id
+        self.command: str               = command
+        self.lane: str                  = lane
+        self.function                   = function
+        self.kwargs: dict               = kwargs
+        self.on_done                    = on_done  # callable(job) - called once the job reached a final state
+        self.state: str                 = "queued"
+        self.result                     = None
+        self.error: str                 = ""
+        self.cancel_event               = threading.Event()
+        self.submitted_at: float        = time.time()
+        self.started_at: float          = 0.0
+        self.finished_at: float         = 0.0
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in self.FINAL_STATES
+
+    def as_dict(self, include_result: bool = True) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :param include_result: bool - include the result of a finished job
+        :return dict: state of the job
+        ========================================================================================== by Sziller ==="""
+        job_dict = {"job_id": self.job_id,
+                    "command": self.command,
+                    "lane": self.lane,
+                    "state": self.state,
+                    "error": self.error,
+                    "submitted_at": self.submitted_at,
+                    "started_at": self.started_at,
+                    "finished_at": self.finished_at}
+        if include_result:
+            job_dict["result"] = self.result
+        return job_dict
+
+
+class CommandExecutor:
+    """=== Class name: CommandExecutor =================================================================================
+    Thread pool running CommandJob-s, with per-lane concurrency limits, cancellation and a queryable job store.
+    :param n_threads: int - worker threads: the max. number of jobs running at once, over all lanes
+    :param lanes: dict - lane name: max. number of its jobs running at once. Lanes not listed: <default_limit>
+    :param default_limit: int - limit of lanes not listed in <lanes>
+    :param n_processes: int - size of the process pool of < run_in_process() >. 0: run in the calling thread
+    :param job_store_size: int - max. number of finished jobs kept for status queries - oldest dropped first
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 n_threads: int             = 4,
+                 lanes: dict or None        = None,
+                 default_limit: int         = 1,
+                 n_processes: int           = 0,
+                 job_store_size: int        = 256):
+        self.lanes: dict                = dict(lanes or {})
+        self.default_limit: int         = default_limit
+        self.job_store_size: int        = job_store_size
+        self.jobs: OrderedDict          = OrderedDict()  # job_id: CommandJob - in order of submission
+        self.waiting: dict              = {}  # lane: deque of CommandJob-s over the lane's limit
+        self.running: dict              = {}  # lane: number of jobs running
+        self.n_submitted: int           = 0
+        self.n_finished: dict           = {_: 0 for _ in CommandJob.FINAL_STATES}
+        self._lock                      = threading.Lock()
+        self.threads                    = ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="Command")
+        self.processes                  = ProcessPoolExecutor(max_workers=n_processes) if n_processes else None
+
+    def submit(self, job_id: float, command: str, function, kwargs: dict, lane: str or None = None,
+               on_done=None) -> CommandJob:
+        """=== Method name: submit =====================================================================================
+        Runs < function(**kwargs, cancel_event=...) > on a worker thread, as soon as <lane>'s limit allows.
+        :param job_id: float - unique id of the job: timestamp of the request
+        :param command: str - name of the command, for status queries and logs
+        :param function: callable - the command. Receives <kwargs> and <cancel_event> (threading.Event)
+        :param kwargs: dict - keyword arguments of <function>
+        :param lane: str - concurrency lane, None: a lane of its own, named by <command>
+        :param on_done: callable(job) - called on the worker thread once the job is finished, failed or cancelled
+        :return: CommandJob - the job, to be queried later by < status() >
+        ========================================================================================== by Sziller ==="""
+        job = CommandJob(job_id=job_id, command=command, lane=lane or command, function=function, kwargs=kwargs,
+                         on_done=on_done)
+        with self._lock:
+            if job_id in self.jobs:
+                raise ValueError("job id already used: {}".format(job_id))
+            self.jobs[job_id] = job
+            self.n_submitted += 1
+            self.evict_finished()
+            if self.running.get(job.lane, 0) < self.lanes.get(job.lane, self.default_limit):
+                self.start(job)
+            else:
+                self.waiting.setdefault(job.lane, deque()).append(job)
+                lg.info("executor  : {} job {} waits in lane '{}' - says {}".format(command, job_id, job.lane,
+                                                                                     self.ccn))
+        return job
+
+    def record(self, job_id: float, command: str, result, error: str = "") -> CommandJob:
+        """=== Method name: record =====================================================================================
+        Stores a command run outside the executor (e.g. inline, on the Engine's loop) as a finished job, so it can be
+        queried the same way as the executor's own jobs.
+        Raises ValueError if <job_id> is already used: the job stored under it is kept.
+        ========================================================================================== by Sziller ==="""
+        job = CommandJob(job_id=job_id, command=command, lane="", function=None, kwargs={})
+        job.started_at = job.submitted_at
+        job.finished_at = time.time()
+        job.state, job.result, job.error = ("failed", None, error) if error else ("done", result, "")
+        with self._lock:
+            if job_id in self.jobs:
+                raise ValueError("job id already used: {}".format(job_id))
+            self.jobs[job_id] = job
+            self.n_submitted += 1
+            self.n_finished[job.state] += 1
+            self.evict_finished()
+        return job
+
+    def alias(self, job_id: float, job: CommandJob):
+        """=== Method name: alias ======================================================================================
+        Makes <job> queryable - and cancellable - by <job_id> as well: used when identical requests share one job.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            if job_id in self.jobs:
+                raise ValueError("job id already used: {}".format(job_id))
+            self.jobs[job_id] = job
+
+    def start(self, job: CommandJob):
+        """Hands <job> to a worker thread. Call with the lock held"""
+        self.running[job.lane] = self.running.get(job.lane, 0) + 1
+        job.state = "running"
+        self.threads.submit(self.run, job)
+
+    def run(self, job: CommandJob):
+        """=== Method name: run ========================================================================================
+        Worker thread's part: runs the job, stores its outcome, and starts the next job waiting in its lane.
+        ========================================================================================== by Sziller ==="""
+        job.started_at = time.time()
+        try:
+            result = job.function(cancel_event=job.cancel_event, **job.kwargs)
+            state, error = ("cancelled" if job.cancel_event.is_set() else "done"), ""
+        except Exception as e:
+            result, state, error = None, "failed", "{}: {}".format(type(e).__name__, e)
+            lg.error("executor  : {} job {} failed: {} - says {}".format(job.command, job.job_id, error, self.ccn))
+        with self._lock:
+            job.result, job.error, job.finished_at = result, error, time.time()
+            job.state = state
+            self.n_finished[state] += 1
+            self.running[job.lane] -= 1
+            lane_waiting = self.waiting.get(job.lane)
+            if lane_waiting:
+                self.start(lane_waiting.popleft())
+        self.notify_done(job)
+
+    def notify_done(self, job: CommandJob):
+        """Calls the <on_done> callback of a finished <job>. A failing callback is logged, never raised"""
+        if job.on_done is None:
+            return
+        try:
+            job.on_done(job)
+        except Exception as e:
+            lg.error("executor  : on_done of job {} failed: {} - says {}".format(job.job_id, e, self.ccn))
+
+    def cancel(self, job_id: float) -> bool:
+        """=== Method name: cancel =====================================================================================
+        Cancels a job: a waiting one is dropped at once, a running one is asked to stop by its <cancel_event>.
+        :return: bool - False if no such job, or it is already finished
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.is_finished:
+                return False
+            job.cancel_event.set()
+            if job.state != "queued":
+                return True
+            self.waiting[job.lane].remove(job)
+            job.state, job.finished_at = "cancelled", time.time()
+            self.n_finished["cancelled"] += 1
+        self.notify_done(job)
+        return True
+
+    def status(self, job_id: float) -> dict or None:
+        """=== Method name: status =====================================================================================
+        :return: dict or None - state of the job (result included once finished), None if unknown or dropped
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job.as_dict(include_result=job.is_finished)
+
+    def evict_finished(self):
+        """Drops the oldest finished jobs over <self.job_store_size>. Call with the lock held"""
+        n_over = len(self.jobs) - self.job_store_size
+        if n_over <= 0:
+            return
+        for job_id in [_ for _, job in self.jobs.items() if job.is_finished][:n_over]:
+            del self.jobs[job_id]
+
+    def run_in_process(self, function, *args, **kwargs):
+        """=== Method name: run_in_process =============================================================================
+        Runs CPU-bound <function> in the process pool, and waits for its result. Call it from within a command.
+        <function> and its arguments must be picklable: a module level function, not a bound method of the Engine.
+        Runs in the calling thread if there is no process pool.
+        ========================================================================================== by Sziller ==="""
+        if self.processes is None:
+            return function(*args, **kwargs)
+        return self.processes.submit(function, *args, **kwargs).result()
+
+    def shutdown(self, wait: bool = True):
+        """=== Method name: shutdown ===================================================================================
+        Cancels waiting jobs, asks running ones to stop, and stops the pools.
+        ========================================================================================== by Sziller ==="""
+        for job_id in list(self.jobs):
+            self.cancel(job_id=job_id)
+        self.threads.shutdown(wait=wait)
+        if self.processes is not None:
+            self.processes.shutdown(wait=wait)
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: counters of the executor, and the jobs not finished
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            jobs = {id(_): _ for _ in self.jobs.values()}.values()  # a job aliased by several ids: listed once
+            return {"submitted": self.n_submitted,
+                    "finished": dict(self.n_finished),
+                    "running": {_: n for _, n in self.running.items() if n},
+                    "waiting": {_: len(jobs) for _, jobs in self.waiting.items() if jobs},
+                    "active_jobs": [_.as_dict(include_result=False) for _ in jobs if not _.is_finished]}
@@ -0,0 +1,129 @@
+"""=== Command registry ========================================================
+Dispatch table of Engine commands, built once at startup.
+Every allowed command is registered with its handler, the schema of its payload and its executor lane. Schemas are
+compiled into plain lookups on registration, so resolving a request costs one dict lookup and a few type checks,
+whatever the number of commands.
+A request is resolved before anything of the Engine is touched: an unknown command, or a payload not matching the
+schema raises CommandError at once, to be answered as an error.
+Payload schema - one entry per argument:
+    {"duration": {"type": (int, float), "required": False, "default": None}}
+Payload may be a dict of these arguments, or None (no arguments). If <scalar_field> is set, a bare value is accepted
+as that one argument, e.g. payload 1700000000.5 for {"job_id": 1700000000.5}.
+Commands registered without a schema take no arguments: whatever payload they are sent is ignored, as it was before
+schemas existed - old clients keep sending e.g. {"id": "obsr"} with GET_photo.
+============================================================== by Sziller ==="""
+
+import logging
+from engine_Observatory.Engine_Metrics import LatencyMetric
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class CommandError(ValueError):
+    """Request cannot be dispatched: unknown command, or malformed payload"""
+
+
+class CommandSpec:
+    """=== Class name: CommandSpec =====================================================================================
+    One registered command: handler, compiled payload schema, lane and latency metric.
+    :param name: str - the command, as sent in requests
+    :param handler: callable - called as handler(payload=<validated dict>, timestamp=, synced=, command=)
+    :param schema: dict - payload schema, see module docstring. None: command takes no arguments, payload is ignored
+    :param scalar_field: str - argument a non-dict payload is taken as
+    :param lane: str - executor lane the command runs in. None: run inline, on the Engine's loop
+    :param coalesce: bool - identical requests (same arguments) may share one execution. False for commands whose
+                     every request must take effect, e.g. sending a message
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, name: str, handler, schema: dict or None = None, scalar_field: str or None = None,
+                 lane: str or None = None, coalesce: bool = True):
+        self.name: str                  = name
+        self.handler                    = handler
+        self.schema: dict               = dict(schema or {})
+        self.ignores_payload: bool      = schema is None
+        self.scalar_field: str or None  = scalar_field
+        self.lane: str or None          = lane
+        self.coalesce: bool             = coalesce
+        self.metric                     = LatencyMetric(name=name)
+        # compiled schema:
+        self.types: dict                = {_: tuple(spec["type"]) if isinstance(spec["type"], (tuple, list))
+                                           else (spec["type"],) for _, spec in self.schema.items()}
+        self.required: tuple            = tuple(_ for _, spec in self.schema.items() if spec.get("required"))
+        self.defaults: dict             = {_: spec.get("default") for _, spec in self.schema.items()
+                                           if not spec.get("required")}
+        if scalar_field is not None and scalar_field not in self.schema:
+            raise ValueError("<scalar_field> {!r} of command {} is not in its schema".format(scalar_field, name))
+
+    def validate(self, payload) -> dict:
+        """=== Method name: validate ===================================================================================
+        :param payload: the request's payload
+        :return: dict - every argument of the schema: validated values, defaults for those not entered
+        :raise CommandError: if <payload> does not match the schema
+        ========================================================================================== by Sziller ==="""
+        if self.ignores_payload:
+            return {}
+        if payload is None:
+            payload = {}
+        elif not isinstance(payload, dict):
+            if self.scalar_field is None:
+                raise CommandError("{}: payload must be a dict or None, got {}".format(
+                    self.name, type(payload).__name__))
+            payload = {self.scalar_field: payload}
+        args = dict(self.defaults)
+        for key, value in payload.items():
+            types = self.types.get(key)
+            if types is None:
+                raise CommandError("{}: unknown argument {!r}".format(self.name, key))
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                raise CommandError("{}: argument {!r} must be {}, got {}".format(
+                    self.name, key, "/".join(_.__name__ for _ in types), type(value).__name__))
+            args[key] = value
+        for key in self.required:
+            if key not in payload:
+                raise CommandError("{}: missing argument {!r}".format(self.name, key))
+        return args
+
+
+class CommandRegistry:
+    """=== Class name: CommandRegistry =================================================================================
+    Maps allowed command names to their CommandSpec. Build it once, then < resolve() > every request.
+    ============================================================================================== by Sziller ==="""
+    def __init__(self):
+        self.specs: dict                = {}  # command: CommandSpec
+        self.n_rejected: int            = 0
+
+    def register(self, name: str, handler, schema: dict or None = None, scalar_field: str or None = None,
+                 lane: str or None = None, coalesce: bool = True) -> CommandSpec:
+        """=== Method name: register ===================================================================================
+        Adds a command to the table. See CommandSpec for the parameters.
+        ========================================================================================== by Sziller ==="""
+        if name in self.specs:
+            raise ValueError("command registered twice: {}".format(name))
+        spec = CommandSpec(name=name, handler=handler, schema=schema, scalar_field=scalar_field, lane=lane,
+                           coalesce=coalesce)
+        self.specs[name] = spec
+        return spec
+
+    def resolve(self, command: str, payload) -> tuple:
+        """=== Method name: resolve ====================================================================================
+        :param command: str - command of the request
+        :param payload: payload of the request
+        :return: tuple - (CommandSpec, validated arguments dict)
+        :raise CommandError: unknown command, or malformed payload
+        ========================================================================================== by Sziller ==="""
+        spec = self.specs.get(command) if isinstance(command, str) else None
+        try:
+            if spec is None:
+                raise CommandError("unknown command: {!r}".format(command))
+            return spec, spec.validate(payload=payload)
+        except CommandError:
+            self.n_rejected += 1
+            raise
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: latency metric of every command, and number of requests rejected
+        ========================================================================================== by Sziller ==="""
+        return {"rejected": self.n_rejected,
+                "commands": {_: spec.metric.as_dict() for _, spec in self.specs.items()}}
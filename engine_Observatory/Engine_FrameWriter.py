@@ -0,0 +1,168 @@
+"""=== Frame writer ============================================================
+Asynchronous encode-and-write stage for captured frames.
+Capturing loop (producer) and file writing (consumers) are decoupled:
+- frames are captured into preallocated buffers of a FrameBufferPool: capturing allocates no memory
+- buffers are put into a bounded queue, and worker threads encode and write them into the output directory
+- if the queue is full, the policy decides: "block" the producer until a worker catches up, or "drop_oldest"
+  queued frame to keep the newest ones.
+JPEG encoding (PIL / libjpeg) releases the GIL, so threads write in parallel with capturing.
+============================================================== by Sziller ==="""
+
+import os
+import logging
+import inspect
+import threading
+from collections import deque
+import numpy as np
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class FrameBufferPool:
+    """=== Class name: FrameBufferPool =================================================================================
+    Fixed number of preallocated frame buffers. Buffers are (re)allocated only if the requested shape changes.
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, size: int):
+        self.size: int                  = size
+        self.shape: tuple               = ()
+        self.dtype                      = np.uint8
+        self.free: list                 = []
+        self._condition                 = threading.Condition()
+
+    def acquire(self, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """=== Method name: acquire ====================================================================================
+        Returns a free buffer of <shape>. Blocks until one is released if all are in use.
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            if tuple(shape) != self.shape or np.dtype(dtype) != self.dtype:
+                self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+                self.free = [np.empty(self.shape, dtype=self.dtype) for _ in range(self.size)]
+            while not self.free:
+                self._condition.wait()
+            return self.free.pop()
+
+    def release(self, buffer: np.ndarray):
+        """=== Method name: release ====================================================================================
+        Gives <buffer> back to the pool. Buffers of an outdated shape are dropped.
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            if buffer.shape == self.shape and buffer.dtype == self.dtype:
+                self.free.append(buffer)
+                self._condition.notify()
+
+
+class FrameWriter:
+    """=== Class name: FrameWriter =====================================================================================
+    Bounded producer/consumer queue of frames to be encoded and written by worker threads.
+    :param save_frame: callable(frame, filename) - encodes and writes one frame, e.g. CameraService.save_frame
+    :param output_dir: str - directory frames are written into. Created if missing.
+    :param n_workers: int - number of writer threads
+    :param queue_size: int - max. number of frames waiting to be written
+    :param policy: str - "block": submit() waits if queue is full - "drop_oldest": oldest waiting frame is dropped
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 save_frame,
+                 output_dir: str    = "./",
+                 n_workers: int     = 2,
+                 queue_size: int    = 8,
+                 policy: str        = "block"):
+        if policy not in ("block", "drop_oldest"):
+            raise ValueError("invalid <policy>: {}".format(policy))
+        self.save_frame                 = save_frame
+        self.output_dir: str            = output_dir
+        self.queue_size: int            = queue_size
+        self.policy: str                = policy
+        # one buffer per queue slot, one per worker, and one being captured into:
+        self.pool                       = FrameBufferPool(size=queue_size + n_workers + 1)
+        self.queue: deque               = deque()
+        self.n_in_progress: int         = 0
+        self.n_submitted: int           = 0
+        self.n_written: int             = 0
+        self.n_dropped: int             = 0
+        self.n_failed: int              = 0
+        self._condition                 = threading.Condition()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.workers = [threading.Thread(target=self.work, name="FrameWriter-{}".format(_), daemon=True)
+                        for _ in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def acquire_buffer(self, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """=== Method name: acquire_buffer =============================================================================
+        Returns a preallocated buffer to capture the next frame into. Hand it over by < submit() >.
+        ========================================================================================== by Sziller ==="""
+        return self.pool.acquire(shape=shape, dtype=dtype)
+
+    def submit(self, buffer: np.ndarray, filename: str):
+        """=== Method name: submit =====================================================================================
+        Queues a captured frame to be written as <filename> into <self.output_dir>.
+        Ownership of <buffer> passes to the writer: it is released into the pool once written or dropped.
+        ========================================================================================== by Sziller ==="""
+        dropped = None
+        with self._condition:
+            if self.policy == "block":
+                while len(self.queue) >= self.queue_size:
+                    self._condition.wait()
+            elif len(self.queue) >= self.queue_size:
+                dropped = self.queue.popleft()
+                self.n_dropped += 1
+            self.queue.append((buffer, os.path.join(self.output_dir, filename)))
+            self.n_submitted += 1
+            self._condition.notify_all()
+        if dropped is not None:
+            lg.warning("dropped   : frame {} - writer can not keep up - says {}".format(dropped[1], self.ccn))
+            self.pool.release(dropped[0])
+
+    def work(self):
+        """=== Method name: work =======================================================================================
+        Worker thread's loop: takes the oldest queued frame, writes it, and releases its buffer.
+        ========================================================================================== by Sziller ==="""
+        while True:
+            with self._condition:
+                while not self.queue:
+                    self._condition.wait()
+                buffer, full_filename = self.queue.popleft()
+                self.n_in_progress += 1
+                self._condition.notify_all()
+            try:
+                self.save_frame(frame=buffer, filename=full_filename)
+                lg.debug("photo     : saved as {}".format(full_filename))
+                succeeded = True
+            except Exception as e:
+                lg.error("Error writing frame {}:\n {}".format(full_filename, e))
+                succeeded = False
+            self.pool.release(buffer)
+            with self._condition:
+                self.n_in_progress -= 1
+                if succeeded:
+                    self.n_written += 1
+                else:
+                    self.n_failed += 1
+                self._condition.notify_all()
+
+    def flush(self, timeout: float or None = None) -> bool:
+        """=== Method name: flush ======================================================================================
+        Waits until every submitted frame is written (or dropped).
+        :param timeout: float - max. seconds to wait, None: no limit
+        :return: bool - True if writer is idle, False on timeout
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self.queue and not self.n_in_progress, timeout=timeout)
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: counters of the writer
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            return {"output_dir": self.output_dir,
+                    "policy": self.policy,
+                    "queued": len(self.queue),
+                    "in_progress": self.n_in_progress,
+                    "submitted": self.n_submitted,
+                    "written": self.n_written,
+                    "dropped": self.n_dropped,
+                    "failed": self.n_failed}
@@ -0,0 +1,182 @@
+"""=== Measurement cache =======================================================
+Write-through, in-process cache of the latest readings of every sensor - one series per (mea_loc, mea_type).
+Every measurement stored by the Engine is put into the cache as well, so "current temperature in room X" and short
+rolling windows are answered from memory, without a DB read competing with the writer.
+- every series keeps its latest <depth> readings, ordered by timestamp
+- readings older than <ttl> seconds expire: a sensor gone silent is not reported as current
+- at most <max_series> series are kept: the least recently used one is evicted
+- every series knows since when it holds every reading (<complete_from>): a window reaching further back is a miss,
+  to be read from the DB - the cache never answers with a partial window.
+============================================================== by Sziller ==="""
+
+import math
+import time
+import bisect
+import logging
+import inspect
+import threading
+from collections import OrderedDict
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class MeasurementSeries:
+    """=== Class name: MeasurementSeries ===============================================================================
+    Latest readings of one sensor, ordered by timestamp.
+    :param complete_from: float - every reading with a timestamp from this on is held. -inf: the entire history
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, complete_from: float):
+        self.records: list              = []  # of MeasurementRecord-s
+        self.timestamps: list           = []  # of the records, for bisect
+        self.complete_from: float       = complete_from
+
+    def add(self, record: MeasurementRecord):
+        """Inserts <record> by its timestamp - appended, if it is the latest (the usual case)"""
+        if not self.timestamps or record.timestamp >= self.timestamps[-1]:
+            self.records.append(record)
+            self.timestamps.append(record.timestamp)
+            return
+        index = bisect.bisect_right(self.timestamps, record.timestamp)
+        self.records.insert(index, record)
+        self.timestamps.insert(index, record.timestamp)
+
+    def drop_before(self, n_kept: int, t_from: float):
+        """Drops the oldest readings over <n_kept>, and those older than <t_from>. Completeness shrinks with them"""
+        n_drop = max(len(self.records) - n_kept, bisect.bisect_left(self.timestamps, t_from))
+        if n_drop:
+            self.complete_from = max(self.complete_from, math.nextafter(self.timestamps[n_drop - 1], math.inf))
+            del self.records[:n_drop]
+            del self.timestamps[:n_drop]
+
+
+class LatestValueCache:
+    """=== Class name: LatestValueCache ================================================================================
+    Latest readings per (mea_loc, mea_type), with hit counters. Safe to use from several threads.
+    :param depth: int - readings kept per series
+    :param max_series: int - series kept - least recently used evicted first
+    :param ttl: float - seconds a reading is served for, counted from its timestamp
+    :param clock: callable - returns UNIX time
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self, depth: int = 120, max_series: int = 256, ttl: float = 3600.0, clock=time.time):
+        self.depth: int                 = depth
+        self.max_series: int            = max_series
+        self.ttl: float                 = ttl
+        self.clock                      = clock
+        self.series: OrderedDict        = OrderedDict()  # (mea_loc, mea_type): MeasurementSeries - LRU first
+        self.n_hits: int                = 0
+        self.n_misses: int              = 0
+        self.n_updates: int             = 0
+        self.n_evicted_series: int      = 0
+        self._lock                      = threading.Lock()
+
+    def update(self, records: list):
+        """=== Method name: update =====================================================================================
+        Write-through: puts MeasurementRecord-s just stored into their series. A new series holds every reading from
+        its first one on.
+        ========================================================================================== by Sziller ==="""
+        t_from = self.clock() - self.ttl
+        with self._lock:
+            for record in records:
+                if record.timestamp < t_from:
+                    continue
+                key = (record.mea_loc, record.mea_type)
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = MeasurementSeries(complete_from=record.timestamp)
+                series.add(record)
+                series.drop_before(n_kept=self.depth, t_from=t_from)
+                self.series.move_to_end(key)
+            self.n_updates += len(records)
+            self.evict_series()
+
+    def load(self, mea_loc: str, mea_type: str, records: list, complete_from: float):
+        """=== Method name: load =======================================================================================
+        Warms a series by readings read from the DB.
+        :param records: list - of MeasurementRecord-s: every reading of the sensor from <complete_from> on
+        :param complete_from: float - start of the range read. -inf: <records> are the entire history
+        ========================================================================================== by Sziller ==="""
+        t_from = self.clock() - self.ttl
+        key = (mea_loc, mea_type)
+        with self._lock:
+            series = self.series.get(key)
+            known = {_.mea_hash for _ in series.records} if series is not None else set()
+            if series is None:
+                series = self.series[key] = MeasurementSeries(complete_from=complete_from)
+            else:
+                series.complete_from = min(series.complete_from, complete_from)
+            for record in records:
+                if record.mea_hash not in known:
+                    series.add(record)
+            series.drop_before(n_kept=self.depth, t_from=t_from)
+            self.series.move_to_end(key)
+            self.evict_series()
+
+    def evict_series(self):
+        """Drops least recently used series over <self.max_series>. Call with the lock held"""
+        while len(self.series) > self.max_series:
+            self.series.popitem(last=False)
+            self.n_evicted_series += 1
+
+    def lookup(self, mea_loc: str, mea_type: str) -> MeasurementSeries or None:
+        """Returns the series of the sensor with expired readings dropped, None if not cached. Call with lock held"""
+        series = self.series.get((mea_loc, mea_type))
+        if series is None:
+            return None
+        series.drop_before(n_kept=self.depth, t_from=self.clock() - self.ttl)
+        self.series.move_to_end((mea_loc, mea_type))
+        return series
+
+    def count(self, hit: bool):
+        """Counts a read. Call with the lock held"""
+        if hit:
+            self.n_hits += 1
+        else:
+            self.n_misses += 1
+
+    def latest(self, mea_loc: str, mea_type: str, n: int = 1) -> list or None:
+        """=== Method name: latest =====================================================================================
+        :param n: int - number of readings requested
+        :return: list or None - the latest <n> readings (MeasurementRecord-s, oldest first) - fewer only if the
+                 sensor has no more. None: miss - not cached, or expired - read the DB.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            series = self.lookup(mea_loc=mea_loc, mea_type=mea_type)
+            hit = series is not None and bool(series.records) and (
+                    len(series.records) >= n or series.complete_from == -math.inf)
+            self.count(hit=hit)
+            return series.records[-n:] if hit else None
+
+    def window(self, mea_loc: str, mea_type: str, seconds: float) -> list or None:
+        """=== Method name: window =====================================================================================
+        :param seconds: float - length of the rolling window, ending now
+        :return: list or None - every reading of the window (MeasurementRecord-s, oldest first). None: miss - the
+                 cache does not hold the entire window - read the DB.
+        ========================================================================================== by Sziller ==="""
+        t_from = self.clock() - seconds
+        with self._lock:
+            series = self.lookup(mea_loc=mea_loc, mea_type=mea_type)
+            hit = series is not None and series.complete_from <= t_from
+            self.count(hit=hit)
+            return series.records[bisect.bisect_left(series.timestamps, t_from):] if hit else None
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: settings and counters of the cache
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            n_reads = self.n_hits + self.n_misses
+            return {"depth": self.depth,
+                    "max_series": self.max_series,
+                    "ttl": self.ttl,
+                    "series": len(self.series),
+                    "readings": sum(len(_.records) for _ in self.series.values()),
+                    "hits": self.n_hits,
+                    "misses": self.n_misses,
+                    "hit_rate": self.n_hits / n_reads if n_reads else 0.0,
+                    "updates": self.n_updates,
+                    "evicted_series": self.n_evicted_series}
@@ -16,7 +16,8 @@ range between User and Engine is walked through forth and back.
 Assync or Fire and Forget means:
 User's request is interpretted by (thus: programmed on) the Endpoint to be time-consuming. The Endpoint receives an
 immediate answer from the Messanger, only confirming msg forwarding. Actual results will have to be requested either by
-the User on demand, or by the Frontend automatically.
+the User on demand, or by the Frontend automatically: the answer carries a job handle - the request's timestamp as
+job id - to be polled by a "GET_job_status" request.
 
 This module is designed to use in many of the Backend Engine setups.
 The intended way to set up SHMC is to have physical systems interacted with dedicated RaspberryPi computers.
@@ -34,14 +35,34 @@ interacted with in daemon style.
 
 Any remote Server can send its requests via the Socket.
 Engines are turned on/off manually. (e.g. over direct ssh connection)
+
+Socket modes (hcdd["socket_mode"]):
+- "REP"   : one request at a time. A synced request blocks the socket until Engine responds or timeout.
+- "ROUTER": many requests in flight. Responses are sent back in the order the Engine finishes them. Admission of
+            synced requests is limited by hcdd["max_in_flight"] and hcdd["max_in_flight_per_client"]; requests over
+            the limit wait in a per-client backlog, and backlogs are admitted round-robin for fairness.
+            Any REQ or DEALER socket can be used as client.
+
+Wire format:
+Messages travel encoded by < shmc_messages.codec > (multipart, binary payloads zero-copy). Old clients sending pickled
+objects are still served - in pickle - as long as hcdd["accept_pickle"] is True. Responses always use the format of
+the request.
 ============================================================== by Sziller ==="""
 
 import time
+import heapq
 import logging
 import inspect
+import itertools
+import threading
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import zmq
 from multiprocessing import Queue
 from shmc_messages import msg
+from shmc_messages import codec
 
 
 # LOGGING                                                                                   logging - START -
@@ -68,15 +89,21 @@ class EngineMessageHandler:
         # NOTE: this data CANNOT be modified at runtime.
         self.zmq_port: int          = zmq_port
         self.hcdd_default           = {"timeout": 5,
-                                       "cpu_delay": 0.01,
+                                       "orphan_store_size": 256,
+                                       "socket_mode": "REP",  # "REP" or "ROUTER" - see module docstring
+                                       "max_in_flight": 64,  # ROUTER mode only
+                                       "max_in_flight_per_client": 8,  # ROUTER mode only
+                                       "max_backlog_per_client": 256,  # ROUTER mode only
+                                       "accept_pickle": True,  # serve old clients sending pickled messages
                                        "err_msg_path": "./"}
         if hcdd:  # if <hcdd> update is entered...
             self.hcdd_default.update(hcdd)  # updated the INSTANCE stored default!!!
         self.hcdd = self.hcdd_default
     
         # Establish ZMQ socket                                                              -   START   -
-        context = zmq.Context()
-        self.socket = context.socket(zmq.REP)
+        self.context = zmq.Context()
+        self.socket_mode: str       = self.hcdd["socket_mode"]
+        self.socket = self.context.socket({"REP": zmq.REP, "ROUTER": zmq.ROUTER}[self.socket_mode])
         self.socket.bind("tcp://*:{}".format(self.zmq_port))
         # Establish ZMQ socket                                                              -   ENDED   -
 
@@ -84,8 +111,18 @@ class EngineMessageHandler:
         self.queue_hub_to_eng = queue_hub_to_eng
         self.queue_eng_to_hub = queue_eng_to_hub
         # Queue management                                                                  -   START   -
-        
-        self.listen()
+
+        # Response correlation                                                              -   START   -
+        self.correlator = None
+        if self.queue_eng_to_hub is not None:
+            self.correlator = ResponseCorrelator(queue_eng_to_hub=self.queue_eng_to_hub,
+                                                 orphan_store_size=self.hcdd["orphan_store_size"])
+        # Response correlation                                                              -   ENDED   -
+
+        if self.socket_mode == "ROUTER":
+            self.listen_router()
+        else:
+            self.listen()
 
     def listen(self):
         """=== Method name: listen =====================================================================================
@@ -100,59 +137,400 @@ class EngineMessageHandler:
             lg.debug("new loop  : listen() - to socket still active after recent message")
             # Awaiting new message from Router: (ATTENTION: line interrupts program flow!)
             try:
-                msg_hub_to_eng: msg.InternalMsg           = self.socket.recv_pyobj()
-                # Validate the type of the received message
-                if not isinstance(msg_hub_to_eng, msg.InternalMsg):
-                    lg.error("Received message of invalid type: {}".format(type(msg_hub_to_eng)))
-                    continue  # Continue to the next iteration of the loop: start over at --> "while True"
+                frames = self.socket.recv_multipart(copy=False)
             except Exception as e:
                 lg.error("Error receiving message from socket:\n {}".format(e))
                 continue  # Continue to the next iteration of the loop: start over at --> "while True"
+            msg_hub_to_eng, wire_format = self.decode_request(frames=frames)
+            if msg_hub_to_eng is None:  # REP socket must answer every request, even an invalid one
+                self.send_response(envelope=[], msg_eng_to_hub=self.invalid_request_response(), wire_format=wire_format)
+                continue  # Continue to the next iteration of the loop: start over at --> "while True"
                 
             # New message arrived:
             lg.info("received  : message from API over socket: {}".format(msg_hub_to_eng.payload))
             
             # Process the message:
+            # - register for response BEFORE forwarding, so even an immediate Engine response is routed to us
+            response_future = None
+            if msg_hub_to_eng.synced and self.correlator is not None:
+                response_future = self.correlator.register(msg_id=msg_hub_to_eng.timestamp)
             # - forward message into Queue
             self.queue_hub_to_eng.put(msg_hub_to_eng)
             lg.debug("put       : message into Queue for Engine: {}".format(msg_hub_to_eng.payload))
             # - read msg-sync mode:
             if msg_hub_to_eng.synced:  # request-response mode
-                msg_eng_to_hub = self.handle_synced_message(msg_hub_to_eng=msg_hub_to_eng)
+                msg_eng_to_hub = self.handle_synced_message(msg_hub_to_eng=msg_hub_to_eng,
+                                                            response_future=response_future)
             else:  # fire and forget mode
-                msg_eng_to_hub = msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
-                                                         message="request being processed",
-                                                         timestamp=msg_hub_to_eng.timestamp)
-            try:
-                # Attempt to send the response back through the socket
-                self.socket.send_pyobj(msg_eng_to_hub)
-                lg.debug("sent      : response to API over socket: {}".format(msg_eng_to_hub.payload))
-            except Exception as e:
-                # If an error occurs while sending, log it
-                lg.error("Error sending response to socket:\n {}".format(e))
+                msg_eng_to_hub = self.job_handle_response(msg_hub_to_eng=msg_hub_to_eng)
+            self.send_response(envelope=[], msg_eng_to_hub=msg_eng_to_hub, wire_format=wire_format)
+
+    def decode_request(self, frames: list) -> tuple:
+        """=== Method name: decode_request =============================================================================
+        Decodes a request received on the socket, in whichever wire format it arrived.
+        :param frames: list - message frames (without routing envelope)
+        :return: tuple - (msg.InternalMsg or None if invalid, wire format to answer in)
+        ========================================================================================== by Sziller ==="""
+        wire_format = codec.detect_format(frames[0])
+        if wire_format == "unknown":
+            wire_format = "codec"
+        try:
+            msg_hub_to_eng, wire_format = codec.unpack(frames, accept_pickle=self.hcdd["accept_pickle"])
+        except Exception as e:
+            lg.error("Error decoding message from socket:\n {}".format(e))
+            return None, wire_format
+        # Validate the type of the received message
+        if not isinstance(msg_hub_to_eng, msg.InternalMsg):
+            lg.error("Received message of invalid type: {}".format(type(msg_hub_to_eng)))
+            return None, wire_format
+        return msg_hub_to_eng, wire_format
+
+    @staticmethod
+    def job_handle_response(msg_hub_to_eng: msg.InternalMsg) -> msg.ExternalResponseMsg:
+        """=== Method name: job_handle_response ========================================================================
+        Immediate answer to a fire-and-forget request: a handle of the Engine job it starts. The job id is the
+        request's timestamp - poll it by a "GET_job_status" request with payload {"job_id": <job_id>}.
+        :return: msg.ExternalResponseMsg - payload: {"job_id": float, "status_command": str}
+        ========================================================================================== by Sziller ==="""
+        return msg.ExternalResponseMsg(payload={"job_id": msg_hub_to_eng.timestamp,
+                                                "status_command": "GET_job_status"},
+                                       message="request being processed",
+                                       timestamp=msg_hub_to_eng.timestamp)
+
+    @staticmethod
+    def invalid_request_response() -> msg.ExternalResponseMsg:
+        """=== Method name: invalid_request_response ===================================================================
+        :return: msg.ExternalResponseMsg - answer to requests that could not be decoded
+        ========================================================================================== by Sziller ==="""
+        return msg.ExternalResponseMsg(payload=None, message="invalid message", timestamp=0.0)
+
+    @staticmethod
+    def duplicate_response(msg_hub_to_eng: msg.InternalMsg) -> msg.ExternalResponseMsg:
+        """=== Method name: duplicate_response =========================================================================
+        :return: msg.ExternalResponseMsg - answer to a request whose id is already in flight or in the backlog
+        ========================================================================================== by Sziller ==="""
+        return msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
+                                       message="duplicate message id",
+                                       timestamp=msg_hub_to_eng.timestamp)
+
+    def send_response(self, envelope: list, msg_eng_to_hub: msg.ExternalResponseMsg, wire_format: str):
+        """=== Method name: send_response ==============================================================================
+        Sends <msg_eng_to_hub> over the socket, encoded in <wire_format>.
+        :param envelope: list - routing frames (ROUTER mode) - empty list in REP mode
+        :param msg_eng_to_hub: msg.ExternalResponseMsg - the response
+        :param wire_format: str - "codec" or "pickle": the format the request arrived in
+        ========================================================================================== by Sziller ==="""
+        try:
+            frames = codec.pack(msg_eng_to_hub, wire_format=wire_format)
+        except codec.CodecError as e:
+            lg.error("Error encoding response:\n {}".format(e))
+            frames = codec.pack(msg.ExternalResponseMsg(payload=None,
+                                                        message="response cannot be encoded",
+                                                        timestamp=msg_eng_to_hub.timestamp), wire_format=wire_format)
+        try:
+            # Attempt to send the response back through the socket
+            self.socket.send_multipart(envelope + frames, copy=False)
+            lg.debug("sent      : response to API over socket: {}".format(msg_eng_to_hub.payload))
+        except Exception as e:
+            # If an error occurs while sending, log it
+            lg.error("Error sending response to socket:\n {}".format(e))
+
+    def listen_router(self):
+        """=== Method name: listen_router ==============================================================================
+        ROUTER mode counterpart of < listen() >: keeps many requests in flight.
+        Loop waits on two sockets at the same time:
+        - the ROUTER socket: new requests from any client
+        - an inproc PULL socket: wake-up signals sent whenever an Engine response arrives for an in-flight request
+        Poll timeout is set to the nearest in-flight deadline, so timed-out requests are answered in time.
+        ========================================================================================== by Sziller ==="""
+        self.wakeup_address: str        = "inproc://hub-wakeup-{}".format(id(self))
+        self.wakeup_pull = self.context.socket(zmq.PULL)
+        self.wakeup_pull.bind(self.wakeup_address)
+        self.wakeup_push_local          = threading.local()  # one PUSH socket per signalling thread
+        self.init_router_state()
+
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(self.wakeup_pull, zmq.POLLIN)
+        while True:
+            timeout_ms = None
+            if self.deadlines:
+                timeout_ms = max(0, int((self.deadlines[0][0] - time.time()) * 1000) + 1)
+            events = dict(poller.poll(timeout=timeout_ms))  # ATTENTION: line interrupts program flow!
+            if self.wakeup_pull in events:
+                while True:  # wake-up signals carry no data: results are in <self.completed>
+                    try:
+                        self.wakeup_pull.recv(flags=zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+            if self.socket in events:
+                while True:  # drain every request waiting on the socket
+                    try:
+                        frames = self.socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+                    except zmq.Again:
+                        break
+                    self.handle_router_request(frames=frames)
+            while self.completed:
+                self.finish_in_flight(msg_id=self.completed.popleft(), timed_out=False)
+            now = time.time()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, _, msg_id = heapq.heappop(self.deadlines)
+                if msg_id in self.in_flight:
+                    self.finish_in_flight(msg_id=msg_id, timed_out=True)
+            self.admit_backlog()
 
-    def handle_synced_message(self, msg_hub_to_eng):
+    def init_router_state(self):
+        """=== Method name: init_router_state ==========================================================================
+        Sets up the bookkeeping of < listen_router() >: requests in flight, backlogs and deadlines.
+        ========================================================================================== by Sziller ==="""
+        self.completed: deque           = deque()  # msg_id-s whose response has arrived
+        self.in_flight: dict            = {}  # msg_id: (envelope, wire_format, msg_hub_to_eng, future)
+        self.client_in_flight: dict     = {}  # client_id: number of requests in flight
+        self.backlog: OrderedDict       = OrderedDict()  # client_id: deque of (envelope, wire_format, msg_hub_to_eng)
+        self.backlog_ids: set           = set()  # msg_id-s of every request waiting in <self.backlog>
+        self.deadlines: list            = []  # heap of (deadline, sequence, msg_id)
+        self.deadline_sequence          = itertools.count()
+
+    def handle_router_request(self, frames: list):
+        """=== Method name: handle_router_request ======================================================================
+        Handles one multipart message received on the ROUTER socket.
+        Frames are: [client identity, (empty delimiter of REQ clients,) message frames]. Everything before the message
+        frames is kept as envelope, and is sent back as is with the response.
+        Fire-and-forget messages are forwarded and answered at once. Synced messages are admitted if limits allow,
+        else put into the client's backlog, or refused if that is full, too. A synced message whose id is already in
+        flight or waiting in a backlog is refused as a duplicate.
+        :param frames: list - of zmq.Frame-s, as received on the ROUTER socket
+        ========================================================================================== by Sziller ==="""
+        n_envelope = 2 if len(frames) > 2 and not len(frames[1].buffer) else 1
+        envelope, client_id = frames[:n_envelope], frames[0].bytes
+        msg_hub_to_eng, wire_format = self.decode_request(frames=frames[n_envelope:])
+        if msg_hub_to_eng is None:
+            self.send_router_response(envelope=envelope, msg_eng_to_hub=self.invalid_request_response(),
+                                      wire_format=wire_format)
+            return
+        lg.info("received  : message from API over socket: {}".format(msg_hub_to_eng.payload))
+
+        if not msg_hub_to_eng.synced:  # fire and forget mode
+            self.queue_hub_to_eng.put(msg_hub_to_eng)
+            self.send_router_response(envelope=envelope,
+                                      msg_eng_to_hub=self.job_handle_response(msg_hub_to_eng=msg_hub_to_eng),
+                                      wire_format=wire_format)
+            return
+        if msg_hub_to_eng.timestamp in self.in_flight or msg_hub_to_eng.timestamp in self.backlog_ids:
+            self.send_router_response(envelope=envelope,
+                                      msg_eng_to_hub=self.duplicate_response(msg_hub_to_eng=msg_hub_to_eng),
+                                      wire_format=wire_format)
+            return
+        if self.may_admit(client_id=client_id) and not self.backlog.get(client_id):
+            self.admit(envelope=envelope, wire_format=wire_format, msg_hub_to_eng=msg_hub_to_eng)
+            return
+        client_backlog = self.backlog.setdefault(client_id, deque())
+        if len(client_backlog) >= self.hcdd["max_backlog_per_client"]:
+            self.send_router_response(envelope=envelope,
+                                      msg_eng_to_hub=msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
+                                                                             message="busy",
+                                                                             timestamp=msg_hub_to_eng.timestamp),
+                                      wire_format=wire_format)
+            return
+        client_backlog.append((envelope, wire_format, msg_hub_to_eng))
+        self.backlog_ids.add(msg_hub_to_eng.timestamp)
+
+    def may_admit(self, client_id: bytes) -> bool:
+        """=== Method name: may_admit ==================================================================================
+        :return: bool - True if both the global and <client_id>'s in-flight limits allow one more request.
+        ========================================================================================== by Sziller ==="""
+        return (len(self.in_flight) < self.hcdd["max_in_flight"]
+                and self.client_in_flight.get(client_id, 0) < self.hcdd["max_in_flight_per_client"])
+
+    def admit(self, envelope: list, wire_format: str, msg_hub_to_eng: msg.InternalMsg):
+        """=== Method name: admit ======================================================================================
+        Puts a synced request in flight: registers for its response, forwards it to the Engine and sets its deadline.
+        :param envelope: list - routing frames of the request
+        :param wire_format: str - format the request arrived in
+        :param msg_hub_to_eng: msg.InternalMsg - the request
+        ========================================================================================== by Sziller ==="""
+        msg_id, client_id = msg_hub_to_eng.timestamp, envelope[0].bytes
+        if msg_id in self.in_flight:  # never overwrite the entry of the request already in flight
+            self.send_router_response(envelope=envelope,
+                                      msg_eng_to_hub=self.duplicate_response(msg_hub_to_eng=msg_hub_to_eng),
+                                      wire_format=wire_format)
+            return
+        if self.correlator is None:
+            self.send_router_response(envelope=envelope,
+                                      msg_eng_to_hub=msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
+                                                                             message="timed out",
+                                                                             timestamp=msg_id),
+                                      wire_format=wire_format)
+            return
+        future = self.correlator.register(msg_id=msg_id)
+        self.in_flight[msg_id] = (envelope, wire_format, msg_hub_to_eng, future)
+        self.client_in_flight[client_id] = self.client_in_flight.get(client_id, 0) + 1
+        heapq.heappush(self.deadlines, (time.time() + self.hcdd["timeout"], next(self.deadline_sequence), msg_id))
+        self.queue_hub_to_eng.put(msg_hub_to_eng)
+        lg.debug("put       : message into Queue for Engine: {}".format(msg_hub_to_eng.payload))
+        future.add_done_callback(lambda _, msg_id=msg_id: self.signal_completed(msg_id=msg_id))
+
+    def admit_backlog(self):
+        """=== Method name: admit_backlog ==============================================================================
+        Admits waiting requests, one per client per round (round-robin), while limits allow.
+        ========================================================================================== by Sziller ==="""
+        admitted = True
+        while admitted and self.backlog and len(self.in_flight) < self.hcdd["max_in_flight"]:
+            admitted = False
+            for client_id in list(self.backlog):
+                client_backlog = self.backlog[client_id]
+                if client_backlog and self.may_admit(client_id=client_id):
+                    envelope, wire_format, msg_hub_to_eng = client_backlog.popleft()
+                    self.backlog_ids.discard(msg_hub_to_eng.timestamp)
+                    self.admit(envelope=envelope, wire_format=wire_format, msg_hub_to_eng=msg_hub_to_eng)
+                    self.backlog.move_to_end(client_id)  # served client goes to the end of the round
+                    admitted = True
+                if not client_backlog:
+                    del self.backlog[client_id]
+
+    def signal_completed(self, msg_id: float):
+        """=== Method name: signal_completed ===========================================================================
+        Called (from any thread) once the response to <msg_id> arrived. Wakes up < listen_router() >'s poller.
+        ========================================================================================== by Sziller ==="""
+        self.completed.append(msg_id)
+        push = getattr(self.wakeup_push_local, "socket", None)
+        if push is None:
+            push = self.context.socket(zmq.PUSH)
+            push.connect(self.wakeup_address)
+            self.wakeup_push_local.socket = push
+        push.send(b"")
+
+    def finish_in_flight(self, msg_id: float, timed_out: bool):
+        """=== Method name: finish_in_flight ===========================================================================
+        Sends response (or timeout message) of an in-flight request, and frees its slot.
+        ========================================================================================== by Sziller ==="""
+        entry = self.in_flight.pop(msg_id, None)
+        if entry is None:  # already finished
+            return
+        envelope, wire_format, msg_hub_to_eng, future = entry
+        client_id = envelope[0].bytes
+        self.client_in_flight[client_id] -= 1
+        if not self.client_in_flight[client_id]:
+            del self.client_in_flight[client_id]
+        if timed_out:
+            self.correlator.forget(msg_id=msg_id)
+            lg.warning("timed out : no Engine response to message: {}".format(msg_id))
+            msg_eng_to_hub = msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
+                                                     message="timed out",
+                                                     timestamp=msg_id)
+        else:
+            msg_eng_to_hub = future.result()
+        self.send_router_response(envelope=envelope, msg_eng_to_hub=msg_eng_to_hub, wire_format=wire_format)
+
+    def send_router_response(self, envelope: list, msg_eng_to_hub: msg.ExternalResponseMsg, wire_format: str):
+        """=== Method name: send_router_response =======================================================================
+        Sends <msg_eng_to_hub> to the client identified by <envelope> over the ROUTER socket.
+        ========================================================================================== by Sziller ==="""
+        self.send_response(envelope=envelope, msg_eng_to_hub=msg_eng_to_hub, wire_format=wire_format)
+
+    def handle_synced_message(self, msg_hub_to_eng, response_future: Future or None = None):
         """=== Method name: handle_synced_message ======================================================================
         Handles synchronized messages by waiting for a response from the engine.
-        Method processes a synchronized message by putting it into the engine queue and waiting for a response.
-        It waits for a specified timeout period, continuously checking the engine queue for a response with a matching
-        timestamp. If a matching response is found within the timeout period, it returns the response. If no matching
-        response is received before the timeout, it returns a timeout message.
+        Method blocks - without polling - on the Future registered for the message's timestamp at
+        <self.correlator>. Responses are routed into the Future by the correlator's reader thread, so a response
+        belonging to any other request can never be consumed (and lost) here.
+        If no matching response is received within hcdd["timeout"], a timeout message is returned, and a late
+        response is kept in the correlator's orphan store.
         :param msg_hub_to_eng: msg.InternalMsg - Message received from the router that requires synchronization.
+        :param response_future: Future - as returned by < self.correlator.register() >. Registered here if not entered.
         :returns: msg.ExternalResponseMsg - The response message from the engine or a timeout message.
         ========================================================================================= by Sziller ==="""
         # default message on timeout:
         msg_eng_to_hub = msg.ExternalResponseMsg(payload=msg_hub_to_eng.payload,
                                                  message="timed out",
                                                  timestamp=msg_hub_to_eng.timestamp)
-        timeout_at = time.time() + self.hcdd["timeout"]
-        resp_received = False
-        while (not resp_received) and (time.time() < timeout_at):  # checking until valid response of timed-out
-            if not self.queue_eng_to_hub.empty():  # if queue in not empty...
-                msg_read = self.queue_eng_to_hub.get()
-                if msg_read.timestamp == msg_hub_to_eng.timestamp:
-                    msg_eng_to_hub = msg_read
-                    resp_received = True
-            else:  # if queue empty
-                time.sleep(self.hcdd["cpu_delay"])  # Sleep to reduce CPU usage
+        if self.correlator is None:
+            lg.error("no queue  : no <queue_eng_to_hub> defined, synced message cannot be answered!")
+            return msg_eng_to_hub
+        if response_future is None:
+            response_future = self.correlator.register(msg_id=msg_hub_to_eng.timestamp)
+        try:
+            msg_eng_to_hub = response_future.result(timeout=self.hcdd["timeout"])
+        except FutureTimeoutError:
+            self.correlator.forget(msg_id=msg_hub_to_eng.timestamp)
+            lg.warning("timed out : no Engine response to message: {}".format(msg_hub_to_eng.timestamp))
         return msg_eng_to_hub
+
+
+class ResponseCorrelator:
+    """=== Class name: ResponseCorrelator ==============================================================================
+    Routes Engine responses to the requests waiting for them.
+    A dedicated reader thread blocks on <queue_eng_to_hub> and resolves the Future registered under the response's
+    timestamp (the message id). Responses nobody waits for (late replies to timed-out requests, or replies to
+    fire-and-forget requests) are kept in a bounded orphan store: oldest orphans are dropped first.
+    If a request registers after its response already arrived, it is resolved from the orphan store at once.
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self, queue_eng_to_hub: Queue, orphan_store_size: int = 256):
+        self.queue_eng_to_hub = queue_eng_to_hub
+        self.orphan_store_size: int     = orphan_store_size
+        self.pending: dict              = {}  # msg_id: Future
+        self.orphans: OrderedDict       = OrderedDict()  # msg_id: msg.ExternalResponseMsg
+        self.n_orphans_dropped: int     = 0
+        self._lock                      = threading.Lock()
+        self.reader = threading.Thread(target=self.read_responses, name="ResponseCorrelator", daemon=True)
+        self.reader.start()
+
+    def register(self, msg_id: float) -> Future:
+        """=== Method name: register ===================================================================================
+        Registers a request waiting for the response identified by <msg_id>.
+        :param msg_id: float - the timestamp of the request, shared by its response
+        :return: Future - resolved by the reader thread with the Engine response
+        ========================================================================================== by Sziller ==="""
+        future = Future()
+        with self._lock:
+            orphan = self.orphans.pop(msg_id, None)
+            if orphan is None:
+                self.pending[msg_id] = future
+        if orphan is not None:
+            lg.info("orphan    : response {} was already waiting in store".format(msg_id))
+            future.set_result(orphan)
+        return future
+
+    def forget(self, msg_id: float):
+        """=== Method name: forget =====================================================================================
+        Unregisters a request (e.g. on timeout). A response arriving later is stored as an orphan.
+        :param msg_id: float - the timestamp of the request
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            self.pending.pop(msg_id, None)
+
+    def read_responses(self):
+        """=== Method name: read_responses =============================================================================
+        Reader thread's loop: blocks on <self.queue_eng_to_hub> and routes every response by its timestamp.
+        ========================================================================================== by Sziller ==="""
+        while True:
+            try:  # ATTENTION: line interrupts program flow!
+                msg_eng_to_hub = self.queue_eng_to_hub.get()
+            except (EOFError, OSError) as e:  # queue closed: no more responses can ever arrive
+                lg.error("Engine response queue closed - reader stops:\n {}".format(e))
+                return
+            except Exception as e:
+                lg.error("Error reading Engine response from queue:\n {}".format(e))
+                continue
+            self.route(msg_eng_to_hub=msg_eng_to_hub)
+
+    def route(self, msg_eng_to_hub: msg.ExternalResponseMsg):
+        """=== Method name: route ======================================================================================
+        Resolves the Future waiting for <msg_eng_to_hub>, or stores the message as orphan.
+        :param msg_eng_to_hub: msg.ExternalResponseMsg - response received from the Engine
+        ========================================================================================== by Sziller ==="""
+        msg_id = msg_eng_to_hub.timestamp
+        with self._lock:
+            future = self.pending.pop(msg_id, None)
+            if future is None:
+                self.orphans[msg_id] = msg_eng_to_hub
+                self.orphans.move_to_end(msg_id)
+                while len(self.orphans) > self.orphan_store_size:
+                    self.orphans.popitem(last=False)
+                    self.n_orphans_dropped += 1
+        if future is None:
+            lg.debug("orphan    : no request waiting for response {} - stored".format(msg_id))
+        elif not future.done():
+            future.set_result(msg_eng_to_hub)
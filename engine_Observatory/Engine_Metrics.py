@@ -0,0 +1,56 @@
+"""=== Engine metrics ==========================================================
+Lightweight, dependency free runtime metrics for Engines.
+Engines run on small devices: metrics are kept in memory, updated in O(1) and read on demand
+(e.g. by a <GET_basic_config> style command), nothing is written to disk.
+============================================================== by Sziller ==="""
+
+import threading
+
+
+class LatencyMetric:
+    """=== Class name: LatencyMetric ===================================================================================
+    Collects latency samples (in seconds) of one kind of event.
+    Keeps count, last, min, max, mean and a log2 bucketed histogram in microseconds:
+    bucket <n> counts samples between 2**(n-1) and 2**n microseconds (bucket 0: below 1 us).
+    Instance is thread-safe, so it can be updated from worker threads as well.
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, name: str, n_buckets: int = 32):
+        self.name: str                  = name
+        self.n_buckets: int             = n_buckets
+        self.count: int                 = 0
+        self.total: float               = 0.0
+        self.last: float                = 0.0
+        self.min: float                 = 0.0
+        self.max: float                 = 0.0
+        self.histogram: list            = [0] * n_buckets
+        self._lock                      = threading.Lock()
+
+    def record(self, seconds: float):
+        """=== Method name: record =====================================================================================
+        Adds one sample to the metric.
+        :param seconds: float - measured latency in seconds
+        ========================================================================================== by Sziller ==="""
+        bucket = min(int(seconds * 1_000_000).bit_length(), self.n_buckets - 1)
+        with self._lock:
+            if not self.count or seconds < self.min:
+                self.min = seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.histogram[bucket] += 1
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        Returns actual state of the metric as a dictionary.
+        :return dict: parameter: args <- in current state
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            return {"name": self.name,
+                    "count": self.count,
+                    "last": self.last,
+                    "min": self.min,
+                    "max": self.max,
+                    "mean": self.total / self.count if self.count else 0.0,
+                    "histogram_us_log2": list(self.histogram)}
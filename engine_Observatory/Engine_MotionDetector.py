@@ -0,0 +1,270 @@
+"""=== Motion detector =========================================================
+Optical movement detection on the running camera stream.
+Frames are processed as they are captured - no files are read or written for detection:
+- every frame is downscaled by strided slicing, and converted to grayscale by one vectorized dot product
+- it is compared to a running-average background model: pixels differing more than <threshold> are moving
+- only pixels inside the region-of-interest mask count. A frame is "moving" if their ratio reaches <min_area>
+- the background adapts to slow changes (light, shadows) by <alpha> per frame
+All buffers are preallocated on the first frame: processing a frame allocates no memory.
+MotionWatch records events: full frames are persisted only around them - <pre_event_frames> before the first moving
+frame, and until <post_event_frames> quiet frames after the last one.
+Run this module to benchmark the detector on synthetic frames: python -m engine_Observatory.Engine_MotionDetector
+============================================================== by Sziller ==="""
+
+import time
+import logging
+import inspect
+import numpy as np
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)  # ITU-R BT.601 luma of RGB
+
+
+class MotionDetector:
+    """=== Class name: MotionDetector ==================================================================================
+    Frame differencing against a running background, on downscaled grayscale frames.
+    :param downscale: int - every <downscale>-th pixel of every <downscale>-th row is processed
+    :param threshold: float - min. difference of gray level (0-255) from background of a moving pixel
+    :param min_area: float - min. ratio of moving pixels within the ROI of a moving frame
+    :param alpha: float - learning rate of the background: weight of the current frame in the running average
+    :param roi: list - of rectangles (x0, y0, x1, y1) in fractions of frame width and height. None: whole frame
+    ============================================================================================== by Sziller ==="""
+    def __init__(self,
+                 downscale: int         = 4,
+                 threshold: float       = 25.0,
+                 min_area: float        = 0.005,
+                 alpha: float           = 0.05,
+                 roi: list or None      = None):
+        self.downscale: int             = downscale
+        self.threshold: float           = threshold
+        self.min_area: float            = min_area
+        self.alpha: float               = alpha
+        self.roi: list or None          = roi
+        self.shape: tuple               = ()  # of the downscaled gray frame
+        self.background                 = None
+        self.small                      = None  # downscaled RGB frame, as float
+        self.gray                       = None
+        self.delta                      = None
+        self.magnitude                  = None  # abs. value of <self.delta>
+        self.moving                     = None
+        self.roi_mask                   = None
+        self.n_roi_pixels: int          = 0
+        self.n_frames: int              = 0
+
+    def reset(self, gray_shape: tuple):
+        """Allocates buffers for downscaled frames of <gray_shape>. Background is learnt from the next frame"""
+        self.shape = gray_shape
+        self.small = np.empty(gray_shape + (3,), dtype=np.float32)
+        self.gray = np.empty(gray_shape, dtype=np.float32)
+        self.delta = np.empty(gray_shape, dtype=np.float32)
+        self.magnitude = np.empty(gray_shape, dtype=np.float32)
+        self.moving = np.empty(gray_shape, dtype=bool)
+        self.roi_mask = self.build_roi_mask(gray_shape=gray_shape, roi=self.roi)
+        self.n_roi_pixels = max(int(np.count_nonzero(self.roi_mask)), 1)
+        self.background = None
+        self.n_frames = 0
+
+    @staticmethod
+    def build_roi_mask(gray_shape: tuple, roi: list or None) -> np.ndarray:
+        """Returns a bool mask of <gray_shape>, True inside any rectangle of <roi> - everywhere if <roi> is None"""
+        if not roi:
+            return np.ones(gray_shape, dtype=bool)
+        height, width = gray_shape
+        mask = np.zeros(gray_shape, dtype=bool)
+        for x0, y0, x1, y1 in roi:
+            mask[int(y0 * height): int(np.ceil(y1 * height)), int(x0 * width): int(np.ceil(x1 * width))] = True
+        return mask
+
+    def to_gray(self, frame: np.ndarray) -> np.ndarray:
+        """Downscales <frame> (height, width, 3) and converts it to grayscale into < self.gray >"""
+        small = frame[::self.downscale, ::self.downscale]
+        if small.shape[:2] != self.shape:
+            self.reset(gray_shape=small.shape[:2])
+        np.copyto(self.small, small)  # strided uint8 view converted in place: matmul would copy it
+        np.matmul(self.small, GRAY_WEIGHTS, out=self.gray)
+        return self.gray
+
+    def update(self, frame: np.ndarray) -> float:
+        """=== Method name: update =====================================================================================
+        Processes the next frame of the stream, and updates the background.
+        :param frame: np.ndarray - RGB frame (height, width, 3) uint8
+        :return: float - ratio of moving pixels within the ROI. Compare to < self.min_area >, or see < is_moving() >
+        ========================================================================================== by Sziller ==="""
+        gray = self.to_gray(frame)
+        self.n_frames += 1
+        if self.background is None:
+            self.background = gray.copy()
+            return 0.0
+        np.subtract(gray, self.background, out=self.delta)
+        np.abs(self.delta, out=self.magnitude)  # <self.delta> keeps its sign: background moves by it
+        np.greater(self.magnitude, self.threshold, out=self.moving)
+        self.moving &= self.roi_mask
+        ratio = np.count_nonzero(self.moving) / self.n_roi_pixels
+        self.delta *= self.alpha
+        self.background += self.delta
+        return ratio
+
+    def is_moving(self, ratio: float) -> bool:
+        """True if <ratio> returned by < update() > means movement"""
+        return ratio >= self.min_area
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: settings and state of the detector
+        ========================================================================================== by Sziller ==="""
+        return {"downscale": self.downscale,
+                "threshold": self.threshold,
+                "min_area": self.min_area,
+                "alpha": self.alpha,
+                "roi": self.roi,
+                "shape": self.shape,
+                "n_frames": self.n_frames}
+
+
+class MotionWatch:
+    """=== Class name: MotionWatch =====================================================================================
+    Watches a camera stream with a MotionDetector, and persists full frames around motion events only.
+    The last <pre_event_frames> frames are kept in a ring of preallocated buffers: when motion starts, they are
+    handed to <frame_writer> together with the moving frames, and the frames until <post_event_frames> quiet frames
+    are seen. An event ends after those quiet frames.
+    :param detector: MotionDetector
+    :param frame_writer: FrameWriter - writes the persisted frames (see Engine_FrameWriter)
+    :param pre_event_frames: int - frames persisted before the first moving frame of an event
+    :param post_event_frames: int - quiet frames closing an event, persisted too
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 detector: MotionDetector,
+                 frame_writer,
+                 pre_event_frames: int      = 5,
+                 post_event_frames: int     = 10):
+        self.detector: MotionDetector   = detector
+        self.frame_writer               = frame_writer
+        self.pre_event_frames: int      = pre_event_frames
+        self.post_event_frames: int     = post_event_frames
+        self.ring                       = None  # of (pre_event_frames + 1) frames: the current one included
+        self.ring_timestamps: list      = []
+        self.n_ring_frames: int         = 0
+        self.event: dict or None        = None
+        self.n_quiet_frames: int        = 0
+        self.n_frames: int              = 0
+        self.n_events: int              = 0
+
+    def run(self, camera, duration: float, filename_prefix: str = "", cancel_event=None) -> list:
+        """=== Method name: run ========================================================================================
+        Captures and processes frames of <camera> for <duration> seconds. An event still open at the end is closed.
+        :param camera: CameraService
+        :param duration: float - seconds to watch
+        :param filename_prefix: str - prefix of the files persisted
+        :param cancel_event: threading.Event - if set, watching stops at the next frame
+        :return: list - of event dicts, see < feed() >
+        ========================================================================================== by Sziller ==="""
+        camera.start()  # does nothing if sensor is already running
+        if self.ring is None or self.ring.shape[1:] != tuple(camera.frame_shape):
+            self.ring = np.empty((self.pre_event_frames + 1,) + tuple(camera.frame_shape), dtype=np.uint8)
+            self.ring_timestamps = [0.0] * (self.pre_event_frames + 1)
+            self.n_ring_frames = 0
+        events = []
+        end_at = time.monotonic() + duration
+        while time.monotonic() < end_at and not (cancel_event is not None and cancel_event.is_set()):
+            slot = self.n_ring_frames % len(self.ring)
+            camera.capture_into(self.ring[slot])
+            event = self.feed(slot=slot, timestamp=time.time(), filename_prefix=filename_prefix)
+            if event is not None:
+                events.append(event)
+        if self.event is not None:
+            events.append(self.close_event())
+        return events
+
+    def feed(self, slot: int, timestamp: float, filename_prefix: str = "") -> dict or None:
+        """=== Method name: feed =======================================================================================
+        Processes the frame just captured into < self.ring[slot] >.
+        :return: dict or None - the event closed by this frame: start, end, peak ratio, n_frames, filenames
+        ========================================================================================== by Sziller ==="""
+        frame = self.ring[slot]
+        self.ring_timestamps[slot] = timestamp
+        self.n_ring_frames += 1
+        self.n_frames += 1
+        ratio = self.detector.update(frame)
+        if self.detector.is_moving(ratio):
+            if self.event is None:
+                self.open_event(timestamp=timestamp, filename_prefix=filename_prefix)
+            self.event["end"] = timestamp
+            self.event["peak"] = max(self.event["peak"], ratio)
+            self.n_quiet_frames = 0
+        elif self.event is not None:
+            self.n_quiet_frames += 1
+        if self.event is None:
+            return None
+        self.persist(frame=frame, timestamp=timestamp)
+        if self.n_quiet_frames >= self.post_event_frames:
+            return self.close_event()
+        return None
+
+    def open_event(self, timestamp: float, filename_prefix: str):
+        """Starts an event at <timestamp>, and persists the frames captured before the current one"""
+        self.n_events += 1
+        self.event = {"start": timestamp, "end": timestamp, "peak": 0.0, "n_frames": 0, "filenames": [],
+                      "prefix": "{}motion_{}".format(filename_prefix, self.n_events)}
+        self.n_quiet_frames = 0
+        n_previous = min(self.n_ring_frames - 1, self.pre_event_frames)
+        for nr in range(self.n_ring_frames - 1 - n_previous, self.n_ring_frames - 1):
+            slot = nr % len(self.ring)
+            self.persist(frame=self.ring[slot], timestamp=self.ring_timestamps[slot])
+        lg.info("motion    : event {} started - says {}".format(self.n_events, self.ccn))
+
+    def persist(self, frame: np.ndarray, timestamp: float):
+        """Copies <frame> into a buffer of the writer, and queues it to be written as part of the current event"""
+        filename = "{}_{}_{:.3f}.jpg".format(self.event["prefix"], self.event["n_frames"], timestamp)
+        buffer = self.frame_writer.acquire_buffer(shape=frame.shape)
+        np.copyto(buffer, frame)
+        self.frame_writer.submit(buffer=buffer, filename=filename)
+        self.event["filenames"].append(filename)
+        self.event["n_frames"] += 1
+
+    def close_event(self) -> dict:
+        """Closes and returns the current event"""
+        event, self.event = self.event, None
+        del event["prefix"]
+        lg.info("motion    : event ended: {:.3f} - {:.3f}, peak {:.3f}, {} frames - says {}".format(
+            event["start"], event["end"], event["peak"], event["n_frames"], self.ccn))
+        return event
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: counters of the watch
+        ========================================================================================== by Sziller ==="""
+        return {"detector": self.detector.as_dict(),
+                "pre_event_frames": self.pre_event_frames,
+                "post_event_frames": self.post_event_frames,
+                "n_frames": self.n_frames,
+                "n_events": self.n_events,
+                "in_event": self.event is not None}
+
+
+def benchmark(n_frames: int = 300, size: tuple = (1280, 960)):
+    """=== Function name: benchmark ====================================================================================
+    Frames per second of < MotionDetector.update() > on <size> synthetic frames with a moving square, and the
+    frames detected moving.
+    ============================================================================================== by Sziller ==="""
+    from engine_Observatory.Engine_Camera import SyntheticBackend
+    backend = SyntheticBackend(size=size, fps=1e9, pattern="moving_square", motion_period=50)
+    backend.start()
+    frames = [backend.generate_frame(frame_nr=_) for _ in range(100)]
+    for downscale in (1, 2, 4, 8):
+        detector = MotionDetector(downscale=downscale)
+        n_moving = 0
+        t0 = time.perf_counter()
+        for nr in range(n_frames):
+            n_moving += detector.is_moving(detector.update(frames[nr % len(frames)]))
+        elapsed = time.perf_counter() - t0
+        print("{}x{} downscale {}: {:>8.1f} frames/s  {:>6.2f} ms/frame  moving: {}/{}".format(
+            size[0], size[1], downscale, n_frames / elapsed, 1000 * elapsed / n_frames, n_moving, n_frames))
+
+
+if __name__ == "__main__":
+    benchmark()
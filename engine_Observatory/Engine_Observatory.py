@@ -4,16 +4,39 @@ background, responsible for business logic and complex tasks
 ============================================================== by Sziller ==="""
 
 import os
-from picamera2 import Picamera2
 import inspect
 import time
+import queue
+import threading
+from collections import OrderedDict
 from multiprocessing import Queue
 
 from dotenv import load_dotenv
 import logging
 
+from shmc_messages import msg
+from shmc_messages import codec
 from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlAccess.SQL_outbox import Outbox
+from shmc_sqlAccess.SQL_groupCommit import GroupCommitWriter
+from shmc_sqlAccess import SQL_rollup as SQLr
+from shmc_sqlAccess.SQL_archive import MeasurementArchive
+from shmc_sqlAccess.SQL_archive import ARCHIVE_measurements
 from shmc_sqlBases.sql_baseMeasurement import Measurement as sqlMeasurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+from shmc_sqlBases.sql_baseMeasurement import MEASUREMENT_COLUMNS
+from engine_Observatory.Engine_Metrics import LatencyMetric
+from engine_Observatory.Engine_Camera import CameraService
+from engine_Observatory.Engine_FrameWriter import FrameWriter
+from engine_Observatory.Engine_MotionDetector import MotionDetector
+from engine_Observatory.Engine_MotionDetector import MotionWatch
+from engine_Observatory.Engine_Scheduler import Scheduler
+from engine_Observatory.Engine_Scheduler import ScheduledJob
+from engine_Observatory.Engine_SensorIngest import SensorIngest
+from engine_Observatory.Engine_MeasurementCache import LatestValueCache
+from engine_Observatory.Engine_CommandExecutor import CommandExecutor
+from engine_Observatory.Engine_CommandRegistry import CommandRegistry
+from engine_Observatory.Engine_CommandRegistry import CommandError
 
 # LOGGING                                                                                   logging - START -
 lg = logging.getLogger()
@@ -27,6 +50,7 @@ class EngineObservatory:
     An object to be instantiated to controll the Observatory.
     This is an Engine responsible for tasks such as:
     - taking pictures
+    - optical movement detection
     ============================================================================================== by Sziller ==="""
     ccn = inspect.currentframe().f_code.co_name  # current class name
     
@@ -49,6 +73,79 @@ class EngineObservatory:
         # NOTE: this data CANNOT be modified at runtime.
         self.hcdd_default = {
             "heartbeat": 0.1,
+            "dispatch_mode": "event",  # "event": block on queue - "heartbeat": poll queue every <heartbeat> sec
+            "idle_timeout": 60.0,  # max. blocking time on queue if no scheduled job is due earlier
+            "camera_backend": "picamera2",  # "picamera2" or "synthetic" - see Engine_Camera.BACKENDS
+            "camera_kwargs": {},  # passed to camera backend, e.g. size, fps
+            "camera_settle_time": 2.0,  # sec. to let exposure settle - once, when sensor is started
+            "camera_warm_start": True,  # start sensor on Engine init, not on first capture
+            "photo_dir": "./",  # directory photos are written into
+            "photo_interval": 0.0,  # extra sec. between two photos of a loop - 0: as fast as the sensor streams
+            "writer_workers": 2,  # threads encoding and writing photos
+            "writer_queue_size": 8,  # max. photos waiting to be written
+            "writer_policy": "block",  # queue full: "block" capturing, or "drop_oldest" waiting photo
+            "motion_watch_duration": 60.0,  # sec. a GET_motion_watch request watches the stream for
+            "motion_downscale": 4,  # detection runs on every n-th pixel of every n-th row
+            "motion_threshold": 25.0,  # min. gray level difference (0-255) of a moving pixel
+            "motion_min_area": 0.005,  # min. ratio of moving pixels (within ROI) of a moving frame
+            "motion_alpha": 0.05,  # learning rate of the background model
+            "motion_roi": None,  # list of (x0, y0, x1, y1) rectangles, in fractions of frame size - None: all
+            "motion_pre_frames": 5,  # frames persisted before motion starts
+            "motion_post_frames": 10,  # quiet frames closing an event - persisted as well
+            "executor_threads": 4,  # worker threads running long commands
+            "executor_processes": 0,  # process pool encoding GET_full_db_data pages - 0: none, encoded on the lane
+            "executor_job_store_size": 256,  # finished jobs kept for GET_job_status
+            "executor_lanes": {"camera": 1, "db": 2, "network": 1},  # lane: max. jobs running at once
+            "db_pool_timeout": 10.0,  # sec. a thread waits for a free DB connection before failing
+            "group_commit": True,  # measurements of every thread are stored by one writer, one transaction per window
+            "group_commit_delay": 0.2,  # max. sec. a measurement waits for its commit
+            "group_commit_max_rows": 5000,  # a window is committed at once when it holds this many rows
+            "sensors": [],  # driver definitions, e.g. {"driver": "simulated", "mea_type": "temperature",
+            #                                     "mea_loc": "obsr", "mea_dim": "C", "interval": 1.0}
+            "sensor_ring_size": 10000,  # max. readings buffered - oldest dropped if the DB cannot keep up
+            "sensor_flush_rows": 500,  # readings are stored once this many are buffered...
+            "sensor_flush_age": 5.0,  # ...or the oldest one is buffered for this many sec.
+            "cache_depth": 120,  # latest readings cached per sensor (mea_loc, mea_type)
+            "cache_max_series": 256,  # sensors cached - least recently used dropped first
+            "cache_ttl": 3600.0,  # sec. a reading is served from the cache for
+            "outbox_enabled": True,  # keep measurements and results for upload, while the server is away
+            "outbox_db": "",  # DB file of the outbox - "": .<room_id>_outbox.db
+            "outbox_max_entries": 100000,  # outbox size cap, in entries...
+            "outbox_max_bytes": 64 * 1024 * 1024,  # ...and in bytes of payload
+            "outbox_eviction": "drop_oldest",  # outbox full: "drop_oldest" entries, or "reject_new" ones
+            "outbox_pull_entries": 500,  # max. entries per GET_outbox_pull, if the request does not set it
+            "outbox_pull_bytes": 1024 * 1024,  # max. bytes of payload per GET_outbox_pull
+            "outbox_result_commands": ["GET_photo", "GET_motion_watch"],  # results of these are put into the outbox
+            "rollup_max_buckets": 1000,  # GET_rollups picks the finest level returning at most this many buckets
+            "rollup_backfill_every": 10.0,  # sec. between runs rolling up measurements of a former version's DB
+            "rollup_backfill_chunk_rows": 5000,  # raw rows rolled up per transaction
+            "rollup_backfill_chunks": 20,  # transactions per run - the "db" lane is not held for long
+            "retention_every": 3600.0,  # sec. between retention runs - 0: never
+            "retention_horizons": {"raw": None,  # sec. data is kept for, by level - None: forever. Set "raw" to
+                                                 # delete measurements: only their rollups are kept then
+                                   "minute": 90 * 86400,
+                                   "hour": 2 * 365 * 86400,
+                                   "day": None},
+            "retention_chunk_rows": 2000,  # rows deleted per transaction
+            "retention_pause": 0.05,  # sec. between two deleting transactions: writers get the DB
+            "archive_enabled": False,  # move old measurements out of the DB into columnar archive files, on every
+                                       # retention run. Archived rows are not exported by GET_full_db_data
+            "archive_dir": "",  # directory of the archive - "": ./.<room_id>_archive/
+            "archive_after": 7 * 86400,  # sec. measurements are kept in the DB for, before they are archived
+            "archive_compress": False,  # True: compressed archive files - smaller, but not memory mapped when read
+            "export_page_size": 5000,  # rows per GET_full_db_data page, if the request does not set it
+            "export_max_page_size": 50000,  # upper limit of a requested page size
+            "export_compress_level": 6,  # zlib level of exported pages, 0-9
+            "export_hwm_lag": 600.0,  # sec. a row may be committed after its timestamp, and still be exported by syncs
+            "executor_commands": {"GET_photo": "camera",  # command: lane - commands not listed run inline
+                                  "GET_motion_watch": "camera",
+                                  "GET_full_db_data": "db",
+                                  "GET_outbox_pull": "db",
+                                  "GET_rollups": "db",
+                                  "GET_retention": "db",
+                                  "GET_archive": "db",
+                                  "GET_rollup_backfill": "db",
+                                  "GET_send_message": "network"},
             "delta_t_h": 0,
             "delta_t_m": 0,  # TB-R: _dict is appropriate name
             "err_msg_path": "./"}
@@ -56,6 +153,7 @@ class EngineObservatory:
             self.hcdd_default.update(hcdd)  # updated the INSTANCE stored default!!!
         self.hcdd = self.hcdd_default
         self.queue_hub_to_eng = queue_hub_to_eng
+        self.queue_eng_to_hub = queue_eng_to_hub
         
         self.actual_request                 = None
         
@@ -67,121 +165,497 @@ class EngineObservatory:
             self.session_name = '.' + self.room_id + '.db'
         else: self.session_name = session_name
         self.session_style = session_style
+        self.db_tables: list = [sqlMeasurement.__table__] + SQLr.ROLLUP_TABLES
+        self.db_pool_kwargs: dict = self.size_db_pool()
         self.session = SQLi.createSession(db_fullname=self.session_name,
-                                          tables=[sqlMeasurement.__table__],
-                                          style=self.session_style)
+                                          tables=self.db_tables,
+                                          style=self.session_style,
+                                          pool_kwargs=self.db_pool_kwargs)
+        self._db_local = threading.local()  # one session per thread: commands run on executor threads, too
+        self._db_local.session = self.session
+        self.rollup_backfill: dict = SQLr.PREPARE_backfill(row_obj=sqlMeasurement, session=self.session)
+        self.writer = GroupCommitWriter(db_fullname=self.session_name,
+                                        tables=self.db_tables,
+                                        style=self.session_style,
+                                        profile=None,  # same engine as <self.session>: no profile of its own
+                                        max_delay=self.hcdd["group_commit_delay"],
+                                        max_batch_rows=self.hcdd["group_commit_max_rows"],
+                                        pool_kwargs=self.db_pool_kwargs,
+                                        before_commit=self.rollup_added) if self.hcdd["group_commit"] else None
         if not time_shift:
             self.time_shift = {'delta_t_h': -1, 'delta_t_m': 0}
         else:
             self.time_shift = time_shift
         self.schedule = schedule
+        self.scheduler = Scheduler(jobs=self.schedule, time_shift=self.time_shift)
+        if self.hcdd["retention_every"]:
+            self.scheduler.add_job(ScheduledJob(command="GET_retention", every=self.hcdd["retention_every"],
+                                                name="retention"))
+        self.backfill_job: ScheduledJob or None = None
+        if not self.rollup_backfill["finished_at"]:  # DB of a former version: measurements not rolled up yet
+            self.backfill_job = ScheduledJob(command="GET_rollup_backfill", every=self.hcdd["rollup_backfill_every"],
+                                             name="rollup backfill")
+            self.scheduler.add_job(self.backfill_job)
+            lg.info("rollups   : stored measurements up to rowid {} are rolled up in the background, from {} "
+                    "- says {}".format(self.rollup_backfill["last_rowid"], self.rollup_backfill["cursor"], self.ccn))
 
         self.took_n_queued_last_loop: int        = 0
+        self.metric_wake_to_dispatch = LatencyMetric(name="wake_to_dispatch")
+        self.camera = CameraService(backend=self.hcdd["camera_backend"],
+                                    settle_time=self.hcdd["camera_settle_time"],
+                                    backend_kwargs=self.hcdd["camera_kwargs"],
+                                    rotation=self.rotation)
+        if self.hcdd["camera_warm_start"]:
+            try:
+                self.camera.start()
+            except Exception as e:  # Engine must run without camera, too: sensor is retried on first capture
+                lg.critical("camera    : could not be started on init: {} - says {}".format(e, self.ccn))
+        self.frame_writer = FrameWriter(save_frame=self.camera.save_frame,
+                                        output_dir=self.hcdd["photo_dir"],
+                                        n_workers=self.hcdd["writer_workers"],
+                                        queue_size=self.hcdd["writer_queue_size"],
+                                        policy=self.hcdd["writer_policy"])
+        self.motion_watch = MotionWatch(detector=MotionDetector(downscale=self.hcdd["motion_downscale"],
+                                                                threshold=self.hcdd["motion_threshold"],
+                                                                min_area=self.hcdd["motion_min_area"],
+                                                                alpha=self.hcdd["motion_alpha"],
+                                                                roi=self.hcdd["motion_roi"]),
+                                        frame_writer=self.frame_writer,
+                                        pre_event_frames=self.hcdd["motion_pre_frames"],
+                                        post_event_frames=self.hcdd["motion_post_frames"])
+        self.executor = CommandExecutor(n_threads=self.hcdd["executor_threads"],
+                                        lanes=self.hcdd["executor_lanes"],
+                                        n_processes=self.hcdd["executor_processes"],
+                                        job_store_size=self.hcdd["executor_job_store_size"])
+        self.latest_cache = LatestValueCache(depth=self.hcdd["cache_depth"],
+                                             max_series=self.hcdd["cache_max_series"],
+                                             ttl=self.hcdd["cache_ttl"])
+        self.archive = None
+        if self.hcdd["archive_enabled"]:
+            self.archive = MeasurementArchive(root=self.hcdd["archive_dir"] or '.' + self.room_id + '_archive',
+                                              compress=self.hcdd["archive_compress"])
+        self.outbox = Outbox(db_fullname=self.hcdd["outbox_db"] or '.' + self.room_id + '_outbox.db',
+                             max_entries=self.hcdd["outbox_max_entries"],
+                             max_bytes=self.hcdd["outbox_max_bytes"],
+                             eviction=self.hcdd["outbox_eviction"]) if self.hcdd["outbox_enabled"] else None
+        self.sensor_ingest = SensorIngest(drivers=self.hcdd["sensors"],
+                                          store=self.store_measurements,
+                                          ring_size=self.hcdd["sensor_ring_size"],
+                                          flush_rows=self.hcdd["sensor_flush_rows"],
+                                          flush_age=self.hcdd["sensor_flush_age"])
+        if self.sensor_ingest.drivers:
+            self.sensor_ingest.start()
+        self.commands: CommandRegistry = self.register_commands()
+        self.in_flight_jobs: dict = {}  # coalescing key: (CommandJob, list of (request, on_finished) waiting)
+        self.n_coalesced: int = 0  # requests answered by the execution of an identical request
+        self._in_flight_lock = threading.Lock()
         self.go()
 
+    def register_commands(self) -> CommandRegistry:
+        """=== Method name: register_commands ==========================================================================
+        Builds the dispatch table: only commands registered here can be requested. Payload schemas - see
+        Engine_CommandRegistry - are checked before any handler runs. Lanes are taken from hcdd["executor_commands"].
+        :return: CommandRegistry
+        ========================================================================================== by Sziller ==="""
+        job_id_schema = {"job_id": {"type": (int, float), "required": True}}
+        latest_schema = {"mea_loc": {"type": str, "required": True},
+                         "mea_type": {"type": str, "required": True},
+                         "n": {"type": int, "default": 1},
+                         "window": {"type": (int, float), "default": None}}
+        rollups_schema = {"t_from": {"type": (int, float), "required": True},
+                          "t_to": {"type": (int, float), "default": None},
+                          "mea_loc": {"type": str, "default": None},
+                          "mea_type": {"type": str, "default": None},
+                          "level": {"type": str, "default": None}}
+        outbox_schema = {"ack": {"type": int, "default": None},
+                         "max_entries": {"type": int, "default": None}}
+        export_schema = {"since": {"type": (int, float), "default": None},
+                         "after": {"type": (list, tuple), "default": None},
+                         "page_size": {"type": int, "default": None}}
+        registry = CommandRegistry()
+        for name, schema, scalar_field, coalesce in (
+                ("GET_photo",           None,                                                   None,       True),
+                ("GET_motion_watch",    {"duration": {"type": (int, float), "default": None}},  None,       True),
+                ("GET_job_status",      job_id_schema,                                          "job_id",   True),
+                ("GET_cancel_job",      job_id_schema,                                          "job_id",   True),
+                ("GET_send_message",    None,                                                   None,       False),
+                ("GET_full_db_data",    export_schema,                                          None,       True),
+                ("GET_latest",          latest_schema,                                          None,       True),
+                ("GET_rollups",         rollups_schema,                                         None,       True),
+                ("GET_retention",       None,                                                   None,       True),
+                ("GET_archive",         None,                                                   None,       True),
+                ("GET_rollup_backfill", None,                                                   None,       True),
+                ("GET_outbox_pull",     outbox_schema,                                          None,       True),
+                ("GET_basic_config",    None,                                                   None,       True)):
+            registry.register(name=name, handler=getattr(self, name), schema=schema, scalar_field=scalar_field,
+                              lane=self.hcdd["executor_commands"].get(name), coalesce=coalesce)
+        return registry
+
     def go(self):
         """=== Method name: go =========================================================================================
+        Main loop of the Engine. Depending on hcdd["dispatch_mode"]:
+        - "event"    : loop blocks on incoming queue and wakes up only if there is a request to be processed, or if
+                       the next scheduled job is due. See: go_event_driven()
+        - "heartbeat": legacy polling loop, checking queue every hcdd["heartbeat"] seconds.
         ========================================================================================== by Sziller ==="""
         lg.info("loop start: go() - says {} at {}".format(self.ccn, os.path.basename(__file__)))
+        if self.hcdd["dispatch_mode"] == "event":
+            self.go_event_driven()
+        else:
+            self.go_heartbeat()
+
+    def go_event_driven(self):
+        """=== Method name: go_event_driven ============================================================================
+        Event driven main loop. No fixed heartbeat: the loop blocks on <self.queue_hub_to_eng> until either a
+        request arrives, or the next scheduled job is due. Once woken up, every pending request is drained and
+        processed in one pass - identical requests of the batch are executed once. Wake-to-dispatch latency of each
+        request is stored in <self.metric_wake_to_dispatch>.
+        ========================================================================================== by Sziller ==="""
+        while True:
+            self.run_due_jobs()
+            try:  # ATTENTION: line interrupts program flow until a request arrives or timeout is reached!
+                first_request = self.queue_hub_to_eng.get(timeout=self.seconds_to_next_job())
+            except queue.Empty:
+                continue  # nothing arrived: time to check scheduled jobs, start over at --> "while True"
+            woken_at = time.perf_counter()
+            requests = [first_request] + self.drain_queue_in()
+            self.took_n_queued_last_loop = len(requests)
+            lg.info("QUEUE--in - <self.queue_hub_to_eng>: go_event_driven() drained {:>3} object."
+                    .format(len(requests)))
+            self.process_requests(requests=requests, woken_at=woken_at)
+
+    def seconds_to_next_job(self) -> float:
+        """=== Method name: seconds_to_next_job ========================================================================
+        Returns the time in seconds the main loop may block on the incoming queue: until the next scheduled job is
+        due, but hcdd["idle_timeout"] at most.
+        :return: float - seconds to block at most
+        ========================================================================================== by Sziller ==="""
+        seconds = self.scheduler.seconds_to_next_job()
+        if seconds is None:
+            return self.hcdd["idle_timeout"]
+        return min(seconds, self.hcdd["idle_timeout"])
+
+    def run_due_jobs(self):
+        """=== Method name: run_due_jobs ===============================================================================
+        Runs every scheduled job due now, as fire-and-forget requests of their command. See Engine_Scheduler.
+        ========================================================================================== by Sziller ==="""
+        for job in self.scheduler.due_jobs():
+            lg.info("schedule  : running {}".format(job.name))
+            self.actual_request = msg.InternalMsg(payload=job.kwargs, timestamp=time.time(), synced=False,
+                                                  command=job.command)
+            try:  # job is marked finished by <on_finished> - exactly once, even if processing fails
+                self.process_actual_request(on_finished=lambda job=job: self.scheduler.job_finished(job))
+            except Exception as e:  # a failing job must not stop the Engine: it is retried on its next fire
+                lg.error("schedule  : {} failed: {} - says {}".format(job.name, e, self.ccn))
+                self.actual_request = None
+
+    def drain_queue_in(self) -> list:
+        """=== Method name: drain_queue_in =============================================================================
+        Takes every object currently waiting in <self.queue_hub_to_eng> without blocking.
+        :return: list - of the requests popped, in order of arrival.
+        ========================================================================================== by Sziller ==="""
+        drained = []
+        while True:
+            try:
+                drained.append(self.queue_hub_to_eng.get_nowait())
+            except queue.Empty:
+                return drained
+
+    def go_heartbeat(self):
+        """=== Method name: go_heartbeat ===============================================================================
+        Legacy polling main loop: requests waiting are drained and processed once per heartbeat.
+        ========================================================================================== by Sziller ==="""
         self.took_n_queued_last_loop = 0
         while True:
             # check and empty directcall containing queue                               - START -
-            self.pop_last_entry_from_queue_in()  # Engine pops last object put into Queue.
-            if self.took_n_queued_last_loop:
-                self.process_actual_request()
+            requests = self.drain_queue_in()
+            self.took_n_queued_last_loop = len(requests)
+            if requests:
+                self.process_requests(requests=requests)
             # check and empty directcall containing queue                               - ENDED -
+            self.run_due_jobs()
             time.sleep(self.hcdd["heartbeat"])
             
-    def pop_last_entry_from_queue_in(self):
-        """=== Method name: pop_last_entry_from_queue_in =========================================
-        Suggesting self.queue_hub_to_eng to include data, method takes last member.
-        Last member is:
-        - stored under self.actual_request
-        - deleted from queue_in
-        If self.queue_hub_to_eng is empty on call, nothig happens, method passes.
-        ___________ (by Instance we refer to the Instance of THIS very Class: DareEngine) ________________________________
-        :var self.actual_request - dict      : the dict storing the actual <directcall> - updatable loop by loop.
-                                                  This variable might be MODIFIED
-        :var self.queue_hub_to_eng - queue  : queue to pass data TO Instance. (from whatever source e.g.: UI
-                                                  This variable is READ (checked)
-        :return nothing
-        """
-        cmn = inspect.currentframe().f_code.co_name  # current method name
-        self.took_n_queued_last_loop = 0
-        if not self.queue_hub_to_eng.empty():  # only if Queue is not empty... having at least 1 element.
-            lg.info("QUEUE--in - <self.queue_hub_to_eng>: {} sees   {:>3} object.".format(cmn, self.queue_hub_to_eng.qsize()))
-            lg.info("QUEUE--in - <self.queue_hub_to_eng>: {} POPPING...".format(cmn))
-            self.actual_request = self.queue_hub_to_eng.get()  # <self.actual_request> takes first incoming obj
-            lg.info("QUEUE--in - <self.queue_hub_to_eng>: {} popped {:>3} object.".format(cmn, 1))
-            lg.info("QUEUE--in - <self.queue_hub_to_eng>: {} sees   {:>3} object.".format(cmn, self.queue_hub_to_eng.qsize()))
-            self.took_n_queued_last_loop = 1
-        pass
-
-    def process_actual_request(self):
+    def process_actual_request(self, on_finished=None):
         """=== Method name: process_actual_request =====================================================================
-        Method is responsible for all non-scheduled processes to be run.
+        Method is responsible for all non-scheduled processes to be run: processes <self.actual_request>.
+        See < process_requests() >.
+        :param on_finished: callable() - called once the command's run is over, inline or on the executor
         ========================================================================================== by Sziller ==="""
-        cmn = inspect.currentframe().f_code.co_name  # current method name
-        if self.actual_request is not None:
-            command = self.actual_request.command
-            id_timestamp = self.actual_request.timestamp
-            lg.info("Framework : {} - executing process:".format(cmn))
-            lg.info("COMMAND   : {:>76} <<<".format(command))
-            for k, v in self.actual_request.as_dict().items():
-                lg.debug("{:>10}: {}".format(k, v))
-            lg.info("Timestamp of   REQUEST: {:>60}".format(id_timestamp))
-            actual_command = getattr(self, command)
-            actual_command(**self.actual_request.as_dict())
-            # self.actual_response = None
-            # self.actual_response = msg.EngineToHub(timestamp=id_timestamp, payload={}, message="")  # message must be ""
-            # actual_process_data = self.command_assignment.get(command)
-            # if actual_process_data is not None:
-            #     actual_processcall = actual_process_data["method"]
-            #     actual_kwargs = self.command_assignment[command]["kw"]
-                # ------------------------------------------------------------------------------------------
-                # - to be revised ...                                                       ERROR HANDLING -
-                # ------------------------------------------------------------------------------------------
-                # try:
-                #     successfull_run: bool = actual_processcall(**actual_kwargs)
-                # except:
-                #     error_code = 102
-                #     fill_in = {"err": error_code, "cmd": command, "adm": cmn, "fn": FN}
-                #     lg.critical("FAILED actual processcall! - {err:>3}".format(**fill_in))
-                #     self.actual_response.payload = "ERR {err:>3}".format(**fill_in)
-                #     self.actual_response.message = ERROR[error_code][LNG].format(**fill_in)
-                # ------------------------------------------------------------------------------------------
-                # - to be revised ...                                                       ERROR HANDLING -
-                # ------------------------------------------------------------------------------------------
-            # else:
-            #     error_code = 101
-            #     fill_in = {"err": error_code, "cmd": command, "adm": cmn, "fn": FN,
-            #                "data01": self.actual_response.timestamp}
-            #     lg.warning("{data01} received unknown command: '{cmd}'! - {err:>3}".format(**fill_in))
-            #     self.actual_response.payload = "ERR {err:>3}".format(**fill_in)
-            #     self.actual_response.message = ERROR[error_code][LNG].format(**fill_in)
-            # lg.info("QUEUE-out - <self.queue_response>: {} sees {:>3} object.".format(cmn, self.queue_response.qsize()))
-            # lg.info("QUEUE-out - <self.queue_response>: {} PUTTING...".format(cmn))
-            # self.queue_response.put(self.actual_response)
-            # lg.info("QUEUE-out - <self.queue_response>: {} put  {:>3} object.".format(cmn, 1))
-            # lg.info("QUEUE-out - <self.queue_response>: {} sees {:>3} object.".format(cmn, self.queue_response.qsize()))
-            # 
-            # lg.info("Timestamp as RESPONDED: {:>60}".format(self.actual_response.timestamp))
-        else:
+        request, self.actual_request = self.actual_request, None
+        if request is None:
             lg.critical("bad logic : no request detected, still in processing mode! - says {} at {}"
                         .format(self.ccn, os.path.basename(__file__)))
-        # And tha most important line in the entire UNIVERSE:
-        # FCKNG crucial - you don't do that, Engine will repeat task in current second as amy times it can!!!!
-        # self.actual_response = None
-        self.actual_request = None
+            if on_finished is not None:
+                on_finished()
+            return
+        self.process_requests(requests=[request], on_finished=on_finished)
+
+    def process_requests(self, requests: list, on_finished=None, woken_at: float or None = None):
+        """=== Method name: process_requests ===========================================================================
+        Processes a batch of requests, in order of arrival.
+        Every request is resolved by <self.commands> first: an unknown command, or a malformed payload is answered
+        with an error at once - no handler runs, and the loop goes on.
+        Identical requests - same command, same arguments - are coalesced: they share one execution, and its result
+        is sent to each of them by its own timestamp. Identical requests of the batch are grouped, and a request
+        identical to an executor job still running joins that job. Commands registered with coalesce=False (e.g.
+        ones with side effects per request) always run on their own.
+        Commands of an executor lane (hcdd["executor_commands"]) are handed to <self.executor> and run on a worker
+        thread: the response is sent when the job finishes. Other commands run inline. Fire-and-forget runs are
+        stored as jobs either way: they can be polled by GET_job_status.
+        Duration of every run is recorded in its command's latency metric. Wake-to-dispatch latency is recorded for
+        every request of the batch once all of them are resolved - before any runs: it never includes the run of an
+        inline command of the batch.
+        :param requests: list - of msg.InternalMsg-s
+        :param on_finished: callable() - called exactly once: when the run of the batch's first request is over - at
+                            once, if that request is rejected - or when processing of the batch fails
+        :param woken_at: float - perf_counter time the loop woke up at, for <self.metric_wake_to_dispatch>
+        ========================================================================================== by Sziller ==="""
+        groups = OrderedDict()  # coalescing key: (CommandSpec, arguments, list of requests)
+        leader_key = None  # key of the group of the batch's first request - None: it is rejected
+        handed_over = False  # True: <on_finished> is called by the executor job of the first request
+        try:
+            for request in requests:
+                lg.info("COMMAND   : {:>40} - REQUEST timestamp: {}".format(str(request.command), request.timestamp))
+                try:
+                    spec, args = self.commands.resolve(command=request.command, payload=request.payload)
+                except CommandError as e:
+                    lg.warning("rejected  : {} - says {}".format(e, self.ccn))
+                    self.finish_request(request=request, result=None, error=str(e))
+                    continue
+                key = (request.command, self.arguments_key(args)) if spec.coalesce else ("job", request.timestamp)
+                groups.setdefault(key, (spec, args, []))[2].append(request)
+                if request is requests[0]:
+                    leader_key = key
+            if woken_at is not None:
+                dispatched_at = time.perf_counter()
+                for _ in requests:
+                    self.metric_wake_to_dispatch.record(dispatched_at - woken_at)
+            for key, (spec, args, group) in groups.items():
+                self.n_coalesced += len(group) - 1
+                if spec.lane is None:
+                    self.run_inline(spec=spec, args=args, requests=group)
+                elif key == leader_key and on_finished is not None:
+                    self.submit_to_executor(key=key, spec=spec, args=args, requests=group, on_finished=on_finished)
+                    handed_over = True  # once returned, <on_finished> is called by the job - or has been on rejection
+                else:
+                    self.submit_to_executor(key=key, spec=spec, args=args, requests=group)
+        finally:
+            if on_finished is not None and not handed_over:
+                on_finished()
+
+    @staticmethod
+    def arguments_key(args: dict) -> tuple:
+        """Returns a hashable key of validated <args>: equal for identical arguments"""
+        return tuple(sorted((key, repr(value)) for key, value in args.items()))
+
+    def run_inline(self, spec, args: dict, requests: list):
+        """=== Method name: run_inline =================================================================================
+        Runs the command of <spec> once, on the Engine's loop, and answers every request of <requests> by its result.
+        ========================================================================================== by Sziller ==="""
+        leader = requests[0]
+        started_at = time.perf_counter()
+        try:
+            result, error = spec.handler(payload=args, timestamp=leader.timestamp, synced=leader.synced,
+                                         command=leader.command), ""
+        except Exception as e:  # a failing command must not stop the Engine
+            result, error = None, "{}: {}".format(type(e).__name__, e)
+            lg.error("failed    : {} - {} - says {}".format(leader.command, error, self.ccn))
+        spec.metric.record(time.perf_counter() - started_at)
+        self.outbox_result(command=leader.command, job_id=leader.timestamp, result=result, error=error)
+        for request in requests:
+            self.finish_request(request=request, result=result, error=error)
+
+    def submit_to_executor(self, key: tuple, spec, args: dict, requests: list, on_finished=None):
+        """=== Method name: submit_to_executor =========================================================================
+        Hands the command of <spec> to <self.executor> as one job answering every request of <requests> - or, if a
+        job of the same <key> is in flight, adds the requests to it. Every request's timestamp becomes an id of the
+        job: each of them can poll it by GET_job_status. A request whose timestamp is already the id of another job
+        is answered by an error at once; the job runs for the rest of <requests>.
+        ========================================================================================== by Sziller ==="""
+        leader = requests[0]
+        waiters = [(_, on_finished if _ is leader else None) for _ in requests]
+        rejected = []  # of (request, callback, error): requests whose id is already used by another job
+        with self._in_flight_lock:
+            in_flight = self.in_flight_jobs.get(key)
+            if in_flight is not None:
+                job, job_waiters = in_flight
+                self.n_coalesced += 1  # others of the group are counted by the caller
+            else:
+                try:
+                    job = self.executor.submit(job_id=leader.timestamp, command=leader.command, function=spec.handler,
+                                               kwargs={"payload": args, "timestamp": leader.timestamp,
+                                                       "synced": leader.synced, "command": leader.command},
+                                               lane=spec.lane,
+                                               on_done=lambda job, key=key: self.job_done(job=job, key=key))
+                except ValueError as e:  # leader's id already used: the rest of the group is submitted without it
+                    job = None
+                    rejected.append((leader, on_finished, str(e)))
+                else:
+                    job_waiters = []
+                    self.in_flight_jobs[key] = (job, job_waiters)
+            for request, callback in waiters:
+                if job is None:
+                    break
+                if request.timestamp != job.job_id:
+                    try:
+                        self.executor.alias(job_id=request.timestamp, job=job)
+                    except ValueError as e:  # only the clashing request is refused, the job answers the others
+                        rejected.append((request, callback, str(e)))
+                        continue
+                job_waiters.append((request, callback))
+        for request, callback, error in rejected:
+            lg.warning("rejected  : {} - {} - says {}".format(request.command, error, self.ccn))
+            self.respond(request=request, payload=None, message=error)
+            if callback is not None:
+                callback()
+        if job is None and len(requests) > 1:
+            self.submit_to_executor(key=key, spec=spec, args=args, requests=requests[1:])
+
+    def finish_request(self, request: msg.InternalMsg, result, error: str = ""):
+        """=== Method name: finish_request =============================================================================
+        Completes a request run (or rejected) on the Engine's loop: stores a fire-and-forget one as a job, and
+        responds to a synced one. A fire-and-forget request reusing the id of a stored job is answered by an error:
+        the job already stored is kept.
+        ========================================================================================== by Sziller ==="""
+        if not request.synced:
+            try:
+                self.executor.record(job_id=request.timestamp, command=str(request.command), result=result,
+                                     error=error)
+            except ValueError as e:
+                error = str(e)
+                lg.warning("rejected  : {} - {} - says {}".format(request.command, error, self.ccn))
+        self.respond(request=request, payload=result, message=error)
+
+    def job_done(self, job, key: tuple):
+        """=== Method name: job_done ===================================================================================
+        Called on the executor's worker thread once a job is finished: answers every request waiting for it.
+        ========================================================================================== by Sziller ==="""
+        with self._in_flight_lock:
+            _, waiters = self.in_flight_jobs.pop(key)
+        if job.started_at:
+            self.commands.specs[job.command].metric.record(job.finished_at - job.started_at)
+        message = {"done": "", "cancelled": "cancelled"}.get(job.state, job.error)
+        self.outbox_result(command=job.command, job_id=job.job_id, result=job.result, error=message)
+        for request, on_finished in waiters:
+            self.respond(request=request, payload=job.result, message=message)
+            if on_finished is not None:
+                on_finished()
+
+    def outbox_result(self, command: str, job_id: float, result, error: str = ""):
+        """=== Method name: outbox_result ==============================================================================
+        Puts the result of a command run into the outbox - if the command is listed in hcdd["outbox_result_commands"].
+        A result not fitting into the outbox is logged, never raised: the run itself has succeeded.
+        ========================================================================================== by Sziller ==="""
+        if self.outbox is None or command not in self.hcdd["outbox_result_commands"]:
+            return
+        try:
+            self.outbox.append(kind="result", payload={"room_id": self.room_id, "command": command, "job_id": job_id,
+                                                       "result": result, "error": error})
+        except Exception as e:
+            lg.error("outbox    : result of {} {} not stored: {} - says {}".format(command, job_id, e, self.ccn))
+
+    def db_session(self):
+        """=== Method name: db_session =================================================================================
+        Returns the DB session of the calling thread - sessions must not be shared between threads.
+        Sessions of executor threads are created on first use, on the Engine's cached engine (cheap).
+        ========================================================================================== by Sziller ==="""
+        session = getattr(self._db_local, "session", None)
+        if session is None:
+            session = SQLi.createSession(db_fullname=self.session_name,
+                                         tables=self.db_tables,
+                                         style=self.session_style,
+                                         pool_kwargs=self.db_pool_kwargs)
+            self._db_local.session = session
+        return session
+
+    def size_db_pool(self) -> dict:
+        """=== Method name: size_db_pool ===============================================================================
+        Sizes the connection pool of the Engine's DB: one connection kept for every thread that may hold a session
+        at once - the Engine's loop, every executor thread a lane can keep busy, the sensor flusher and the group
+        commit writer - plus two overflow connections. Every thread gets a connection without waiting for another
+        one's job to finish; if the pool is exhausted nevertheless, checkout fails after hcdd["db_pool_timeout"]
+        seconds, and the state of the pool is reported by GET_basic_config ("db_pools").
+        :return: dict - pool_kwargs of < SQL_interface.createSession() >
+        ========================================================================================== by Sziller ==="""
+        n_lane_threads = min(self.hcdd["executor_threads"], sum(self.hcdd["executor_lanes"].values()))
+        n_threads = 1 + n_lane_threads + (1 if self.hcdd["sensors"] else 0) + (1 if self.hcdd["group_commit"] else 0)
+        return {"pool_size": n_threads, "max_overflow": 2, "pool_timeout": self.hcdd["db_pool_timeout"]}
+
+    def store_measurements(self, records: list) -> list:
+        """=== Method name: store_measurements =========================================================================
+        Stores MeasurementRecord-s, and waits for their commit. Every measurement of the Engine - sensor readings,
+        motion events - is stored through here. Those added are merged into the rollups in the same transaction,
+        then put into <self.latest_cache>, and into the outbox as one entry.
+        With hcdd["group_commit"], records are handed to <self.writer>: calls of every thread within
+        hcdd["group_commit_delay"] seconds share one transaction. Otherwise they are stored in one transaction of
+        their own, in the DB session of the calling thread.
+        :param records: list - of MeasurementRecord-s
+        :return: list - mea_hash of the records actually added: those already stored are skipped
+        :raise: the DB error, after rolling back - nothing of <records> is stored then
+        ========================================================================================== by Sziller ==="""
+        if self.writer is not None:
+            added = self.writer.submit(primary_key="mea_hash", data_list=[_.return_as_dict() for _ in records],
+                                       row_obj=sqlMeasurement).result()
+        else:
+            session = self.db_session()
+            try:
+                added = SQLi.ADD_records_to_table(primary_key="mea_hash", records=records, row_obj=sqlMeasurement,
+                                                  session=session, commit=False)
+                added_set = set(added)
+                SQLr.ADD_records_to_rollups(records=[_ for _ in records if _.mea_hash in added_set], session=session,
+                                            commit=False)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        added_set = set(added)
+        added_records = [_ for _ in records if _.mea_hash in added_set]
+        self.latest_cache.update(records=added_records)
+        if self.outbox is not None and added:
+            try:
+                self.outbox.append(kind="measurements",
+                                   payload={"columns": list(MEASUREMENT_COLUMNS),
+                                            "rows": [list(_) for _ in records if _.mea_hash in added_set]})
+            except Exception as e:  # measurements are stored: the server can still get them by GET_full_db_data
+                lg.error("outbox    : {} measurements not stored: {} - says {}".format(len(added), e, self.ccn))
+        return added
+
+    @staticmethod
+    def rollup_added(session, added: dict):
+        """Merges measurements added by a batch of <self.writer> into the rollups - in the batch's transaction"""
+        records = [MeasurementRecord(**_) for _ in added.get(sqlMeasurement, [])]
+        SQLr.ADD_records_to_rollups(records=records, session=session, commit=False)
+
+    def respond(self, request: msg.InternalMsg, payload, message: str = ""):
+        """=== Method name: respond ====================================================================================
+        Puts the Engine's response to <request> into <self.queue_eng_to_hub>.
+        Response carries the request's timestamp: the MessageHandler correlates them by it.
+        Only synced requests are answered: fire-and-forget requests have already been answered by the MessageHandler.
+        :param request: msg.InternalMsg - the request being answered
+        :param payload: Any - result of the command
+        :param message: str - "" on success, description otherwise
+        ========================================================================================== by Sziller ==="""
+        if self.queue_eng_to_hub is None or not request.synced:
+            return
+        self.queue_eng_to_hub.put(msg.ExternalResponseMsg(payload=payload,
+                                                          message=message,
+                                                          timestamp=request.timestamp))
+        lg.info("Timestamp as RESPONDED: {:>60}".format(request.timestamp))
 
     def GET_photo(self, **kwargs):
         """=== Method name: GET_photo ==================================================================================
+        Takes <self.finite_looping> photos (endless if 0) from the running camera stream of <self.camera>.
+        Sensor is kept running after the loop: next request's first frame arrives within a frame interval.
+        Frames are captured into preallocated buffers of <self.frame_writer>, which encodes and writes them into
+        hcdd["photo_dir"] in the background: capturing cadence is limited by the sensor, not by the SD card.
+        Loop stops early if <cancel_event> (passed by the executor) is set - the only way to stop an endless loop.
+        :return: list - of the filenames of the photos taken
         ========================================================================================== by Sziller ==="""
-        # Create a PiCamera object
-        camera = Picamera2()
-        cam_conf = camera.create_preview_configuration()
-        camera.configure(cam_conf)
-        camera.start()
+        camera = self.camera
+        writer = self.frame_writer
+        cancel_event = kwargs.get("cancel_event")
+        camera.start()  # does nothing if sensor is already running
         if kwargs:
             timestamp = "{}-".format(int(kwargs["timestamp"]))
         else:
@@ -190,25 +664,66 @@ class EngineObservatory:
             current_loop_count = 0
         else:
             current_loop_count = 1
-        time.sleep(2) # Add a delay to let the camera adjust to light levels
-        while current_loop_count <= self.finite_looping:
+        filenames = []
+        while current_loop_count <= self.finite_looping and not (cancel_event is not None and cancel_event.is_set()):
             lg.info("{:>4}/{:>4}".format(current_loop_count, self.finite_looping))
-            # Start the preview (optional)
-            # self.camera.start_preview(Preview.QTGL)
-            current_filename = './{}photo_{}.jpg'.format(timestamp, current_loop_count)
-            # Capture an image
-            camera.capture_file(current_filename)
-            lg.debug("photo     : TAKEN and saved as {}".format(current_filename))
-
-            # # Stop the preview
-            # self.camera.stop_preview()
-
-            time.sleep(self.hcdd["heartbeat"])
+            current_filename = '{}photo_{}.jpg'.format(timestamp, current_loop_count)
+            # Capture an image into a free buffer, and pass it on to be written
+            buffer = writer.acquire_buffer(shape=camera.frame_shape)
+            camera.capture_into(buffer)
+            writer.submit(buffer=buffer, filename=current_filename)
+            filenames.append(current_filename)
+            lg.debug("photo     : TAKEN and queued as {}".format(current_filename))
+            if self.hcdd["photo_interval"]:
+                time.sleep(self.hcdd["photo_interval"])
             if self.finite_looping: current_loop_count += 1
-        lg.info("photoloop : ")
-        # Release the camera resources
-        camera.close()
+        writer.flush()
+        lg.info("photoloop : {}".format(writer.as_dict()))
+        return filenames
         
+    def GET_motion_watch(self, **kwargs):
+        """=== Method name: GET_motion_watch ===========================================================================
+        Watches the camera stream for <duration> (payload) or hcdd["motion_watch_duration"] seconds, detecting
+        movement on every frame.
+        Each event is stored as a Measurement row (mea_type "motion", mea_val: peak ratio of moving pixels), and
+        only the frames around events are written into hcdd["photo_dir"].
+        :return: list - of events: start, end, peak, n_frames, filenames
+        ========================================================================================== by Sziller ==="""
+        prefix = "{}-".format(int(kwargs["timestamp"])) if kwargs.get("timestamp") else ""
+        duration = (kwargs.get("payload") or {}).get("duration") or self.hcdd["motion_watch_duration"]
+        events = self.motion_watch.run(camera=self.camera, duration=duration,
+                                       filename_prefix=prefix, cancel_event=kwargs.get("cancel_event"))
+        self.frame_writer.flush()
+        if events:
+            records = [MeasurementRecord.new(mea_type="motion",
+                                             mea_loc=self.room_id,
+                                             mea_val=_["peak"],
+                                             mea_dim="ratio",
+                                             mea_time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_["start"])),
+                                             timestamp=_["start"]) for _ in events]
+            self.store_measurements(records=records)
+        lg.info("motion    : {} events - {}".format(len(events), self.motion_watch.as_dict()))
+        return events
+
+    def GET_job_status(self, **kwargs):
+        """=== Method name: GET_job_status =============================================================================
+        Returns the state of a job - and its result once finished. Job id is the timestamp of the request that
+        started it: the handle returned to fire-and-forget requests.
+        :param payload: dict {"job_id": float} or the job id itself
+        :return: dict - see < CommandJob.as_dict() > - state "unknown" if no such job is kept
+        ========================================================================================== by Sziller ==="""
+        job_id = kwargs["payload"]["job_id"]
+        return self.executor.status(job_id=job_id) or {"job_id": job_id, "state": "unknown"}
+
+    def GET_cancel_job(self, **kwargs):
+        """=== Method name: GET_cancel_job =============================================================================
+        Cancels a job: if waiting, it never runs - if running, it is asked to stop at its next step.
+        :param payload: dict {"job_id": float} or the job id itself
+        :return: dict - job id, and whether cancellation was requested
+        ========================================================================================== by Sziller ==="""
+        job_id = kwargs["payload"]["job_id"]
+        return {"job_id": job_id, "cancelled": self.executor.cancel(job_id=job_id)}
+
     def GET_send_message(self, **kwargs):
         """=== Method name: GET_send_message ===========================================================================
         ========================================================================================== by Sziller ==="""
@@ -217,12 +732,214 @@ class EngineObservatory:
     
     def GET_full_db_data(self, **kwargs):
         """=== Method name: GET_full_db_data ===========================================================================
+        Exports one page of the measurement history, ordered by timestamp - call it repeatedly to sync the entire
+        table, or only the rows newer than what the caller already has. Only one page is read from the DB at once.
+        Payload (every key optional):
+            "since": float - high-water mark: only rows with a greater timestamp are exported
+            "after": [timestamp, mea_hash] - cursor of the previous page: export resumes right after it
+            "page_size": int - max. rows in the page (default hcdd["export_page_size"])
+        Rows are sent as one compressed columnar blob, decoded by < shmc_messages.codec.decode_columns() >. It is
+        encoded in the executor's process pool (hcdd["executor_processes"]), so other lanes keep the GIL meanwhile.
+        Keep sending the returned "cursor" as "after" (with the same "since") until "more" is False, then store
+        "high_water_mark" as "since" of the next sync.
+        Rows are committed after their reading's timestamp (buffered sensor readings, motion events stored at the end
+        of the watch): "high_water_mark" is the greatest timestamp exported minus hcdd["export_hwm_lag"], so a row
+        committed at most that late is still exported by the next sync. Syncs overlap by that window: rows already
+        received are sent again - drop them by "mea_hash". Rows committed later still are only caught by a full sync.
+        :return: dict - "columns", "n_rows", "data" (blob), "cursor", "more", "high_water_mark"
         ========================================================================================== by Sziller ==="""
-        cmn = inspect.currentframe().f_code.co_name  # current method name
-        lg.warning("implement : TBD: {}".format(cmn))
+        payload = kwargs.get("payload") or {}
+        since, after = payload.get("since"), payload.get("after")
+        if after is not None and len(after) != 2:
+            raise ValueError("<after> must be [timestamp, mea_hash], as returned in <cursor>")
+        page_size = min(payload.get("page_size") or self.hcdd["export_page_size"], self.hcdd["export_max_page_size"])
+        if page_size < 1:
+            raise ValueError("<page_size> must be positive")
+        columns = list(MEASUREMENT_COLUMNS)
+        session = self.db_session()
+        rows = next(SQLi.STREAM_rows_newer_than(ordered_by="timestamp",
+                                                high_water_mark=since,
+                                                row_obj=sqlMeasurement,
+                                                session=session,
+                                                chunk_size=page_size,
+                                                columns=columns,
+                                                after=tuple(after) if after is not None else None), [])
+        session.commit()  # streams do not end their read transaction: writers must not be blocked by it
+        cursor = list(SQLi.stream_cursor(row=rows[-1], ordered_by="timestamp", row_obj=sqlMeasurement)) \
+            if rows else after
+        data = self.executor.run_in_process(codec.encode_columns, rows, columns, self.hcdd["export_compress_level"])
+        lg.info("export    : {} rows, {} bytes compressed - says {}".format(len(rows), len(data), self.ccn))
+        high_water_mark = since
+        if cursor is not None:  # never later than now, never earlier than where this sync started from
+            high_water_mark = min(cursor[0], time.time()) - self.hcdd["export_hwm_lag"]
+            if since is not None:
+                high_water_mark = max(high_water_mark, since)
+        return {"columns": columns,
+                "n_rows": len(rows),
+                "data": data,
+                "cursor": cursor,
+                "more": len(rows) == page_size,
+                "high_water_mark": high_water_mark}
     
+    def GET_latest(self, **kwargs):
+        """=== Method name: GET_latest =================================================================================
+        Latest readings of a sensor, for live widgets. Served by <self.latest_cache> - the DB is read only on a miss,
+        and the cache is warmed by the rows read.
+        Payload:
+            "mea_loc", "mea_type": str - the sensor
+            "n": int - number of latest readings (default 1: current value)
+            "window": float - if entered: every reading of the last <window> seconds, instead of <n>
+        :return: dict - "source": "cache" or "db", "readings": list of row dicts, oldest first
+        ========================================================================================== by Sziller ==="""
+        payload = kwargs["payload"]
+        mea_loc, mea_type, window = payload["mea_loc"], payload["mea_type"], payload["window"]
+        n = max(payload["n"], 1)
+        if window is not None:
+            records = self.latest_cache.window(mea_loc=mea_loc, mea_type=mea_type, seconds=window)
+        else:
+            records = self.latest_cache.latest(mea_loc=mea_loc, mea_type=mea_type, n=n)
+        if records is not None:
+            return {"source": "cache", "readings": [_.return_as_dict() for _ in records]}
+        filter_dict = {"mea_loc": mea_loc, "mea_type": mea_type}
+        if window is not None:
+            t_from = time.time() - window
+            rows = SQLi.QUERY_timerange(row_obj=sqlMeasurement, session=self.db_session(), t_from=t_from,
+                                        t_to=float("inf"), filter_dict=filter_dict)
+            complete_from = t_from
+        else:
+            n_rows = max(n, self.hcdd["cache_depth"])
+            rows = SQLi.QUERY_latest_rows(row_obj=sqlMeasurement, session=self.db_session(),
+                                          filter_dict=filter_dict, n_rows=n_rows)
+            complete_from = rows[0]["timestamp"] if len(rows) == n_rows else float("-inf")
+        self.latest_cache.load(mea_loc=mea_loc, mea_type=mea_type, records=[MeasurementRecord(**_) for _ in rows],
+                               complete_from=complete_from)
+        return {"source": "db", "readings": rows if window is not None else rows[-n:]}
+
+    def GET_rollups(self, **kwargs):
+        """=== Method name: GET_rollups ================================================================================
+        Aggregates of measurements for charts: count, min, max and mean per bucket, read from the rollup tables -
+        cost depends on the number of buckets, not of raw rows.
+        Payload:
+            "t_from": float - start of the range (included), UNIX time
+            "t_to": float - end of the range (excluded) - default: now
+            "mea_loc", "mea_type": str - filter on sensors - default: every sensor
+            "level": str - "minute", "hour" or "day" - default: the finest one returning at most
+                     hcdd["rollup_max_buckets"] buckets per sensor
+        :return: dict - "level", "bucket_size" (sec.), "buckets": list of dicts, ordered by sensor and time
+        ========================================================================================== by Sziller ==="""
+        payload = kwargs["payload"]
+        t_from = payload["t_from"]
+        t_to = payload["t_to"] if payload["t_to"] is not None else time.time()
+        level = payload["level"] or SQLr.choose_level(t_from=t_from, t_to=t_to,
+                                                      max_buckets=self.hcdd["rollup_max_buckets"])
+        if level not in SQLr.ROLLUP_LEVELS:
+            raise ValueError("unknown rollup level: {!r} - choose from {}".format(level, list(SQLr.ROLLUP_LEVELS)))
+        filter_dict = {_: payload[_] for _ in ("mea_loc", "mea_type") if payload[_] is not None}
+        return {"level": level,
+                "bucket_size": SQLr.ROLLUP_LEVELS[level][0],
+                "buckets": SQLr.QUERY_rollups(level=level, session=self.db_session(), t_from=t_from, t_to=t_to,
+                                              filter_dict=filter_dict)}
+
+    def GET_retention(self, **kwargs):
+        """=== Method name: GET_retention ==============================================================================
+        Deletes raw measurements and rollup buckets older than their horizon in hcdd["retention_horizons"], by
+        small transactions. Scheduled every hcdd["retention_every"] seconds.
+        If the archive is enabled, measurements are archived first - see GET_archive - so only the ones not
+        archivable yet are subject to the "raw" horizon.
+        Nothing is deleted while the rollup backfill is in progress - see GET_rollup_backfill.
+        :return: dict - level: number of rows deleted - and "archived", if the archive is enabled
+        ========================================================================================== by Sziller ==="""
+        if not self.rollup_backfill["finished_at"]:  # rows deleted now would be missing from the rollups
+            lg.info("retention : postponed until rollup backfill is finished - says {}".format(self.ccn))
+            return {"postponed": "rollup backfill in progress"}
+        archived = self.GET_archive(**kwargs)["archived"] if self.archive is not None else None
+        deleted = SQLr.APPLY_retention(row_obj=sqlMeasurement,
+                                    session=self.db_session(),
+                                    horizons=self.hcdd["retention_horizons"],
+                                    chunk_size=self.hcdd["retention_chunk_rows"],
+                                    pause=self.hcdd["retention_pause"],
+                                    cancel_event=kwargs.get("cancel_event"))
+        if archived is not None:
+            deleted["archived"] = archived
+        return deleted
+
+    def GET_archive(self, **kwargs):
+        """=== Method name: GET_archive ================================================================================
+        Moves measurements of the whole UTC days older than hcdd["archive_after"] seconds out of the DB, into
+        columnar partition files - one per day and location - in <self.archive>. Rollups are kept in the DB.
+        Archived history is read by < SQL_archive.MeasurementArchive.read() > / < scan() >, memory mapped.
+        :return: dict - "archived": days, partitions and rows archived now, "archive": see < as_dict() >
+        ========================================================================================== by Sziller ==="""
+        if self.archive is None:
+            raise ValueError("archive is disabled: hcdd['archive_enabled'] is False")
+        if not self.rollup_backfill["finished_at"]:
+            raise ValueError("archive is postponed: rollup backfill in progress")
+        archived = ARCHIVE_measurements(row_obj=sqlMeasurement,
+                                        session=self.db_session(),
+                                        archive=self.archive,
+                                        before=time.time() - self.hcdd["archive_after"],
+                                        chunk_size=self.hcdd["retention_chunk_rows"],
+                                        pause=self.hcdd["retention_pause"],
+                                        cancel_event=kwargs.get("cancel_event"))
+        return {"archived": archived, "archive": self.archive.as_dict()}
+
+    def GET_rollup_backfill(self, **kwargs):
+        """=== Method name: GET_rollup_backfill ========================================================================
+        Rolls up the next hcdd["rollup_backfill_chunks"] chunks of the measurements stored before rollups existed.
+        Scheduled every hcdd["rollup_backfill_every"] seconds on a DB of a former version, until finished: the
+        Engine serves requests meanwhile, and an interrupted backfill resumes where it stopped.
+        See < SQL_rollup.BACKFILL_rollups() >.
+        :return: dict - progress: "last_rowid", "cursor", "n_rows", "started_at", "finished_at"
+        ========================================================================================== by Sziller ==="""
+        self.rollup_backfill = SQLr.BACKFILL_rollups(row_obj=sqlMeasurement,
+                                                     session=self.db_session(),
+                                                     chunk_size=self.hcdd["rollup_backfill_chunk_rows"],
+                                                     max_chunks=self.hcdd["rollup_backfill_chunks"],
+                                                     pause=self.hcdd["retention_pause"],
+                                                     cancel_event=kwargs.get("cancel_event"))
+        if self.rollup_backfill["finished_at"] and self.backfill_job is not None:
+            self.scheduler.remove_job(self.backfill_job)
+            self.backfill_job = None
+        return self.rollup_backfill
+
+    def GET_outbox_pull(self, **kwargs):
+        """=== Method name: GET_outbox_pull ============================================================================
+        Upload of the outbox, by batches. Payload (every key optional):
+            "ack": int - "last_seq" of the previous batch, once the server has stored it: acknowledged entries are
+                   never sent again, and are deleted from the outbox
+            "max_entries": int - max. entries in the batch (default hcdd["outbox_pull_entries"]). 0: acknowledge only
+        Keep pulling - acknowledging the previous batch - while "more" is True.
+        :return: dict - see < Outbox.pull() >
+        ========================================================================================== by Sziller ==="""
+        if self.outbox is None:
+            raise ValueError("outbox is disabled: hcdd['outbox_enabled'] is False")
+        payload = kwargs.get("payload") or {}
+        max_entries = payload.get("max_entries")
+        return self.outbox.pull(ack=payload.get("ack"),
+                                max_entries=self.hcdd["outbox_pull_entries"] if max_entries is None else max_entries,
+                                max_bytes=self.hcdd["outbox_pull_bytes"])
+
     def GET_basic_config(self, **kwargs):
         """=== Method name: GET_basic_config ===========================================================================
+        Returns the basic settings of the Engine, and its runtime metrics.
         ========================================================================================== by Sziller ==="""
-        cmn = inspect.currentframe().f_code.co_name  # current method name
-        lg.warning("implement : TBD: {}".format(cmn))
+        return {"room_id": self.room_id,
+                "finite_looping": self.finite_looping,
+                "low_light": self.low_light,
+                "rotation": self.rotation,
+                "hcdd": dict(self.hcdd),
+                "camera": self.camera.as_dict(),
+                "frame_writer": self.frame_writer.as_dict(),
+                "motion_watch": self.motion_watch.as_dict(),
+                "sensors": self.sensor_ingest.as_dict(),
+                "outbox": self.outbox.as_dict() if self.outbox is not None else None,
+                "writer": self.writer.as_dict() if self.writer is not None else None,
+                "latest_cache": self.latest_cache.as_dict(),
+                "db_pools": SQLi.get_pool_stats(),
+                "archive": self.archive.as_dict() if self.archive is not None else None,
+                "rollup_backfill": self.rollup_backfill,
+                "scheduler": self.scheduler.as_dict(),
+                "executor": self.executor.as_dict(),
+                "commands": self.commands.as_dict(),
+                "coalesced_requests": self.n_coalesced,
+                "metrics": {"wake_to_dispatch": self.metric_wake_to_dispatch.as_dict()}}
@@ -0,0 +1,275 @@
+"""=== Scheduler ===============================================================
+Scheduled jobs of Engines: commands run at fixed intervals, or at cron-like times.
+Jobs are kept in a min-heap of their next fire time: the Engine asks for the seconds until the earliest one, blocks on
+its incoming queue exactly that long, then takes the jobs due. No polling.
+Job definition - one dict per job, e.g. in config's APP_SCHEDULE:
+    {"command": "GET_photo",                # Engine command to be run
+     "every": 600,                          # interval job: seconds between runs, or...
+     "cron": "*/10 6-20 * * 1-5",           # ...cron job: minute hour day-of-month month day-of-week (0: Sunday)
+     "kwargs": {},                          # payload of the command
+     "name": "daytime photos",              # optional - default: command and trigger
+     "misfire": "run_once",                 # "run_once": late runs are coalesced into one, "skip": late runs dropped
+     "grace_time": 30,                      # sec. a run may be late and still count as on time
+     "allow_overlap": False}                # False: a run due while the previous one is still running is skipped
+Cron fields are evaluated on UNIX time shifted by <time_shift> ({"delta_t_h": .., "delta_t_m": ..}), so a schedule
+written in local time runs right on a device clock set to UTC.
+============================================================== by Sziller ==="""
+
+import time
+import heapq
+import logging
+import inspect
+import calendar
+import threading
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class CronExpression:
+    """=== Class name: CronExpression ==================================================================================
+    Five-field cron expression: minute hour day-of-month month day-of-week.
+    Fields accept: *, n, a-b, */s, a-b/s, and comma separated lists of these. Day-of-week: 0-7, 0 and 7 are Sunday.
+    As in cron: if both day fields are restricted, a day matching either of them fires.
+    ============================================================================================== by Sziller ==="""
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("cron expression needs 5 fields: {!r}".format(expression))
+        self.expression: str = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self.parse_field(field=field, low=low, high=high)
+            for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+        self.weekdays: set = {_ % 7 for _ in weekdays}
+        self.days_restricted: bool = fields[2] != "*"
+        self.weekdays_restricted: bool = fields[4] != "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set:
+        """Returns the set of values <field> matches within <low>..<high>"""
+        values = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, stop = low, high
+            elif "-" in value_range:
+                start, stop = (int(_) for _ in value_range.split("-"))
+            else:
+                start = stop = int(value_range)
+                if step:
+                    stop = high
+            step = int(step) if step else 1
+            if not low <= start <= stop <= high or step < 1:
+                raise ValueError("invalid cron field {!r}: values must be within {}-{}".format(field, low, high))
+            values.update(range(start, stop + 1, step))
+        return values
+
+    def day_matches(self, year: int, month: int, day: int) -> bool:
+        """True if the day fields match the date entered"""
+        weekday = (calendar.weekday(year, month, day) + 1) % 7  # cron: 0 is Sunday
+        if self.days_restricted and self.weekdays_restricted:
+            return day in self.days or weekday in self.weekdays
+        return day in self.days and weekday in self.weekdays
+
+    def next_after(self, after: float, shift: float = 0.0) -> float:
+        """=== Method name: next_after =================================================================================
+        Returns the first time strictly after <after> matching the expression.
+        :param after: float - UNIX time
+        :param shift: float - seconds added to UNIX time before fields are matched (time zone of the schedule)
+        :return: float - UNIX time of the next fire
+        ========================================================================================== by Sziller ==="""
+        t = (int(after + shift) // 60 + 1) * 60  # next full minute, in shifted time
+        limit = t + 5 * 366 * 86400
+        while t < limit:
+            year, month, day, hour, minute = time.gmtime(t)[:5]
+            if month not in self.months:
+                days_in_month = calendar.monthrange(year, month)[1]
+                t += (days_in_month - day + 1) * 86400 - hour * 3600 - minute * 60
+            elif not self.day_matches(year=year, month=month, day=day):
+                t += 86400 - hour * 3600 - minute * 60
+            elif hour not in self.hours:
+                t += 3600 - minute * 60
+            elif minute not in self.minutes:
+                t += 60
+            else:
+                return t - shift
+        raise ValueError("cron expression never fires: {!r}".format(self.expression))
+
+
+class ScheduledJob:
+    """=== Class name: ScheduledJob ====================================================================================
+    One job of the schedule, and its run statistics. See module docstring for the parameters.
+    ============================================================================================== by Sziller ==="""
+    def __init__(self,
+                 command: str,
+                 every: float or None       = None,
+                 cron: str or None          = None,
+                 kwargs: dict or None       = None,
+                 name: str                  = "",
+                 misfire: str               = "run_once",
+                 grace_time: float          = 30.0,
+                 allow_overlap: bool        = False):
+        if (every is None) == (cron is None):
+            raise ValueError("job {!r} needs exactly one of <every> and <cron>".format(name or command))
+        if every is not None and every <= 0:
+            raise ValueError("job {!r}: <every> must be positive".format(name or command))
+        if misfire not in ("run_once", "skip"):
+            raise ValueError("job {!r}: invalid <misfire>: {}".format(name or command, misfire))
+        self.command: str               = command
+        self.every: float or None       = every
+        self.cron                       = CronExpression(cron) if cron is not None else None
+        self.kwargs: dict               = kwargs or {}
+        self.name: str                  = name or "{} {}".format(command, cron if cron is not None else
+                                                                 "every {}s".format(every))
+        self.misfire: str               = misfire
+        self.grace_time: float          = grace_time
+        self.allow_overlap: bool        = allow_overlap
+        self.next_run: float            = 0.0
+        self.n_running: int             = 0
+        self.n_runs: int                = 0
+        self.n_missed: int              = 0
+        self.n_overlap_skipped: int     = 0
+        self.last_run: float            = 0.0
+
+    def next_fire_after(self, after: float, shift: float) -> float:
+        """Returns the first fire time of the job strictly after <after>"""
+        if self.cron is not None:
+            return self.cron.next_after(after=after, shift=shift)
+        if not self.next_run:
+            return after + self.every
+        n_periods = int((after - self.next_run) // self.every) + 1  # stay on the grid of the first run: no drift
+        return self.next_run + max(n_periods, 1) * self.every
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: definition and statistics of the job
+        ========================================================================================== by Sziller ==="""
+        return {"name": self.name,
+                "command": self.command,
+                "every": self.every,
+                "cron": self.cron.expression if self.cron is not None else None,
+                "next_run": self.next_run,
+                "last_run": self.last_run,
+                "running": self.n_running,
+                "runs": self.n_runs,
+                "missed": self.n_missed,
+                "overlap_skipped": self.n_overlap_skipped}
+
+
+class Scheduler:
+    """=== Class name: Scheduler =======================================================================================
+    Min-heap of ScheduledJob-s, by next fire time.
+    Usage by the Engine's loop:
+    - block at most < seconds_to_next_job() > on incoming requests
+    - run every job returned by < due_jobs() >, and call < job_finished() > once a run is over
+    :param jobs: list - of job definition dicts (see module docstring), or ScheduledJob-s
+    :param time_shift: dict or None - {"delta_t_h": int, "delta_t_m": int} shift of the schedule's clock
+    :param clock: callable - returns UNIX time. Replace it to test schedules without waiting.
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self, jobs: list or None = None, time_shift: dict or None = None, clock=time.time):
+        time_shift = time_shift or {}
+        self.shift: float               = 3600 * time_shift.get("delta_t_h", 0) + 60 * time_shift.get("delta_t_m", 0)
+        self.clock                      = clock
+        self.jobs: list                 = []
+        self.heap: list                 = []  # of (next_run, sequence nr., job)
+        self.sequence: int              = 0
+        self._lock                      = threading.Lock()  # runs may finish on other threads
+        for job in jobs or []:
+            self.add_job(job if isinstance(job, ScheduledJob) else ScheduledJob(**job))
+
+    def add_job(self, job: ScheduledJob):
+        """Adds <job>, first fire is its next one after now"""
+        self.jobs.append(job)
+        self.push(job=job, next_run=job.next_fire_after(after=self.clock(), shift=self.shift))
+        lg.info("schedule  : {:<40} next run at {:.3f} - says {}".format(job.name, job.next_run, self.ccn))
+
+    def remove_job(self, job: ScheduledJob):
+        """Removes <job>: it is not run again. A run in progress is not affected. May be called from any thread"""
+        with self._lock:
+            if job not in self.jobs:
+                return
+            self.jobs.remove(job)
+            heap = [_ for _ in self.heap if _[2] is not job]
+            heapq.heapify(heap)
+            self.heap = heap
+        lg.info("schedule  : {:<40} removed - says {}".format(job.name, self.ccn))
+
+    def push(self, job: ScheduledJob, next_run: float):
+        job.next_run = next_run
+        self.sequence += 1
+        heapq.heappush(self.heap, (next_run, self.sequence, job))
+
+    def seconds_to_next_job(self) -> float or None:
+        """=== Method name: seconds_to_next_job ========================================================================
+        :return: float - seconds until the earliest job is due (0.0 if overdue), None if there are no jobs
+        ========================================================================================== by Sziller ==="""
+        if not self.heap:
+            return None
+        return max(self.heap[0][0] - self.clock(), 0.0)
+
+    def due_jobs(self) -> list:
+        """=== Method name: due_jobs ===================================================================================
+        Pops every job due now, and reschedules it to its next fire time after now.
+        Late runs (beyond the job's grace time) are handled by its <misfire> policy: coalesced into this one run, or
+        skipped. A job still running is skipped, unless it allows overlap.
+        :return: list - of ScheduledJob-s to be run now. Call < job_finished() > for each, when its run is over.
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            return self.pop_due_jobs(now=self.clock())
+
+    def pop_due_jobs(self, now: float) -> list:
+        """Body of < due_jobs() >. Call with the lock held"""
+        to_run = []
+        while self.heap and self.heap[0][0] <= now:
+            scheduled_at, _, job = heapq.heappop(self.heap)
+            next_run = job.next_fire_after(after=now, shift=self.shift)
+            n_fires = self.count_fires(job=job, scheduled_at=scheduled_at, now=now)
+            self.push(job=job, next_run=next_run)
+            if now - scheduled_at > job.grace_time:
+                job.n_missed += n_fires - 1 if job.misfire == "run_once" else n_fires
+                lg.warning("schedule  : {} is late by {:.1f} s ({} fires) - {} - says {}".format(
+                    job.name, now - scheduled_at, n_fires, job.misfire, self.ccn))
+                if job.misfire == "skip":
+                    continue
+            else:
+                job.n_missed += n_fires - 1
+            if job.n_running and not job.allow_overlap:
+                job.n_overlap_skipped += 1
+                lg.warning("schedule  : {} skipped: previous run still in progress - says {}".format(
+                    job.name, self.ccn))
+                continue
+            job.n_running += 1
+            job.n_runs += 1
+            job.last_run = now
+            to_run.append(job)
+        return to_run
+
+    def count_fires(self, job: ScheduledJob, scheduled_at: float, now: float) -> int:
+        """Returns the number of fire times of <job> from <scheduled_at> until <now>, at least 1"""
+        if job.every is not None:
+            return int((now - scheduled_at) // job.every) + 1
+        n_fires, t = 1, scheduled_at
+        while n_fires < 1000:
+            t = job.cron.next_after(after=t, shift=self.shift)
+            if t > now:
+                break
+            n_fires += 1
+        return n_fires
+
+    def job_finished(self, job: ScheduledJob):
+        """Marks a run of <job> returned by < due_jobs() > as finished. May be called from any thread"""
+        with self._lock:
+            job.n_running = max(job.n_running - 1, 0)
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: state of every job
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            return {"time_shift_sec": self.shift,
+                    "jobs": [_.as_dict() for _ in self.jobs]}
@@ -0,0 +1,337 @@
+"""=== Sensor ingestion ========================================================
+Polls sensors on their own cadences, and stores their readings in batches.
+- Drivers are pluggable (see DRIVERS). A driver reads one value of one sensor; it is polled every <interval> seconds.
+  "simulated": generated values - no hardware needed, use it for tests and on non-Pi machines.
+  "sysfs": a number read from a file, e.g. the SoC temperature of the RaspberryPi.
+- Sampling runs on its own thread, ordered by a min-heap of next read times: dozens of sensors cost one thread.
+- Readings are buffered as MeasurementRecord-s in a ring of fixed size, never in the DB session of the sampler.
+- A flusher thread stores the ring in one batch once it holds <flush_rows> readings, or its oldest reading is
+  <flush_age> seconds old: one commit per batch, not per reading.
+- A DB stall or error blocks the flusher only: sampling goes on into the ring, the batch is retried with growing
+  delay. If the ring is full, the oldest readings are dropped - and counted.
+============================================================== by Sziller ==="""
+
+import math
+import time
+import heapq
+import random
+import logging
+import inspect
+import threading
+from collections import deque
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+# LOGGING                                                                                   logging - START -
+lg = logging.getLogger()
+# LOGGING                                                                                   logging - ENDED -
+
+
+class SensorDriver:
+    """=== Class name: SensorDriver ====================================================================================
+    Interface every sensor driver implements: one value of one sensor per < read() >.
+    :param mea_type: str - type of the measurement, e.g. "temperature"
+    :param mea_loc: str - location of the sensor, e.g. "obsr"
+    :param mea_dim: str - dimension of the value, e.g. "C"
+    :param interval: float - seconds between two reads
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, mea_type: str, mea_loc: str, mea_dim: str = "", interval: float = 1.0):
+        if interval <= 0:
+            raise ValueError("sensor {}@{}: <interval> must be positive".format(mea_type, mea_loc))
+        self.mea_type: str              = mea_type
+        self.mea_loc: str               = mea_loc
+        self.mea_dim: str               = mea_dim
+        self.interval: float            = interval
+
+    @property
+    def name(self) -> str:
+        return "{}@{}".format(self.mea_type, self.mea_loc)
+
+    def read(self) -> float:
+        """Returns the current value of the sensor. Raises on failure. Must return fast: it runs on the sampler"""
+        raise NotImplementedError
+
+
+class SimulatedSensor(SensorDriver):
+    """=== Class name: SimulatedSensor =================================================================================
+    Sine wave with noise. No hardware needed.
+    :param base: float - mean value
+    :param amplitude: float - amplitude of the sine
+    :param period: float - seconds of one sine period
+    :param noise: float - standard deviation of the added noise
+    :param failure_rate: float - ratio of reads raising an error, 0-1
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, mea_type: str, mea_loc: str, mea_dim: str = "", interval: float = 1.0,
+                 base: float = 20.0, amplitude: float = 2.0, period: float = 86400.0, noise: float = 0.1,
+                 failure_rate: float = 0.0):
+        super(SimulatedSensor, self).__init__(mea_type=mea_type, mea_loc=mea_loc, mea_dim=mea_dim, interval=interval)
+        self.base: float                = base
+        self.amplitude: float           = amplitude
+        self.period: float              = period
+        self.noise: float               = noise
+        self.failure_rate: float        = failure_rate
+
+    def read(self) -> float:
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise IOError("simulated read failure of {}".format(self.name))
+        return (self.base + self.amplitude * math.sin(2 * math.pi * time.time() / self.period)
+                + random.gauss(0.0, self.noise))
+
+
+class SysfsSensor(SensorDriver):
+    """=== Class name: SysfsSensor =====================================================================================
+    Reads a number from a file, e.g. /sys/class/thermal/thermal_zone0/temp (millidegrees C) on the RaspberryPi.
+    :param path: str - file holding the value
+    :param scale: float - the number read is multiplied by it, e.g. 0.001 for millidegrees
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, mea_type: str, mea_loc: str, mea_dim: str = "", interval: float = 1.0,
+                 path: str = "/sys/class/thermal/thermal_zone0/temp", scale: float = 0.001):
+        super(SysfsSensor, self).__init__(mea_type=mea_type, mea_loc=mea_loc, mea_dim=mea_dim, interval=interval)
+        self.path: str                  = path
+        self.scale: float               = scale
+
+    def read(self) -> float:
+        with open(self.path) as file:
+            return float(file.read().strip()) * self.scale
+
+
+DRIVERS: dict = {"simulated": SimulatedSensor,
+                 "sysfs": SysfsSensor}
+
+
+def build_driver(definition: dict) -> SensorDriver:
+    """=== Function name: build_driver =================================================================================
+    Instantiates a driver from its definition, e.g. hcdd["sensors"] entries:
+        {"driver": "simulated", "mea_type": "temperature", "mea_loc": "obsr", "mea_dim": "C", "interval": 1.0}
+    Every key but "driver" is passed to the driver class.
+    ============================================================================================== by Sziller ==="""
+    definition = dict(definition)
+    driver = definition.pop("driver", "simulated")
+    if driver not in DRIVERS:
+        raise ValueError("unknown sensor driver: {!r} - choose from {}".format(driver, sorted(DRIVERS)))
+    return DRIVERS[driver](**definition)
+
+
+class ReadingRing:
+    """=== Class name: ReadingRing =====================================================================================
+    Bounded FIFO of readings, shared by the sampler and the flusher. If full, the oldest reading is dropped.
+    :param capacity: int - max. number of readings kept
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, capacity: int = 10000):
+        self.capacity: int              = capacity
+        self.readings: deque            = deque()  # of (monotonic time of the reading, MeasurementRecord)
+        self.n_dropped: int             = 0
+        self._condition                 = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.readings)
+
+    def append(self, record: MeasurementRecord):
+        """Adds the newest reading. Wakes up the flusher"""
+        with self._condition:
+            if len(self.readings) >= self.capacity:
+                self.readings.popleft()
+                self.n_dropped += 1
+            self.readings.append((time.monotonic(), record))
+            self._condition.notify_all()
+
+    def take(self, n_max: int) -> list:
+        """Removes and returns the oldest <n_max> readings, as (time, record) tuples"""
+        with self._condition:
+            return [self.readings.popleft() for _ in range(min(n_max, len(self.readings)))]
+
+    def put_back(self, readings: list):
+        """Returns readings taken - but not stored - to the front of the ring. Those not fitting are dropped"""
+        with self._condition:
+            n_fitting = max(self.capacity - len(self.readings), 0)
+            self.n_dropped += max(len(readings) - n_fitting, 0)
+            self.readings.extendleft(reversed(readings[len(readings) - n_fitting:] if n_fitting else []))
+
+    def oldest_age(self) -> float:
+        """Returns the age of the oldest reading in seconds, 0.0 if empty"""
+        with self._condition:
+            return time.monotonic() - self.readings[0][0] if self.readings else 0.0
+
+    def wait(self, predicate, timeout: float) -> bool:
+        """Waits until <predicate()> is True - checked on every append and notify - or <timeout> seconds pass"""
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout=timeout)
+
+    def notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+class SensorIngest:
+    """=== Class name: SensorIngest ====================================================================================
+    Samples <drivers> on their cadences into a ReadingRing, and stores the ring in batches by <store>.
+    :param drivers: list - of SensorDriver-s, or driver definition dicts (see < build_driver() >)
+    :param store: callable(list of MeasurementRecord) - stores a batch, e.g. by SQL_interface.ADD_records_to_table.
+                  Called on the flusher thread only. Must raise if the batch was not stored.
+    :param ring_size: int - max. readings buffered
+    :param flush_rows: int - a batch is stored as soon as this many readings wait
+    :param flush_age: float - ...or as soon as the oldest reading waits this long, in seconds
+    :param max_batch_rows: int - max. readings stored by one < store() > call
+    :param retry_delay: float - seconds before retrying a failed batch - doubled on every failure in a row...
+    :param max_retry_delay: float - ...up to this
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 drivers: list,
+                 store,
+                 ring_size: int             = 10000,
+                 flush_rows: int            = 500,
+                 flush_age: float           = 5.0,
+                 max_batch_rows: int        = 5000,
+                 retry_delay: float         = 1.0,
+                 max_retry_delay: float     = 60.0):
+        self.drivers: list              = [_ if isinstance(_, SensorDriver) else build_driver(_) for _ in drivers]
+        self.store                      = store
+        self.ring                       = ReadingRing(capacity=ring_size)
+        self.flush_rows: int            = flush_rows
+        self.flush_age: float           = flush_age
+        self.max_batch_rows: int        = max_batch_rows
+        self.retry_delay: float         = retry_delay
+        self.max_retry_delay: float     = max_retry_delay
+        self.n_reads: int               = 0
+        self.n_read_errors: int         = 0
+        self.n_missed_reads: int        = 0
+        self.n_batches: int             = 0
+        self.n_stored: int              = 0
+        self.n_store_errors: int        = 0
+        self.flush_requested: bool      = False
+        self.is_storing: bool           = False
+        self.is_stopped                 = threading.Event()
+        self.sampler: threading.Thread or None = None
+        self.flusher: threading.Thread or None = None
+
+    def start(self):
+        """Starts the sampler and the flusher threads. Does nothing if already running"""
+        if self.sampler is not None:
+            return
+        self.is_stopped.clear()
+        self.sampler = threading.Thread(target=self.run_sampler, name="SensorSampler", daemon=True)
+        self.flusher = threading.Thread(target=self.run_flusher, name="SensorFlusher", daemon=True)
+        self.sampler.start()
+        self.flusher.start()
+        lg.info("sensors   : {} drivers sampled - says {}".format(len(self.drivers), self.ccn))
+
+    def run_sampler(self):
+        """=== Method name: run_sampler ================================================================================
+        Sampler thread's loop: reads every driver when due. Reads stay on their interval grid: a late read does not
+        shift the following ones, missed reads are skipped.
+        ========================================================================================== by Sziller ==="""
+        now = time.monotonic()
+        heap = [(now, nr, driver) for nr, driver in enumerate(self.drivers)]
+        heapq.heapify(heap)
+        while heap:
+            due_at, nr, driver = heap[0]
+            if self.is_stopped.wait(timeout=max(due_at - time.monotonic(), 0.0)):
+                return
+            heapq.heappop(heap)
+            self.sample(driver=driver)
+            n_periods = int((time.monotonic() - due_at) // driver.interval) + 1
+            self.n_missed_reads += n_periods - 1
+            heapq.heappush(heap, (due_at + n_periods * driver.interval, nr, driver))
+
+    def sample(self, driver: SensorDriver):
+        """Reads <driver> once, and puts the reading into the ring. A failing read is logged and counted"""
+        try:
+            value = driver.read()
+            timestamp = time.time()
+            record = MeasurementRecord.new(mea_type=driver.mea_type,
+                                           mea_loc=driver.mea_loc,
+                                           mea_val=value,
+                                           mea_dim=driver.mea_dim,
+                                           mea_time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                                           timestamp=timestamp)
+        except Exception as e:
+            self.n_read_errors += 1
+            lg.warning("sensors   : read of {} failed: {} - says {}".format(driver.name, e, self.ccn))
+            return
+        self.n_reads += 1
+        self.ring.append(record)
+
+    def flush_due(self) -> bool:
+        """True if a batch is to be stored now: size or age reached, flush requested, or stopping"""
+        if not len(self.ring):
+            return self.is_stopped.is_set()
+        return (len(self.ring) >= self.flush_rows
+                or self.flush_requested
+                or self.is_stopped.is_set()
+                or self.ring.oldest_age() >= self.flush_age)
+
+    def run_flusher(self):
+        """=== Method name: run_flusher ================================================================================
+        Flusher thread's loop: stores the ring by batches when due. A failed batch is returned to the ring and
+        retried after a delay growing with the failures in a row. On stop, the ring is stored before exiting.
+        ========================================================================================== by Sziller ==="""
+        delay, n_failures = self.retry_delay, 0
+        while True:
+            self.ring.wait(predicate=self.flush_due, timeout=self.flush_age)
+            if not len(self.ring):
+                if self.is_stopped.is_set():
+                    return
+                continue
+            if not self.flush_due():
+                continue
+            self.is_storing = True
+            batch = self.ring.take(n_max=self.max_batch_rows)
+            try:
+                self.store([_[1] for _ in batch])
+            except Exception as e:
+                self.ring.put_back(batch)
+                self.is_storing = False
+                self.n_store_errors += 1
+                n_failures += 1
+                if self.is_stopped.is_set() and n_failures > 1:
+                    lg.error("sensors   : stopped, {} readings could not be stored: {} - says {}".format(
+                        len(self.ring), e, self.ccn))
+                    return
+                lg.error("sensors   : storing {} readings failed, retry in {:.1f} s: {} - says {}".format(
+                    len(batch), delay, e, self.ccn))
+                self.is_stopped.wait(timeout=delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            delay, n_failures = self.retry_delay, 0
+            self.n_batches += 1
+            self.n_stored += len(batch)
+            self.is_storing = False
+            if not len(self.ring):
+                self.flush_requested = False
+            self.ring.notify()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """=== Method name: flush ======================================================================================
+        Asks the flusher to store every reading buffered now, and waits until they are stored.
+        :return: bool - True if everything buffered was stored within <timeout> seconds
+        ========================================================================================== by Sziller ==="""
+        self.flush_requested = True
+        self.ring.notify()
+        return self.ring.wait(predicate=lambda: not len(self.ring) and not self.is_storing, timeout=timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """=== Method name: stop =======================================================================================
+        Stops sampling, stores the readings buffered, and stops the flusher.
+        ========================================================================================== by Sziller ==="""
+        self.is_stopped.set()
+        self.ring.notify()
+        for thread in (self.sampler, self.flusher):
+            if thread is not None:
+                thread.join(timeout=timeout)
+        self.sampler = self.flusher = None
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: counters of sampling and storing
+        ========================================================================================== by Sziller ==="""
+        return {"drivers": [_.name for _ in self.drivers],
+                "running": self.sampler is not None,
+                "reads": self.n_reads,
+                "read_errors": self.n_read_errors,
+                "missed_reads": self.n_missed_reads,
+                "buffered": len(self.ring),
+                "dropped": self.ring.n_dropped,
+                "batches": self.n_batches,
+                "stored": self.n_stored,
+                "store_errors": self.n_store_errors}
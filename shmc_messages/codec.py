@@ -0,0 +1,356 @@
+"""=== Message codec =============================================================
+Compact, versioned binary wire format for MsgObject and its subclasses.
+Replaces pickling (send_pyobj / recv_pyobj) on the socket: messages are smaller, binary payloads are never copied,
+and decoding does not execute anything - so it is safe to accept from the network.
+NOTE: for small messages pure Python encoding is slower than the C pickler - see < benchmark() >. The gain is in
+size, safety and binary payloads (images), where pickle copies every byte.
+
+A message is sent as a multipart ZMQ message:
+- frame 0: header
+    MAGIC (1 byte) | WIRE_VERSION (1 byte) | message kind (1 byte) | fields of the kind, in schema order
+- frame 1..n: binary blobs (bytes, bytearray, memoryview) found in the payload, e.g. images.
+    Blobs are not copied into the header, they are referenced by frame index. Sent with copy=False they are never
+    copied by Python. On receipt (recv_multipart(copy=False)) < decode(..., zero_copy=True) > returns them as
+    memoryview-s of the frames - use it only if the message is not passed on to another process (Queue pickles it).
+
+Field values are tagged:
+    N: None     T: True         F: False        i: int (8 bytes)    I: big int (as decimal str)
+    d: float    s: str          b: blob ref     l: list             t: tuple        m: dict
+All lengths and counts are unsigned 4 byte integers, everything is little endian.
+
+Old clients still sending pickles are recognized by the first byte (pickle protocol 2+ always starts with 0x80):
+use < detect_format() > and answer them with < pack(..., wire_format="pickle") >.
+
+Tables (e.g. DB exports) are sent as one compressed columnar blob - see < encode_columns() >: values of a column are
+stored next to each other, float columns as packed doubles, which compresses far better than rows of dicts.
+============================================================== by Sziller ==="""
+
+import zlib
+import pickle
+import struct
+from shmc_messages import msg
+
+MAGIC: bytes            = b"\xa7"
+WIRE_VERSION: int       = 1
+PICKLE_MARK: int        = 0x80
+
+# message kind: (class, fields in wire order) - append only, never reorder! Bump WIRE_VERSION on breaking changes.
+SCHEMA: dict = {
+    0: (msg.MsgObject, ("payload", "timestamp")),
+    1: (msg.InternalMsg, ("payload", "timestamp", "synced", "email", "signature", "command")),
+    2: (msg.ExternalResponseMsg, ("payload", "timestamp", "message"))}
+KIND_OF_CLASS: dict = {cls: kind for kind, (cls, _) in SCHEMA.items()}
+
+_U32    = struct.Struct("<I")
+_I64    = struct.Struct("<q")
+_F64    = struct.Struct("<d")
+_HEAD   = struct.Struct("<cBB")
+_COLUMNS_HEAD = struct.Struct("<cBII")  # COLUMNS_MAGIC, WIRE_VERSION, number of rows, number of columns
+COLUMNS_MAGIC: bytes    = b"C"
+_I64_MIN, _I64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class CodecError(ValueError):
+    """=== Class name: CodecError ======================================================================================
+    Raised if an object cannot be encoded, or received frames cannot be decoded.
+    ============================================================================================== by Sziller ==="""
+
+
+def encode(obj: msg.MsgObject) -> list:
+    """=== Function name: encode =======================================================================================
+    Encodes a message object into a list of frames.
+    :param obj: MsgObject - or any of its subclasses defined in SCHEMA
+    :return: list - of frames: [header, *blobs] - ready for socket.send_multipart()
+    ============================================================================================== by Sziller ==="""
+    kind = KIND_OF_CLASS.get(type(obj))
+    if kind is None:
+        raise CodecError("no wire schema for class: {}".format(type(obj).__name__))
+    header = bytearray(_HEAD.pack(MAGIC, WIRE_VERSION, kind))
+    blobs = []
+    for field in SCHEMA[kind][1]:
+        _encode_value(getattr(obj, field), header, blobs)
+    return [bytes(header)] + blobs
+
+
+def decode(frames: list, zero_copy: bool = False) -> msg.MsgObject:
+    """=== Function name: decode =======================================================================================
+    Decodes frames created by < encode() > into a message object.
+    :param frames: list - of bytes, or zmq.Frame-s (as received by recv_multipart(copy=False))
+    :param zero_copy: bool - if True, blobs are returned as memoryview-s of <frames>, else as bytes
+    :return: MsgObject - instance of the class defined by the message kind
+    ============================================================================================== by Sziller ==="""
+    buffers = [_as_buffer(_) for _ in frames]
+    header = buffers[0]
+    if not zero_copy:
+        buffers = [header] + [bytes(_) for _ in buffers[1:]]
+    try:
+        magic, version, kind = _HEAD.unpack_from(header, 0)
+    except struct.error:
+        raise CodecError("frame too short for a header")
+    if magic != MAGIC:
+        raise CodecError("not a codec frame")
+    if version != WIRE_VERSION:
+        raise CodecError("unsupported wire version: {}".format(version))
+    if kind not in SCHEMA:
+        raise CodecError("unknown message kind: {}".format(kind))
+    cls, fields = SCHEMA[kind]
+    values, offset = {}, _HEAD.size
+    try:
+        for field in fields:
+            values[field], offset = _decode_value(header, offset, buffers)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise CodecError("malformed message: {}".format(e))
+    if offset != len(header):
+        raise CodecError("trailing bytes in header")
+    return cls(**values)
+
+
+def detect_format(first_frame) -> str:
+    """=== Function name: detect_format ================================================================================
+    Tells the format of a received message by its first frame.
+    :param first_frame: bytes or zmq.Frame
+    :return: str - "codec", "pickle" or "unknown"
+    ============================================================================================== by Sziller ==="""
+    buffer = _as_buffer(first_frame)
+    if not len(buffer):
+        return "unknown"
+    if buffer[0] == MAGIC[0]:
+        return "codec"
+    if buffer[0] == PICKLE_MARK:
+        return "pickle"
+    return "unknown"
+
+
+def pack(obj: msg.MsgObject, wire_format: str = "codec") -> list:
+    """=== Function name: pack =========================================================================================
+    Encodes <obj> into frames of <wire_format>. Use the format the peer has sent its request in.
+    :param obj: MsgObject - message to be sent
+    :param wire_format: str - "codec" or "pickle"
+    :return: list - of frames
+    ============================================================================================== by Sziller ==="""
+    if wire_format == "pickle":
+        return [pickle.dumps(obj)]
+    return encode(obj)
+
+
+def unpack(frames: list, accept_pickle: bool = False, zero_copy: bool = False) -> tuple:
+    """=== Function name: unpack =======================================================================================
+    Decodes received frames of either format.
+    ATTENTION: unpickling data is unsafe: only accept pickle from trusted (old) clients!
+    :param frames: list - of bytes or zmq.Frame-s
+    :param accept_pickle: bool - if False, pickled messages are refused
+    :param zero_copy: bool - see < decode() >
+    :return: tuple - (MsgObject, wire_format)
+    ============================================================================================== by Sziller ==="""
+    wire_format = detect_format(frames[0])
+    if wire_format == "codec":
+        return decode(frames, zero_copy=zero_copy), wire_format
+    if wire_format == "pickle" and accept_pickle:
+        return pickle.loads(_as_buffer(frames[0])), wire_format
+    raise CodecError("refused message format: {}".format(wire_format))
+
+
+def _as_buffer(frame):
+    """Returns a bytes-like view of a frame: zmq.Frame-s are accessed over their buffer, without copy"""
+    return getattr(frame, "buffer", frame)
+
+
+def _encode_str(value: str, out: bytearray):
+    """Appends length prefixed utf-8 string"""
+    raw = value.encode("utf-8")
+    out += _U32.pack(len(raw))
+    out += raw
+
+
+def _encode_value(value, out: bytearray, blobs: list):
+    """Appends tagged <value> to <out>. Binary data is appended to <blobs> and referenced by index"""
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        if _I64_MIN <= value <= _I64_MAX:
+            out += b"i"
+            out += _I64.pack(value)
+        else:
+            out += b"I"
+            _encode_str(str(value), out)
+    elif isinstance(value, float):
+        out += b"d"
+        out += _F64.pack(value)
+    elif isinstance(value, str):
+        out += b"s"
+        _encode_str(value, out)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        blobs.append(value)
+        out += b"b"
+        out += _U32.pack(len(blobs))  # frame index: header is frame 0
+    elif isinstance(value, (list, tuple)):
+        out += b"l" if isinstance(value, list) else b"t"
+        out += _U32.pack(len(value))
+        for item in value:
+            _encode_value(item, out, blobs)
+    elif isinstance(value, dict):
+        out += b"m"
+        out += _U32.pack(len(value))
+        for key, item in value.items():
+            _encode_value(key, out, blobs)
+            _encode_value(item, out, blobs)
+    else:
+        raise CodecError("type cannot be encoded: {}".format(type(value).__name__))
+
+
+def _decode_str(buffer, offset: int) -> tuple:
+    """Reads length prefixed utf-8 string. Returns (str, new offset)"""
+    (length,) = _U32.unpack_from(buffer, offset)
+    offset += _U32.size
+    if offset + length > len(buffer):
+        raise CodecError("string runs over frame end")
+    return bytes(buffer[offset:offset + length]).decode("utf-8"), offset + length
+
+
+def _decode_value(buffer, offset: int, frames: list) -> tuple:
+    """Reads one tagged value. Returns (value, new offset)"""
+    tag = bytes(buffer[offset:offset + 1])
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return _I64.unpack_from(buffer, offset)[0], offset + _I64.size
+    if tag == b"I":
+        text, offset = _decode_str(buffer, offset)
+        return int(text), offset
+    if tag == b"d":
+        return _F64.unpack_from(buffer, offset)[0], offset + _F64.size
+    if tag == b"s":
+        return _decode_str(buffer, offset)
+    if tag == b"b":
+        (index,) = _U32.unpack_from(buffer, offset)
+        if not 0 < index < len(frames):
+            raise CodecError("blob reference out of range: {}".format(index))
+        return frames[index], offset + _U32.size
+    if tag in (b"l", b"t"):
+        (count,) = _U32.unpack_from(buffer, offset)
+        offset += _U32.size
+        items = []
+        for _ in range(count):
+            item, offset = _decode_value(buffer, offset, frames)
+            items.append(item)
+        return (items if tag == b"l" else tuple(items)), offset
+    if tag == b"m":
+        (count,) = _U32.unpack_from(buffer, offset)
+        offset += _U32.size
+        items = {}
+        for _ in range(count):
+            key, offset = _decode_value(buffer, offset, frames)
+            items[key], offset = _decode_value(buffer, offset, frames)
+        return items, offset
+    raise CodecError("unknown value tag: {!r}".format(tag))
+
+
+def encode_columns(rows: list, columns: list, level: int = 6) -> bytes:
+    """=== Function name: encode_columns ===============================================================================
+    Encodes a table into one zlib compressed, columnar blob.
+    Blob (before compression):
+        COLUMNS_MAGIC | WIRE_VERSION | number of rows | number of columns | columns, in order of <columns>
+    Every column: name (length prefixed str), then either "D" and the packed doubles - if all values are floats - or
+    "V" and the values tagged as in messages.
+    :param rows: list - of dicts, each having every key of <columns>
+    :param columns: list - of column names to be encoded
+    :param level: int - zlib compression level, 0-9
+    :return: bytes - the compressed blob. See < decode_columns() >
+    ============================================================================================== by Sziller ==="""
+    out = bytearray(_COLUMNS_HEAD.pack(COLUMNS_MAGIC, WIRE_VERSION, len(rows), len(columns)))
+    blobs = []
+    for name in columns:
+        values = [_[name] for _ in rows]
+        _encode_str(name, out)
+        if all(type(_) is float for _ in values):
+            out += b"D"
+            out += struct.pack("<{}d".format(len(values)), *values)
+        else:
+            out += b"V"
+            for value in values:
+                _encode_value(value, out, blobs)
+        if blobs:
+            raise CodecError("binary values cannot be encoded in columns: {}".format(name))
+    return zlib.compress(bytes(out), level)
+
+
+def decode_columns(blob) -> dict:
+    """=== Function name: decode_columns ===============================================================================
+    Decodes a blob created by < encode_columns() >.
+    :param blob: bytes-like - the compressed blob
+    :return: dict - column name: list of values, in order of the encoded columns
+    ============================================================================================== by Sziller ==="""
+    try:
+        buffer = zlib.decompress(_as_buffer(blob))
+        magic, version, n_rows, n_columns = _COLUMNS_HEAD.unpack_from(buffer, 0)
+    except (zlib.error, struct.error) as e:
+        raise CodecError("not a column blob: {}".format(e))
+    if magic != COLUMNS_MAGIC:
+        raise CodecError("not a column blob")
+    if version != WIRE_VERSION:
+        raise CodecError("unsupported wire version: {}".format(version))
+    table, offset = {}, _COLUMNS_HEAD.size
+    try:
+        for _ in range(n_columns):
+            name, offset = _decode_str(buffer, offset)
+            tag = buffer[offset:offset + 1]
+            offset += 1
+            if tag == b"D":
+                table[name] = list(struct.unpack_from("<{}d".format(n_rows), buffer, offset))
+                offset += n_rows * _F64.size
+            elif tag == b"V":
+                values = []
+                for _ in range(n_rows):
+                    value, offset = _decode_value(buffer, offset, [])
+                    values.append(value)
+                table[name] = values
+            else:
+                raise CodecError("unknown column tag: {!r}".format(tag))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise CodecError("malformed column blob: {}".format(e))
+    if offset != len(buffer):
+        raise CodecError("trailing bytes in column blob")
+    return table
+
+
+def benchmark(n: int = 20000):
+    """=== Function name: benchmark ====================================================================================
+    Compares encode/decode throughput and bytes per message of this codec against pickle.
+    Run: python -m shmc_messages.codec
+    ============================================================================================== by Sziller ==="""
+    import time
+    samples = {
+        "InternalMsg": msg.InternalMsg(payload={"id": "obsr"}, timestamp=time.time(), synced=True,
+                                       email="user@example.com", signature=b"\x01" * 64, command="GET_photo"),
+        "ExternalResponseMsg": msg.ExternalResponseMsg(payload={"room_id": "obsr", "rotation": 180,
+                                                                "values": [21.5, 21.7, 21.6]},
+                                                       timestamp=time.time(), message=""),
+        "ExternalResponseMsg/1MB image": msg.ExternalResponseMsg(payload={"jpg": bytes(1024 * 1024)},
+                                                                 timestamp=time.time(), message="")}
+    print("{:<32}{:>8}{:>14}{:>14}{:>12}".format("message", "format", "encode/s", "decode/s", "bytes"))
+    for name, obj in samples.items():
+        rounds = n if "image" not in name else max(1, n // 100)
+        for wire_format in ("pickle", "codec"):
+            t0 = time.perf_counter()
+            for _ in range(rounds):
+                frames = pack(obj, wire_format=wire_format)
+            t_enc = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for _ in range(rounds):
+                unpack(frames, accept_pickle=True)
+            t_dec = time.perf_counter() - t0
+            size = sum(len(_) for _ in frames)
+            print("{:<32}{:>8}{:>14.0f}{:>14.0f}{:>12}".format(name, wire_format, rounds / t_enc, rounds / t_dec, size))
+
+
+if __name__ == "__main__":
+    benchmark()
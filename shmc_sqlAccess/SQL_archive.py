@@ -0,0 +1,320 @@
+"""
+Archive: long-term history of measurements, moved out of the live DB into columnar NumPy files.
+Measurements are archived by whole (UTC) days, into one partition file per day and location:
+    <root>/<YYYY-MM-DD>/<mea_loc, %-quoted>.npz
+A partition holds the columns of the rows - sorted by timestamp - as arrays:
+    "timestamp" float64, "mea_val" float64 (NaN: no value), "series" uint - index into the series table
+    "series_type", "series_dim" str - the series table: (mea_type, mea_dim) of every series of the partition
+About 18 bytes a row, against the 150+ of a row of the live DB with its indexes. <mea_loc> is the partition itself,
+<mea_hash> is generated from the columns kept, <mea_time> is human readable only: neither is archived.
+Uncompressed partitions (np.savez) are memory mapped by the reader: a year of a sensor is opened in no time, and only
+the pages touched by the analysis are read. Compressed partitions (np.savez_compressed) are smaller still, but read
+into memory entirely.
+Partitions are written into a temporary file, synced, then renamed: a partition is either entirely there, or not at
+all. Rows of a day are deleted from the live DB only once every partition of the day is written.
+by Sziller
+"""
+
+import os
+import time
+import math
+import struct
+import calendar
+import logging
+import inspect
+import zipfile
+import threading
+from array import array
+from urllib.parse import quote
+from urllib.parse import unquote
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy import select
+from shmc_sqlAccess import SQL_interface as SQLi
+
+# Setting up logger                                         logger                      -   START   -
+lg = logging.getLogger()
+# Setting up logger                                         logger                      -   ENDED   -
+
+DAY: float = 86400.0
+ARCHIVE_COLUMNS: tuple = ("timestamp", "mea_val", "series", "series_type", "series_dim")
+
+
+def day_start(timestamp: float) -> float:
+    """Returns the start of the UTC day <timestamp> is in"""
+    return math.floor(timestamp / DAY) * DAY
+
+
+def load_npz(path: str, mmap: bool = True) -> dict:
+    """=== Function name: load_npz =====================================================================================
+    Loads every array of an .npz file. Arrays stored uncompressed are memory mapped (read-only) if <mmap> is True -
+    np.load() cannot do that for .npz files - compressed ones are read into memory.
+    :return: dict - name: array
+    ============================================================================================== by Sziller ==="""
+    arrays = {}
+    with zipfile.ZipFile(path) as zip_file, open(path, "rb") as raw:
+        for info in zip_file.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with zip_file.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            raw.seek(info.header_offset + 26)  # local file header: name and extra field lengths at byte 26
+            name_length, extra_length = struct.unpack("<HH", raw.read(4))
+            raw.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(raw)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(raw)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(raw)
+            if dtype.hasobject:
+                raise ValueError("{}: object array {!r} cannot be memory mapped".format(path, name))
+            if not math.prod(shape):
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=raw.tell(),
+                                     order="F" if fortran_order else "C")
+    return arrays
+
+
+class MeasurementArchive:
+    """=== Class name: MeasurementArchive ==============================================================================
+    Partition files of archived measurements under <root>: written by < write_partition() >, read by < scan() > and
+    < read() >. Safe to use from several threads.
+    :param root: str - directory of the archive - created if missing
+    :param compress: bool - write compressed partitions: smaller, but not memory mapped when read
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self, root: str, compress: bool = False):
+        self.root: str                  = root
+        self.compress: bool             = compress
+        self.n_partitions_written: int  = 0
+        self.n_rows_written: int        = 0
+        self._lock                      = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def partition_path(self, day: float, mea_loc: str) -> str:
+        """Returns the file of the partition of <mea_loc> on the UTC day starting at <day>"""
+        return os.path.join(self.root, time.strftime("%Y-%m-%d", time.gmtime(day)), quote(mea_loc, safe="") + ".npz")
+
+    def partitions(self, t_from: float or None = None, t_to: float or None = None,
+                   mea_loc: str or None = None) -> list:
+        """=== Method name: partitions =================================================================================
+        Lists the partitions holding rows between <t_from> (included) and <t_to> (excluded) - every one if None.
+        :param mea_loc: str - only the partitions of this location. None: every location
+        :return: list - of (day, mea_loc, path) tuples, ordered by day and location
+        ========================================================================================== by Sziller ==="""
+        found = []
+        for day_name in sorted(os.listdir(self.root)):
+            try:
+                day = float(calendar.timegm(time.strptime(day_name, "%Y-%m-%d")))
+            except ValueError:  # not a day directory
+                continue
+            if (t_from is not None and day + DAY <= t_from) or (t_to is not None and day >= t_to):
+                continue
+            for file_name in sorted(os.listdir(os.path.join(self.root, day_name))):
+                if not file_name.endswith(".npz"):  # temporary files of partitions being written
+                    continue
+                location = unquote(file_name[:-4])
+                if mea_loc is None or location == mea_loc:
+                    found.append((day, location, os.path.join(self.root, day_name, file_name)))
+        return found
+
+    @staticmethod
+    def load_partition(path: str, mmap: bool = True) -> dict:
+        """Returns the columns of the partition in <path>, see ARCHIVE_COLUMNS - memory mapped if stored uncompressed"""
+        return load_npz(path=path, mmap=mmap)
+
+    def write_partition(self, day: float, mea_loc: str, columns: dict) -> int:
+        """=== Method name: write_partition ============================================================================
+        Writes rows of <mea_loc> on <day> into their partition. If the partition exists, rows are merged into it:
+        rows already archived - same series, timestamp and value - are kept once, so archiving a day again is
+        harmless.
+        :param columns: dict - "timestamp", "mea_val", "series" arrays, and the "series_type", "series_dim" table
+        :return: int - number of rows in the partition
+        ========================================================================================== by Sziller ==="""
+        path = self.partition_path(day=day, mea_loc=mea_loc)
+        with self._lock:
+            if os.path.exists(path):
+                columns = merge_columns(self.load_partition(path=path, mmap=False), columns)
+            order = np.lexsort((columns["series"], columns["timestamp"]))
+            series = columns["series"][order]
+            arrays = {"timestamp": np.ascontiguousarray(columns["timestamp"][order], dtype=np.float64),
+                      "mea_val": np.ascontiguousarray(columns["mea_val"][order], dtype=np.float64),
+                      "series": series.astype(np.uint16 if len(columns["series_type"]) <= 0xFFFF else np.uint32),
+                      "series_type": np.asarray(columns["series_type"], dtype=str),
+                      "series_dim": np.asarray(columns["series_dim"], dtype=str)}
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as file:
+                (np.savez_compressed if self.compress else np.savez)(file, **arrays)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+            directory = os.open(os.path.dirname(path), os.O_RDONLY)
+            try:
+                os.fsync(directory)  # the rename itself survives power loss
+            finally:
+                os.close(directory)
+            self.n_partitions_written += 1
+            self.n_rows_written += len(arrays["timestamp"])
+            return len(arrays["timestamp"])
+
+    def scan(self, t_from: float or None = None, t_to: float or None = None, mea_loc: str or None = None):
+        """=== Method name: scan =======================================================================================
+        Generator. Yields the partitions between <t_from> and <t_to>, one at a time, cut to the range - for vectorized
+        analysis partition by partition: memory mapped columns are sliced, not copied.
+        :yield: (day, mea_loc, columns) - columns: dict of arrays, see ARCHIVE_COLUMNS
+        ========================================================================================== by Sziller ==="""
+        for day, location, path in self.partitions(t_from=t_from, t_to=t_to, mea_loc=mea_loc):
+            columns = self.load_partition(path=path)
+            timestamps = columns["timestamp"]
+            first = 0 if t_from is None else int(np.searchsorted(timestamps, t_from, side="left"))
+            last = len(timestamps) if t_to is None else int(np.searchsorted(timestamps, t_to, side="left"))
+            for key in ("timestamp", "mea_val", "series"):
+                columns[key] = columns[key][first:last]
+            yield day, location, columns
+
+    def read(self, t_from: float or None = None, t_to: float or None = None, mea_loc: str or None = None,
+             mea_type: str or None = None) -> dict:
+        """=== Method name: read =======================================================================================
+        Reads archived rows between <t_from> (included) and <t_to> (excluded) into one set of columns.
+        :param mea_loc: str - only rows of this location. None: every location
+        :param mea_type: str - only rows of this type. None: every type
+        :return: dict - "timestamp", "mea_val" float64 arrays, "mea_loc", "mea_type", "mea_dim" str arrays -
+                 ordered by location, then timestamp
+        ========================================================================================== by Sziller ==="""
+        parts = {"timestamp": [], "mea_val": [], "mea_loc": [], "mea_type": [], "mea_dim": []}
+        for _, location, columns in self.scan(t_from=t_from, t_to=t_to, mea_loc=mea_loc):
+            series, series_type = columns["series"], columns["series_type"]
+            if mea_type is not None:
+                selected = np.flatnonzero(series_type == mea_type)
+                if not len(selected):
+                    continue
+                mask = np.isin(series, selected)
+                columns = {"timestamp": columns["timestamp"][mask], "mea_val": columns["mea_val"][mask],
+                           "series": series[mask], "series_type": series_type, "series_dim": columns["series_dim"]}
+            n_rows = len(columns["timestamp"])
+            parts["timestamp"].append(np.asarray(columns["timestamp"]))
+            parts["mea_val"].append(np.asarray(columns["mea_val"]))
+            parts["mea_loc"].append(np.full(n_rows, location))
+            parts["mea_type"].append(columns["series_type"][columns["series"]])
+            parts["mea_dim"].append(columns["series_dim"][columns["series"]])
+        empty = {"timestamp": np.float64, "mea_val": np.float64, "mea_loc": str, "mea_type": str, "mea_dim": str}
+        return {key: np.concatenate(value) if value else np.empty(0, dtype=empty[key]) for key, value in parts.items()}
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: settings and counters of the archive
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            return {"root": self.root,
+                    "compress": self.compress,
+                    "partitions_written": self.n_partitions_written,
+                    "rows_written": self.n_rows_written}
+
+
+def merge_columns(old: dict, new: dict) -> dict:
+    """=== Function name: merge_columns ================================================================================
+    Merges two sets of partition columns into one, on a common series table. Identical rows - same series,
+    timestamp and value - are kept once.
+    ============================================================================================== by Sziller ==="""
+    table = {}
+    for series_type, series_dim in zip(list(old["series_type"]) + list(new["series_type"]),
+                                       list(old["series_dim"]) + list(new["series_dim"])):
+        table.setdefault((str(series_type), str(series_dim)), len(table))
+    remap_old = np.array([table[(str(t), str(d))] for t, d in zip(old["series_type"], old["series_dim"])],
+                         dtype=np.int64)
+    remap_new = np.array([table[(str(t), str(d))] for t, d in zip(new["series_type"], new["series_dim"])],
+                         dtype=np.int64)
+    timestamps = np.concatenate((old["timestamp"], new["timestamp"]))
+    values = np.concatenate((old["mea_val"], new["mea_val"]))
+    series = np.concatenate((remap_old[old["series"]] if len(old["series"]) else np.empty(0, dtype=np.int64),
+                             remap_new[new["series"]] if len(new["series"]) else np.empty(0, dtype=np.int64)))
+    order = np.lexsort((values, series, timestamps))
+    timestamps, values, series = timestamps[order], values[order], series[order]
+    duplicate = np.zeros(len(timestamps), dtype=bool)
+    duplicate[1:] = ((timestamps[1:] == timestamps[:-1]) & (series[1:] == series[:-1])
+                     & ((values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))))
+    keep = ~duplicate
+    return {"timestamp": timestamps[keep],
+            "mea_val": values[keep],
+            "series": series[keep],
+            "series_type": [_[0] for _ in table],
+            "series_dim": [_[1] for _ in table]}
+
+
+def ARCHIVE_measurements(row_obj,
+                         session,
+                         archive: MeasurementArchive,
+                         before: float,
+                         chunk_size: int = 2000,
+                         pause: float = 0.0,
+                         cancel_event=None) -> dict:
+    """=== Function name: ARCHIVE_measurements =========================================================================
+    SQL action. Moves measurements of every whole UTC day ending before <before> from the live DB into <archive>,
+    oldest day first: the rows of a day are written into its partitions - one per location - then exactly the rows
+    written are deleted, by their primary keys, in chunks. Rollups are not touched.
+    Rows of a day arriving while it is archived stay in the DB, and are merged into its partitions by the next run.
+    :param row_obj: Base - the class of the raw rows, e.g. Measurement
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param archive: MeasurementArchive - the archive written into
+    :param before: float - UNIX time: days ending after it are left in the DB
+    :param chunk_size: int - rows deleted per transaction
+    :param pause: float - seconds slept between two deleting transactions
+    :param cancel_event: threading.Event - if set, archiving stops after the current day
+    :return: dict - "days", "partitions", "rows": numbers archived
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    pk_column = table.primary_key.columns.values()[0]
+    cutoff = day_start(before)
+    archived = {"days": 0, "partitions": 0, "rows": 0}
+    while not (cancel_event is not None and cancel_event.is_set()):
+        oldest = session.execute(select(func.min(table.c.timestamp)).where(table.c.timestamp < cutoff)).scalar()
+        if oldest is None:
+            session.commit()
+            break
+        day = day_start(oldest)
+        statement = (select(pk_column, table.c.mea_loc, table.c.mea_type, table.c.mea_dim, table.c.mea_val,
+                            table.c.timestamp)
+                     .where(table.c.timestamp >= day, table.c.timestamp < day + DAY))
+        locations = {}  # mea_loc: (timestamps, values, series codes, {(mea_type, mea_dim): code})
+        primary_keys = []  # of the rows read: only these are deleted
+        for primary_key, mea_loc, mea_type, mea_dim, mea_val, timestamp in session.execute(statement):
+            primary_keys.append(primary_key)
+            location = locations.get(mea_loc)
+            if location is None:
+                location = locations[mea_loc] = (array("d"), array("d"), array("I"), {})
+            timestamps, values, codes, series = location
+            code = series.get((mea_type, mea_dim))
+            if code is None:
+                code = series[(mea_type, mea_dim)] = len(series)
+            timestamps.append(timestamp)
+            values.append(math.nan if mea_val is None else mea_val)
+            codes.append(code)
+        session.commit()
+        n_rows = 0
+        for mea_loc, (timestamps, values, codes, series) in locations.items():
+            n_rows += len(timestamps)
+            archive.write_partition(day=day, mea_loc=mea_loc,
+                                    columns={"timestamp": np.frombuffer(timestamps, dtype=np.float64),
+                                             "mea_val": np.frombuffer(values, dtype=np.float64),
+                                             "series": np.frombuffer(codes, dtype=np.uintc),
+                                             "series_type": [_[0] for _ in series],
+                                             "series_dim": [_[1] or "" for _ in series]})
+        n_deleted = 0
+        for nr, chunk in enumerate(SQLi._chunks(primary_keys, chunk_size)):
+            if nr and pause:
+                time.sleep(pause)
+            n_deleted += SQLi.DELETE_multiple_rows_by_filterkey(filterkey=pk_column.name, filtervalue_list=chunk,
+                                                                row_obj=row_obj, session=session)
+        if n_deleted != n_rows:  # deleted by others meanwhile - e.g. retention: archived anyway
+            lg.warning("archive   : {} rows archived, {} deleted for {}".format(
+                n_rows, n_deleted, time.strftime("%Y-%m-%d", time.gmtime(day))))
+        archived["days"] += 1
+        archived["partitions"] += len(locations)
+        archived["rows"] += n_rows
+        lg.info("archive   : {} rows of {} archived in {} partitions".format(
+            n_rows, time.strftime("%Y-%m-%d", time.gmtime(day)), len(locations)))
+    return archived
@@ -0,0 +1,264 @@
+"""
+Benchmarks of SQL_interface functions, run on a temporary SQLite DB with Measurement rows.
+Run: python -m shmc_sqlAccess.SQL_benchmark [n_rows ...]
+by Sziller
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+from sqlalchemy import event
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases import sql_baseMeasurement
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def generate_measurements(n_rows: int, t_start: float = 1_700_000_000.0) -> list:
+    """=== Function name: generate_measurements ========================================================================
+    Returns <n_rows> Measurement row dicts with distinct timestamps.
+    ============================================================================================== by Sziller ==="""
+    return [{"mea_type": "temperature",
+             "mea_loc": "room{}".format(_ % 4),
+             "mea_val": 20.0 + (_ % 50) / 10,
+             "mea_dim": "C",
+             "mea_time": "",
+             "timestamp": t_start + _} for _ in range(n_rows)]
+
+
+def new_session(directory: str, name: str):
+    """Returns a session on a new SQLite DB file in <directory>"""
+    return SQLi.createSession(db_fullname=os.path.join(directory, name + ".db"),
+                              tables=[Measurement.__table__],
+                              style="SQLite")
+
+
+def bench_add_rows(n_rows: int, directory: str):
+    """=== Function name: bench_add_rows ===============================================================================
+    Compares ADD_rows_to_table() and ADD_rows_to_table_bulk(): half of the rows are inserted first, then all rows
+    are inserted again - so both the existence check and the insert path are measured.
+    ============================================================================================== by Sziller ==="""
+    data = generate_measurements(n_rows)
+    candidates = {"ADD_rows_to_table": lambda rows, session: SQLi.ADD_rows_to_table(
+                      primary_key="mea_hash", data_list=rows, row_obj=Measurement, session=session),
+                  "ADD_rows_to_table_bulk": lambda rows, session: SQLi.ADD_rows_to_table_bulk(
+                      primary_key="mea_hash", data_list=rows, row_obj=Measurement, session=session),
+                  "ADD_rows_to_table_bulk (select)": lambda rows, session: SQLi.ADD_rows_to_table_bulk(
+                      primary_key="mea_hash", data_list=rows, row_obj=Measurement, session=session,
+                      native_upsert=False)}
+    for name, function in candidates.items():
+        session = new_session(directory=directory, name="{}_{}".format(name.split()[-1], n_rows))
+        function(data[: n_rows // 2], session)
+        t0 = time.perf_counter()
+        function(data, session)
+        elapsed = time.perf_counter() - t0
+        n_stored = session.query(Measurement).count()
+        session.close()
+        print("{:>8} rows  {:<34}{:>10.3f} s{:>12.0f} rows/s  stored: {}".format(
+            n_rows, name, elapsed, n_rows / elapsed, n_stored))
+
+
+class StatementCounter:
+    """=== Class name: StatementCounter ================================================================================
+    Counts statements sent to the DB by <session>'s engine (an executemany counts as one).
+    ============================================================================================== by Sziller ==="""
+    def __init__(self, session):
+        self.engine = session.get_bind()
+        self.count: int = 0
+        event.listen(self.engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self.on_execute)
+
+
+def _legacy_delete(filterkey, filtervalue_list, row_obj, session):
+    """Former DELETE_multiple_rows_by_filterkey(): one statement per value"""
+    for filtervalue in filtervalue_list:
+        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).delete(synchronize_session=False)
+    session.commit()
+
+
+def _legacy_modify_to_value(filterkey, filtervalue_list, target_key, target_value, row_obj, session):
+    """Former MODIFY_multiple_rows_by_column_to_value(): one statement per value"""
+    for filtervalue in filtervalue_list:
+        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).update({target_key: target_value})
+    session.commit()
+
+
+def _legacy_modify_by_dict(filterkey, mod_dict, row_obj, session):
+    """Former MODIFY_multiple_rows_by_column_by_dict(): one statement per value"""
+    for filtervalue, sub_dict in mod_dict.items():
+        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).update(sub_dict)
+    session.commit()
+
+
+def bench_delete_modify(n_rows: int, directory: str):
+    """=== Function name: bench_delete_modify ==========================================================================
+    Compares statement count and time of the set-based DELETE / MODIFY functions against the former per-value loops.
+    Every function is run on half of the rows of a fresh table.
+    ============================================================================================== by Sziller ==="""
+    data = generate_measurements(n_rows)
+    for label, variant in (("per-value loop", "legacy"), ("set-based", "current")):
+        session = new_session(directory=directory, name="modify_{}_{}".format(variant, n_rows))
+        SQLi.ADD_rows_to_table_bulk(primary_key="mea_hash", data_list=data, row_obj=Measurement, session=session)
+        keys = [_["mea_hash"] for _ in SQLi.QUERY_entire_table(ordered_by="timestamp", row_obj=Measurement,
+                                                               session=session)][: n_rows // 2]
+        mod_dict = {key: {"mea_val": float(nr), "mea_dim": "K"} for nr, key in enumerate(keys)}
+        runs = {"legacy": (("MODIFY ... to_value", lambda: _legacy_modify_to_value(
+                                "mea_hash", keys, "mea_dim", "F", Measurement, session)),
+                           ("MODIFY ... by_dict", lambda: _legacy_modify_by_dict(
+                                "mea_hash", mod_dict, Measurement, session)),
+                           ("DELETE ... by_filterkey", lambda: _legacy_delete(
+                                "mea_hash", keys, Measurement, session))),
+                "current": (("MODIFY ... to_value", lambda: SQLi.MODIFY_multiple_rows_by_column_to_value(
+                                 "mea_hash", keys, "mea_dim", "F", Measurement, session)),
+                            ("MODIFY ... by_dict", lambda: SQLi.MODIFY_multiple_rows_by_column_by_dict(
+                                 "mea_hash", mod_dict, Measurement, session)),
+                            ("DELETE ... by_filterkey", lambda: SQLi.DELETE_multiple_rows_by_filterkey(
+                                 "mea_hash", keys, Measurement, session)))}[variant]
+        for name, function in runs:
+            counter = StatementCounter(session)
+            t0 = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - t0
+            counter.close()
+            print("{:>8} rows  {:<26}{:<16}{:>10.3f} s{:>10} statements".format(
+                n_rows // 2, name, label, elapsed, counter.count))
+        session.close()
+
+
+def bench_group_commit(n_rows: int, directory: str, n_callers: int = 4):
+    """=== Function name: bench_group_commit ===========================================================================
+    Compares sustained single-row inserts: one transaction per call on default SQLite settings, against
+    GroupCommitWriter on the "performance" profile. <n_callers> threads insert concurrently.
+    ============================================================================================== by Sziller ==="""
+    import threading
+    from shmc_sqlAccess.SQL_groupCommit import GroupCommitWriter
+    data = generate_measurements(n_rows)
+    slices = [data[_::n_callers] for _ in range(n_callers)]
+
+    session = new_session(directory=directory, name="commit_each_{}".format(n_rows))
+    lock = threading.Lock()  # one session: calls are serialized, as they would be on a single connection
+
+    def commit_each(rows):
+        for row in rows:
+            with lock:
+                SQLi.ADD_rows_to_table_bulk(primary_key="mea_hash", data_list=[row], row_obj=Measurement,
+                                            session=session)
+
+    writer = GroupCommitWriter(db_fullname=os.path.join(directory, "group_{}.db".format(n_rows)),
+                               tables=[Measurement.__table__], profile="performance", max_delay=0.05)
+
+    def group_commit(rows):
+        futures = [writer.submit(primary_key="mea_hash", data_list=[row], row_obj=Measurement) for row in rows]
+        for future in futures:
+            future.result()
+
+    for name, function in (("commit per call (default)", commit_each),
+                           ("GroupCommitWriter (WAL)", group_commit)):
+        threads = [threading.Thread(target=function, args=(_,)) for _ in slices]
+        t0 = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - t0
+        print("{:>8} rows  {:<34}{:>10.3f} s{:>12.0f} rows/s".format(n_rows, name, elapsed, n_rows / elapsed))
+    print("{:>8} rows  GroupCommitWriter: {}".format(n_rows, writer.as_dict()))
+    writer.close()
+    session.close()
+
+
+def _legacy_construct_all(data: list) -> list:
+    """Former Measurement.__init__(): legacy ID, generated twice - first on unset attributes, then on final ones"""
+    def construct(row):
+        sql_baseMeasurement.measurement_id_legacy(None, None, None, None)  # first, discarded call
+        return Measurement.construct(d_in=row)
+    former, Measurement.id_scheme = Measurement.id_scheme, "legacy"
+    try:
+        return [construct(_) for _ in data]
+    finally:
+        Measurement.id_scheme = former
+
+
+def bench_measurement_ids(n_rows: int):
+    """=== Function name: bench_measurement_ids ========================================================================
+    Rows constructed per second, and IDs computed per second, of every ID scheme - against the former double call.
+    Rows are generated with 4 locations measuring at the same instant: distinct IDs show the collisions of a scheme.
+    ============================================================================================== by Sziller ==="""
+    data = [dict(_, timestamp=1_700_000_000.0 + _n // 4) for _n, _ in enumerate(generate_measurements(n_rows))]
+    runs = [("Measurement() former: 2x sha256", lambda: _legacy_construct_all(data=data))]
+    for scheme in sql_baseMeasurement.ID_SCHEMES:
+        runs.append(("Measurement() id_scheme={}".format(scheme),
+                     lambda scheme=scheme: _construct_all(data=data, id_scheme=scheme)))
+        runs.append(("  ID only   id_scheme={}".format(scheme),
+                     lambda scheme=scheme: [sql_baseMeasurement.ID_SCHEMES[scheme](
+                         _["mea_type"], _["mea_loc"], _["mea_val"], _["timestamp"]) for _ in data]))
+    for name, function in runs:
+        t0 = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - t0
+        n_unique = len({getattr(_, "mea_hash", _) for _ in result})
+        print("{:>8} rows  {:<36}{:>10.3f} s{:>12.0f} rows/s  unique IDs: {}".format(
+            n_rows, name, elapsed, n_rows / elapsed, n_unique))
+
+
+def _construct_all(data: list, id_scheme: str) -> list:
+    """Constructs a Measurement of every row of <data> by <id_scheme>"""
+    former, Measurement.id_scheme = Measurement.id_scheme, id_scheme
+    try:
+        return [Measurement.construct(d_in=_) for _ in data]
+    finally:
+        Measurement.id_scheme = former
+
+
+def bench_ingest_records(n_rows: int, directory: str):
+    """=== Function name: bench_ingest_records =========================================================================
+    Compares ingest of new readings (no primary key yet) through ORM instances - ADD_rows_to_table_bulk() - against
+    MeasurementRecord-s - ADD_records_to_table(). Rows are built, then inserted. Measured: time of building and
+    inserting, and peak memory allocated while building (separate, traced run).
+    ============================================================================================== by Sziller ==="""
+    data = generate_measurements(n_rows)
+    candidates = {"ORM: construct() + return_as_dict()": (
+                      lambda: SQLi._rows_with_primary_key(primary_key="mea_hash", data_list=data, row_obj=Measurement),
+                      lambda rows, session: SQLi.ADD_rows_to_table_bulk(
+                          primary_key="mea_hash", data_list=rows, row_obj=Measurement, session=session)),
+                  "MeasurementRecord.construct()": (
+                      lambda: [MeasurementRecord.construct(d_in=_) for _ in data],
+                      lambda records, session: SQLi.ADD_records_to_table(
+                          primary_key="mea_hash", records=records, row_obj=Measurement, session=session))}
+    for name, (build, add) in candidates.items():
+        session = new_session(directory=directory, name="ingest_{}_{}".format(name.split(":")[0].split(".")[0], n_rows))
+        tracemalloc.start()
+        build()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        t0 = time.perf_counter()
+        rows = build()
+        t_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        add(rows, session)
+        t_add = time.perf_counter() - t0
+        session.close()
+        print("{:>8} rows  {:<36} build: {:>7.3f} s{:>9.1f} MB  insert: {:>7.3f} s{:>12.0f} rows/s".format(
+            n_rows, name, t_build, peak / 2 ** 20, t_add, n_rows / (t_build + t_add)))
+
+
+if __name__ == "__main__":
+    sizes = [int(_) for _ in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        bench_measurement_ids(n_rows=size)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            bench_add_rows(n_rows=size, directory=tmp_dir)
+        for size in sizes:
+            bench_ingest_records(n_rows=size, directory=tmp_dir)
+        for size in sizes:
+            bench_delete_modify(n_rows=size, directory=tmp_dir)
+        for size in sizes:
+            bench_group_commit(n_rows=min(size, 10_000), directory=tmp_dir)
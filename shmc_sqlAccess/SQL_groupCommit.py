@@ -0,0 +1,250 @@
+"""
+Group commit writer: coalesces inserts of many callers into one transaction per time window.
+Every commit of SQLite is a journal write, and - depending on PRAGMA synchronous - an fsync of the SD card. Writing
+each measurement in its own transaction limits throughput to the fsync rate and wears the card.
+GroupCommitWriter collects submitted rows in memory, and writes them by a single background thread, in one
+transaction per window. Durability is bounded by:
+- max_delay: rows submitted are committed at the latest <max_delay> seconds later (plus the time of the commit)
+- max_batch_rows: a window is closed early once it holds this many rows
+- max_pending_rows: submit() blocks once this many rows wait: memory use is bounded, too
+- the SQLite profile of the DB (see SQL_interface.SQLITE_PROFILES): "performance" may lose the last commits on
+  power loss, "durable" does not
+Callers get a Future, resolved with the primary keys added once their rows are committed.
+If the writer thread dies - e.g. the DB cannot be opened - every Future waiting is failed, and later submissions are
+refused: no caller waits forever for a writer that is gone.
+by Sziller
+"""
+
+import time
+import logging
+import inspect
+import threading
+from collections import deque
+from concurrent.futures import Future
+from shmc_sqlAccess import SQL_interface as SQLi
+
+# Setting up logger                                         logger                      -   START   -
+lg = logging.getLogger()
+# Setting up logger                                         logger                      -   ENDED   -
+
+
+class GroupCommitWriter:
+    """=== Class name: GroupCommitWriter ===============================================================================
+    Background writer grouping < SQL_interface.ADD_rows_to_table_bulk() > calls into one transaction per window.
+    :param db_fullname: str - DB to write into, see < SQL_interface.createSession() >
+    :param tables: list - of __table__-s to be created on session init
+    :param style: str - "SQLite" or "PostgreSQL"
+    :param profile: str or dict - SQLite PRAGMA profile, see < SQL_interface.createSession() >
+    :param max_delay: float - max. seconds a submitted row waits for its commit
+    :param max_batch_rows: int - max. rows committed in one transaction
+    :param max_pending_rows: int - max. rows waiting: submit() blocks above this
+    :param pool_kwargs: dict - connection pool settings, see < SQL_interface.createSession() >
+    :param before_commit: callable(session, added: dict) - called in the transaction of every batch, before its
+                          commit, with the rows actually added: {row_obj: list of row dicts}. Write rows derived from
+                          them here (e.g. aggregates) to commit them atomically with the batch. If it raises, the
+                          batch is rolled back and its submitters get the exception.
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 db_fullname: str,
+                 tables: list or None       = None,
+                 style: str                 = "SQLite",
+                 profile: str or dict       = "performance",
+                 max_delay: float           = 0.5,
+                 max_batch_rows: int        = 5000,
+                 max_pending_rows: int      = 50000,
+                 pool_kwargs: dict or None  = None,
+                 before_commit              = None):
+        self.db_fullname: str           = db_fullname
+        self.tables: list or None       = tables
+        self.style: str                 = style
+        self.profile                    = profile if style == "SQLite" else None
+        self.max_delay: float           = max_delay
+        self.max_batch_rows: int        = max_batch_rows
+        self.max_pending_rows: int      = max_pending_rows
+        self.pool_kwargs: dict or None  = pool_kwargs
+        self.before_commit              = before_commit
+        self.pending: deque             = deque()  # of (primary_key, data_list, row_obj, future)
+        self.n_pending_rows: int        = 0
+        self.first_pending_at: float    = 0.0
+        self.is_writing: bool           = False
+        self.flush_requested: bool      = False
+        self.is_closed: bool            = False
+        self.error: Exception or None   = None  # set if the writer thread died: nothing is written any more
+        self.batch: list                = []  # submissions being written
+        self.n_commits: int             = 0
+        self.n_rows_committed: int      = 0
+        self.n_failed_commits: int      = 0
+        self._condition                 = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="GroupCommitWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, primary_key: str, data_list: list, row_obj) -> Future:
+        """=== Method name: submit =====================================================================================
+        Queues rows to be added, as < SQL_interface.ADD_rows_to_table_bulk() > would. Blocks while the writer is
+        full (<max_pending_rows>).
+        :param primary_key: str - the primary key of the row, defined by row_obj
+        :param data_list: list[dict] row information in list of dictionaries format
+        :param row_obj: Base - the class attached to the table
+        :return: Future - resolved with the list of primary keys added, after commit. Exception if commit failed.
+        :raise RuntimeError: the writer is closed, or its thread has died
+        ========================================================================================== by Sziller ==="""
+        future = Future()
+        with self._condition:
+            while (self.error is None and self.n_pending_rows
+                   and self.n_pending_rows + len(data_list) > self.max_pending_rows):
+                self._condition.wait()
+            if self.error is not None:
+                raise RuntimeError("writer is dead: {!r}".format(self.error)) from self.error
+            if self.is_closed:
+                raise RuntimeError("writer is closed")
+            if not self.pending:
+                self.first_pending_at = time.monotonic()
+            self.pending.append((primary_key, data_list, row_obj, future))
+            self.n_pending_rows += len(data_list)
+            self._condition.notify_all()
+        return future
+
+    def run(self):
+        """=== Method name: run ========================================================================================
+        Writer thread's main: runs < write_windows() > on a session of its own. If anything escapes it - the session
+        cannot be created, a rollback fails - the writer is marked dead, and every submission waiting, or being
+        written, gets the exception.
+        ========================================================================================== by Sziller ==="""
+        try:
+            session = SQLi.createSession(db_fullname=self.db_fullname, tables=self.tables, style=self.style,
+                                         profile=self.profile, pool_kwargs=self.pool_kwargs)
+            try:
+                self.write_windows(session=session)
+            finally:
+                session.close()
+        except Exception as e:
+            lg.critical("writer    : died, nothing is written any more: {!r} - says {}".format(e, self.ccn))
+            with self._condition:
+                self.error = e
+                failed = self.batch + list(self.pending)
+                self.batch = []
+                self.pending.clear()
+                self.n_pending_rows = 0
+                self.is_writing = False
+                self._condition.notify_all()
+            for *_, future in failed:
+                if not future.done():
+                    future.set_exception(e)
+
+    def write_windows(self, session):
+        """=== Method name: write_windows ==============================================================================
+        Writer thread's loop: waits for a window to close (age or size), then commits it in one transaction.
+        ========================================================================================== by Sziller ==="""
+        while True:
+            with self._condition:
+                while not self.pending and not self.is_closed:
+                    self._condition.wait()
+                if not self.pending and self.is_closed:
+                    break
+                while (not self.is_closed
+                       and not self.flush_requested
+                       and self.n_pending_rows < self.max_batch_rows
+                       and time.monotonic() - self.first_pending_at < self.max_delay):
+                    self._condition.wait(timeout=self.max_delay - (time.monotonic() - self.first_pending_at))
+                batch, n_rows = self.take_batch()
+                self.batch = batch
+                self.is_writing = True
+                self._condition.notify_all()  # space was freed for blocked submitters
+            if batch:  # empty if every submission taken was cancelled
+                self.write_batch(session=session, batch=batch, n_rows=n_rows)
+            with self._condition:
+                self.batch = []
+                self.is_writing = False
+                self._condition.notify_all()
+
+    def take_batch(self) -> tuple:
+        """Takes submissions from <self.pending> up to <self.max_batch_rows> rows. Call with the lock held.
+        Submissions whose Future was cancelled are dropped; the ones taken can no longer be cancelled"""
+        batch, n_rows, n_dropped_rows = [], 0, 0
+        while self.pending and (not batch or n_rows + len(self.pending[0][1]) <= self.max_batch_rows):
+            submission = self.pending.popleft()
+            if not submission[3].set_running_or_notify_cancel():  # cancelled by the submitter: not written
+                n_dropped_rows += len(submission[1])
+                continue
+            batch.append(submission)
+            n_rows += len(submission[1])
+        self.n_pending_rows -= n_rows + n_dropped_rows
+        self.first_pending_at = time.monotonic()
+        self.flush_requested = bool(self.pending) and self.flush_requested
+        return batch, n_rows
+
+    def write_batch(self, session, batch: list, n_rows: int):
+        """=== Method name: write_batch ================================================================================
+        Writes every submission of <batch> in a single transaction, then resolves their Futures.
+        Submissions to the same table are merged: one bulk insert per table, whatever the number of callers.
+        ========================================================================================== by Sziller ==="""
+        groups = {}  # (row_obj, primary_key): list of (future, primary keys of the submission's rows)
+        rows_of_group = {}
+        added_rows = {}  # row_obj: list of row dicts added - for <self.before_commit>
+        try:
+            for primary_key, data_list, row_obj, future in batch:
+                rows = SQLi._rows_with_primary_key(primary_key=primary_key, data_list=data_list, row_obj=row_obj)
+                groups.setdefault((row_obj, primary_key), []).append((future, [_[primary_key] for _ in rows]))
+                rows_of_group.setdefault((row_obj, primary_key), []).extend(rows)
+            added = set()
+            for (row_obj, primary_key), rows in rows_of_group.items():
+                unique_rows = list({_[primary_key]: _ for _ in reversed(rows)}.values())
+                added_keys = set(SQLi._insert_rows_bulk(primary_key=primary_key, rows=unique_rows,
+                                                        table=row_obj.__table__, session=session, chunk_size=500,
+                                                        native_upsert=True))
+                added.update(added_keys)
+                added_rows.setdefault(row_obj, []).extend(_ for _ in unique_rows if _[primary_key] in added_keys)
+            if self.before_commit is not None:
+                self.before_commit(session, added_rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.n_failed_commits += 1
+            lg.error("Error committing {} rows - says {}:\n {}".format(n_rows, self.ccn, e))
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        self.n_commits += 1
+        self.n_rows_committed += len(added)  # rows already in the table are not counted
+        for submissions in groups.values():
+            for future, keys in submissions:  # a key submitted twice is reported to the first submitter only
+                future.set_result([_ for _ in keys if _ in added])
+                added.difference_update(keys)
+
+    def flush(self, timeout: float or None = None) -> bool:
+        """=== Method name: flush ======================================================================================
+        Closes the current window at once and waits until everything submitted so far is committed.
+        :param timeout: float - max. seconds to wait, None: no limit
+        :return: bool - True if nothing is left to write, False on timeout
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            self.flush_requested = True  # current window is closed at once
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self.pending and not self.is_writing, timeout=timeout)
+
+    @property
+    def is_alive(self) -> bool:
+        """False once the writer thread has died, see <self.error>"""
+        return self.error is None
+
+    def close(self, timeout: float or None = None):
+        """=== Method name: close ======================================================================================
+        Commits everything submitted, and stops the writer thread.
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            self.is_closed = True
+            self._condition.notify_all()
+        self.thread.join(timeout=timeout)
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: counters of the writer
+        ========================================================================================== by Sziller ==="""
+        with self._condition:
+            return {"pending_rows": self.n_pending_rows,
+                    "commits": self.n_commits,
+                    "rows_committed": self.n_rows_committed,
+                    "failed_commits": self.n_failed_commits,
+                    "error": repr(self.error) if self.error is not None else None}
@@ -4,10 +4,28 @@ you should be able to swap DB handling while using this SQLi from SQLite to Post
 by Sziller
 """
 
+import time
 import logging
 import inspect
+import sqlite3
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import cast
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import or_
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.dialects import sqlite as dialect_sqlite
+from sqlalchemy.dialects import postgresql as dialect_postgresql
 from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -19,29 +37,158 @@ Base = declarative_base()
 
 # SESSION creation START                                                                    -   START   -
 
+# Engines (and their connection pools) are created once per process and DB url, then reused by every session.
+# ATTENTION: do not share them between processes: create sessions only after forking, or call dispose_engines().
+_ENGINES: dict              = {}  # url: engine
+_SESSIONMAKERS: dict        = {}  # url: sessionmaker bound to the engine
+_CREATED_TABLES: dict       = {}  # url: set of table names already created / checked
+_PROFILES: dict             = {}  # url: SQLite PRAGMA-s applied to its connections
+_ENGINES_LOCK               = threading.Lock()
 
-def createSession(db_fullname: str, tables: list or None = None, style: str = "SQLite", base=Base):
+# pool settings per dialect - override by <pool_kwargs> of createSession()
+POOL_DEFAULTS: dict = {
+    # SQLite allows one writer at a time: one connection kept open, a few overflow connections for parallel readers.
+    # Multi-threaded users size it by <pool_kwargs>: one kept connection per thread holding a session at once
+    "SQLite": {"poolclass": QueuePool, "pool_size": 1, "max_overflow": 2, "pool_timeout": 30},
+    # network DB: a few connections kept open, checked before use
+    "PostgreSQL": {"poolclass": QueuePool, "pool_size": 5, "max_overflow": 10, "pool_timeout": 30,
+                   "pool_pre_ping": True}}
+
+# SQLite PRAGMA profiles - applied to every new connection, see createSession(profile=...)
+SQLITE_PROFILES: dict = {
+    # WAL: readers do not block the writer, commits append to the log instead of rewriting pages.
+    # synchronous=NORMAL: fsync only on checkpoints - a power loss may lose the last commits, never corrupts the DB.
+    "performance": {"journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "mmap_size": 64 * 1024 * 1024,
+                    "cache_size": -16000,  # negative: KiB -> 16 MB
+                    "temp_store": "MEMORY",
+                    "busy_timeout": 5000},
+    # WAL with fsync on every commit: no committed data is lost on power loss
+    "durable": {"journal_mode": "WAL",
+                "synchronous": "FULL",
+                "cache_size": -16000,
+                "busy_timeout": 5000}}
+
+
+def createSession(db_fullname: str,
+                  tables: list or None      = None,
+                  style: str                = "SQLite",
+                  base                      = Base,
+                  pooled: bool              = True,
+                  pool_kwargs: dict or None = None,
+                  profile: str or dict or None = None):
     """=== Function name: createSession ================================================================================
     Setting up a session to handle SQL DB operations.
+    Engine and connection pool are created only on the first call per DB (per process), and tables are created /
+    checked only the first time they are entered: later calls cost no connect and no DDL introspection.
     :param db_fullname: str - name of the DB (or the direct path to it - if PostgreSQL)
     :param tables: list - of __table__ parameters of each table-representing-class to be created on session init
     :param style: str - whether "SQLite" or "PostgreSQL" style DB is to be accessed
     :param base: Base object to be used in session creation
+    :param pooled: bool - if False, legacy behaviour: new engine without pooling (NullPool), schema checked each call
+    :param pool_kwargs: dict - overrides POOL_DEFAULTS of the dialect. Used only when the engine is created.
+    :param profile: str or dict - SQLite only: key of SQLITE_PROFILES, or a dict of PRAGMA: value pairs, applied to
+                                  every connection. None: SQLite defaults. Used only when the engine is created.
     :return: a session-object
     ============================================================================================== by Sziller ==="""
     # Current Function Name
     cfn = inspect.currentframe().f_code.co_name  # current class name
     if style == "SQLite":
-        engine = create_engine('sqlite:///%s' % db_fullname, echo=False, poolclass=NullPool)
-    elif style == "PostGreSQL":
-        engine = create_engine(db_fullname, echo=False, poolclass=NullPool)
+        url = 'sqlite:///%s' % db_fullname
+    elif style in ("PostgreSQL", "PostGreSQL"):
+        url, style = db_fullname, "PostgreSQL"
     else:
         lg.critical("not found : '{}' is not a valid <style> value! - says {}()".format(style, cfn))
         raise Exception("no valid dialect defined")
 
-    base.metadata.create_all(bind=engine, tables=tables)  # check if always necessary!!!
-    Session = sessionmaker(bind=engine)
-    return Session()
+    pragmas = SQLITE_PROFILES[profile] if isinstance(profile, str) else (profile or {})
+    if pragmas and style != "SQLite":
+        lg.warning("ignored   : <profile> applies to SQLite only - says {}()".format(cfn))
+        pragmas = {}
+
+    if not pooled:
+        engine = create_engine(url, echo=False, poolclass=NullPool)
+        _apply_pragmas_on_connect(engine=engine, pragmas=pragmas)
+        base.metadata.create_all(bind=engine, tables=tables)
+        _create_missing_indexes(engine=engine, tables=tables)
+        return sessionmaker(bind=engine)()
+
+    with _ENGINES_LOCK:
+        if url not in _ENGINES:
+            engine_kwargs = dict(POOL_DEFAULTS[style], **(pool_kwargs or {}))
+            if style == "SQLite":
+                engine_kwargs["connect_args"] = {"check_same_thread": False}  # pooled connections change threads
+                if db_fullname in ("", ":memory:"):  # in-memory DB exists only as long as its single connection
+                    engine_kwargs = {"poolclass": StaticPool, "connect_args": engine_kwargs["connect_args"]}
+            _ENGINES[url] = create_engine(url, echo=False, **engine_kwargs)
+            _apply_pragmas_on_connect(engine=_ENGINES[url], pragmas=pragmas)
+            _PROFILES[url] = pragmas
+            _SESSIONMAKERS[url] = sessionmaker(bind=_ENGINES[url])
+            _CREATED_TABLES[url] = set()
+            lg.info("engine    : created for '{}' - says {}()".format(db_fullname, cfn))
+        engine = _ENGINES[url]
+        if pragmas and pragmas != _PROFILES[url]:
+            lg.warning("ignored   : engine of '{}' already exists with another profile - says {}()"
+                       .format(db_fullname, cfn))
+        table_keys = [None] if tables is None else [_.name for _ in tables]  # None: every table of <base>
+        if any(_ not in _CREATED_TABLES[url] for _ in table_keys):
+            base.metadata.create_all(bind=engine, tables=tables)
+            _create_missing_indexes(engine=engine, tables=base.metadata.sorted_tables if tables is None else tables)
+            _CREATED_TABLES[url].update(table_keys)
+        return _SESSIONMAKERS[url]()
+
+
+def _apply_pragmas_on_connect(engine, pragmas: dict):
+    """Registers <pragmas> to be executed on every new DBAPI connection of <engine>"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute("PRAGMA {}={}".format(pragma, value))
+        cursor.close()
+
+
+def _create_missing_indexes(engine, tables: list or None):
+    """create_all() does not add indexes defined later to an already existing table: this function does"""
+    for table in tables or []:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def get_pool_stats() -> dict:
+    """=== Function name: get_pool_stats ===============================================================================
+    Returns the state of every connection pool created by < createSession() > in this process.
+    :return: dict - url: {"pool": pool class, "size": kept connections, "checked_out": in use, "overflow": extra
+                    connections open beyond size, "status": SQLAlchemy's description}
+    ============================================================================================== by Sziller ==="""
+    stats = {}
+    with _ENGINES_LOCK:
+        for url, engine in _ENGINES.items():
+            pool = engine.pool
+            stats[url] = {"pool": type(pool).__name__,
+                          "size": pool.size() if hasattr(pool, "size") else None,
+                          "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                          "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                          "status": pool.status()}
+    return stats
+
+
+def dispose_engines():
+    """=== Function name: dispose_engines ==============================================================================
+    Closes every pooled connection and forgets cached engines. Call it in a child process after forking, or on
+    shutdown. Next < createSession() > call creates engines again.
+    ============================================================================================== by Sziller ==="""
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+        _SESSIONMAKERS.clear()
+        _CREATED_TABLES.clear()
+        _PROFILES.clear()
 
 # SESSION creation ENDED                                                                    -   ENDED   -
 
@@ -84,6 +231,134 @@ def ADD_rows_to_table(primary_key: str,
     return added_primary_keys
 
 
+def ADD_rows_to_table_bulk(primary_key: str,
+                           data_list: list,
+                           row_obj: Base,
+                           session: sessionmaker.object_session,
+                           chunk_size: int = 500,
+                           native_upsert: bool = True,
+                           commit: bool = True) -> list:
+    """=== Function name: ADD_rows_to_table_bulk =======================================================================
+    SQL action. Bulk version of < ADD_rows_to_table() >: rows already in the table (by <primary_key>) are skipped,
+    all others are inserted - but with a few set-based statements per <chunk_size> rows instead of one query per row.
+    - SQLite and PostgreSQL: one INSERT ... ON CONFLICT DO NOTHING RETURNING <primary_key> per chunk
+    - other dialects, or if <native_upsert> is False: one SELECT ... WHERE <primary_key> IN (...) per chunk, followed
+      by one executemany INSERT of the missing rows.
+    Rows are inserted over SQLAlchemy Core: no ORM objects are added to the session.
+    Rows in <data_list> including <primary_key> are inserted as they are. Rows without it are instantiated by
+    <row_obj>.construct() - to generate primary key and defaults -, then inserted as < return_as_dict() >.
+    ATTENTION: function does NOT close the session at the end! - you can continue using it.
+    :param primary_key: str - the primary key of the row, defined by row_obj
+    :param data_list: list[dict] row information in list of dictionaries format
+    :param row_obj: Base - the class attached to the table you want to query
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param chunk_size: int - number of rows handled by one statement
+    :param native_upsert: bool - use dialect-native ON CONFLICT DO NOTHING, where available
+    :param commit: bool - if False, caller is responsible to commit (e.g. to group several calls into one transaction)
+    :return: list of primary keys - actually added
+    ============================================================================================== by Sziller ==="""
+    rows = _rows_with_primary_key(primary_key=primary_key, data_list=data_list, row_obj=row_obj)
+    added_primary_keys = _insert_rows_bulk(primary_key=primary_key, rows=rows, table=row_obj.__table__,
+                                           session=session, chunk_size=chunk_size, native_upsert=native_upsert)
+    if commit:
+        session.commit()
+    return added_primary_keys
+
+
+def ADD_records_to_table(primary_key: str,
+                         records: list,
+                         row_obj: Base,
+                         session: sessionmaker.object_session,
+                         chunk_size: int = 500,
+                         native_upsert: bool = True,
+                         commit: bool = True) -> list:
+    """=== Function name: ADD_records_to_table =========================================================================
+    SQL action. Same as < ADD_rows_to_table_bulk() >, but rows are entered as tuples - e.g. MeasurementRecord-s -
+    holding every column of <row_obj>'s table, in table order, primary key included. No ORM instance is created: rows
+    are zipped with the column names and inserted over SQLAlchemy Core.
+    ATTENTION: function does NOT close the session at the end! - you can continue using it.
+    :param primary_key: str - the primary key of the row, defined by row_obj
+    :param records: list[tuple] rows, values in column order of <row_obj>.__table__
+    :param row_obj: Base - the class attached to the table you want to query
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param chunk_size: int - number of rows handled by one statement
+    :param native_upsert: bool - use dialect-native ON CONFLICT DO NOTHING, where available
+    :param commit: bool - if False, caller is responsible to commit (e.g. to group several calls into one transaction)
+    :return: list of primary keys - actually added
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    column_names = [_.name for _ in table.columns]
+    pk_index = column_names.index(primary_key)
+    rows, seen = [], set()
+    for record in records:
+        if len(record) != len(column_names):
+            raise ValueError("record of {} values entered, table <{}> has {} columns: {}".format(
+                len(record), table.name, len(column_names), record))
+        if record[pk_index] not in seen:
+            seen.add(record[pk_index])
+            rows.append(dict(zip(column_names, record)))
+    added_primary_keys = _insert_rows_bulk(primary_key=primary_key, rows=rows, table=table, session=session,
+                                           chunk_size=chunk_size, native_upsert=native_upsert)
+    if commit:
+        session.commit()
+    return added_primary_keys
+
+
+def _rows_with_primary_key(primary_key: str, data_list: list, row_obj: Base) -> list:
+    """Returns rows of <data_list> as dicts including <primary_key>. Duplicates (by primary key) are left out"""
+    rows, seen = [], set()
+    for data in data_list:
+        row = data if primary_key in data else row_obj.construct(d_in=data).return_as_dict()
+        if row[primary_key] not in seen:
+            seen.add(row[primary_key])
+            rows.append(row)
+    return rows
+
+
+def _supports_native_upsert(session) -> bool:
+    """True if dialect of <session> can run INSERT ... ON CONFLICT DO NOTHING RETURNING as executemany"""
+    dialect = session.get_bind().dialect
+    return (dialect.name in ("sqlite", "postgresql")
+            and getattr(dialect, "insert_executemany_returning", False))
+
+
+def _insert_rows_bulk(primary_key: str, rows: list, table, session, chunk_size: int, native_upsert: bool) -> list:
+    """Inserts <rows> (dicts including <primary_key>) missing from <table>. Returns primary keys inserted"""
+    pk_column = table.c[primary_key]
+    added_primary_keys = []
+    if native_upsert and _supports_native_upsert(session):
+        dialect_insert = {"sqlite": dialect_sqlite.insert,
+                          "postgresql": dialect_postgresql.insert}[session.get_bind().dialect.name]
+        statement = dialect_insert(table).on_conflict_do_nothing(index_elements=[pk_column]).returning(pk_column)
+        for chunk in _chunks(rows, chunk_size):
+            added_primary_keys.extend(session.execute(statement, chunk).scalars().all())
+        return added_primary_keys
+    for chunk in _chunks(rows, chunk_size):
+        keys = [_[primary_key] for _ in chunk]
+        existing = set(session.execute(select(pk_column).where(pk_column.in_(keys))).scalars())
+        missing = [_ for _ in chunk if _[primary_key] not in existing]
+        if missing:
+            session.execute(insert(table), missing)
+            added_primary_keys.extend(_[primary_key] for _ in missing)
+    return added_primary_keys
+
+
+def _max_bind_parameters(session) -> int:
+    """Max. number of bound parameters one statement may have on the dialect of <session>"""
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "sqlite":
+        return 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    if dialect_name == "postgresql":
+        return 32767
+    return 1000
+
+
+def _chunks(items: list, chunk_size: int):
+    """Yields consecutive slices of <items>, each at most <chunk_size> long"""
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
 def DELETE_multiple_rows_by_filterkey(filterkey: str,
                                       filtervalue_list: list,
                                       row_obj: Base,
@@ -98,13 +373,55 @@ def DELETE_multiple_rows_by_filterkey(filterkey: str,
                                     subject of this function
     :param row_obj: Base - the class attached to the table you want to query
     :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
-    :return: nothing
+    :return: int - number of rows deleted
     ============================================================================================== by Sziller ==="""
     # Current Function Name
     # cfn = inspect.currentframe().f_code.co_name  # current class name
-    for filtervalue in filtervalue_list:
-        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).delete(synchronize_session=False)
+    # one DELETE ... WHERE <filterkey> IN (...) per chunk of values, chunked to the dialect's parameter limit
+    table = row_obj.__table__
+    filter_column = table.c[filterkey]
+    n_deleted = 0
+    for chunk in _chunks(list(filtervalue_list), _max_bind_parameters(session)):
+        n_deleted += session.execute(delete(table).where(filter_column.in_(chunk))).rowcount
     session.commit()
+    return n_deleted
+
+
+def DELETE_rows_older_than(row_obj: Base,
+                           session: sessionmaker.object_session,
+                           cutoff: float,
+                           time_key: str = "timestamp",
+                           chunk_size: int = 2000,
+                           pause: float = 0.0,
+                           cancel_event=None) -> int:
+    """=== Function name: DELETE_rows_older_than =======================================================================
+    SQL action. Deletes every row whose <time_key> is less than <cutoff>, oldest first, by chunks of about
+    <chunk_size> rows - each chunk is a transaction of its own, so the DB is never locked for long.
+    Fast, if <time_key> is indexed.
+    :param row_obj: Base - the class attached to the table you want to delete from
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param cutoff: float - rows older than this are deleted
+    :param time_key: str - the numeric time column
+    :param chunk_size: int - rows deleted per transaction - more if several rows share the chunk's last time
+    :param pause: float - seconds slept between two chunks: other writers get the DB meanwhile
+    :param cancel_event: threading.Event - if set, deletion stops after the current chunk
+    :return: int - number of rows deleted
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    time_column = table.c[time_key]
+    n_deleted = 0
+    while not (cancel_event is not None and cancel_event.is_set()):
+        bound = session.execute(select(time_column).where(time_column < cutoff).order_by(time_column)
+                                .offset(chunk_size - 1).limit(1)).scalar()
+        condition = time_column < cutoff if bound is None else time_column <= bound
+        n_chunk = session.execute(delete(table).where(condition)).rowcount
+        session.commit()
+        n_deleted += n_chunk
+        if bound is None:
+            break
+        if pause:
+            time.sleep(pause)
+    return n_deleted
 
 
 def MODIFY_multiple_rows_by_column_to_value(filterkey: str,
@@ -127,13 +444,19 @@ def MODIFY_multiple_rows_by_column_to_value(filterkey: str,
     :param target_value: the value, the actual row's <target_key> will take, once functon finishes
     :param row_obj: Base - the class attached to the table you want to query
     :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
-    :return: nothing
+    :return: int - number of rows modified
     ============================================================================================== by Sziller ==="""
     # Current Function Name
     # cfn = inspect.currentframe().f_code.co_name  # current class name
-    for filtervalue in filtervalue_list:
-        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).update({target_key: target_value})
+    # one UPDATE ... WHERE <filterkey> IN (...) per chunk of values, chunked to the dialect's parameter limit
+    table = row_obj.__table__
+    filter_column = table.c[filterkey]
+    n_modified = 0
+    for chunk in _chunks(list(filtervalue_list), _max_bind_parameters(session) - 1):
+        statement = update(table).where(filter_column.in_(chunk)).values({target_key: target_value})
+        n_modified += session.execute(statement).rowcount
     session.commit()
+    return n_modified
 
 
 def MODIFY_multiple_rows_by_column_by_dict(filterkey: str,
@@ -167,13 +490,30 @@ def MODIFY_multiple_rows_by_column_by_dict(filterkey: str,
     :param mod_dict: dict - of targetkeys : targetvalues. targetvalues are the new values
     :param row_obj: Base - the class attached to the table you want to query
     :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
-    :return: nothing
+    :return: int - number of rows modified
     ============================================================================================== by Sziller ==="""
     # Current Function Name
     # cfn = inspect.currentframe().f_code.co_name  # current class name
+    # one executemany UPDATE per distinct set of target columns - usually a single one:
+    # UPDATE t SET points = ? WHERE age = ?   executed with [('0', 12), ('x', 11)]
+    # (A single CASE WHEN ... based UPDATE is evaluated value by value for every row: it is slower on large dicts.)
+    table = row_obj.__table__
+    filter_column = table.c[filterkey]
+    grouped = {}
     for filtervalue, sub_dict in mod_dict.items():
-        session.query(row_obj).filter(getattr(row_obj, filterkey) == filtervalue).update(sub_dict)
+        grouped.setdefault(tuple(sorted(sub_dict)), []).append((filtervalue, sub_dict))
+    n_modified = 0
+    for target_keys, items in grouped.items():
+        if not target_keys:
+            continue
+        statement = (update(table)
+                     .where(filter_column == bindparam("_filtervalue"))
+                     .values({_: bindparam("_new_{}".format(_)) for _ in target_keys}))
+        parameters = [dict({"_new_{}".format(_): sub_dict[_] for _ in target_keys}, _filtervalue=filtervalue)
+                      for filtervalue, sub_dict in items]
+        n_modified += session.execute(statement, parameters).rowcount
     session.commit()
+    return n_modified
 
 
 def QUERY_entire_table(ordered_by: str,
@@ -221,6 +561,198 @@ def QUERY_rows_by_column_filtervalue_list_ordered(filterkey: str,
     return result_list
 
 
+def QUERY_timerange(row_obj: Base,
+                    session: sessionmaker.object_session,
+                    t_from: float,
+                    t_to: float,
+                    filter_dict: dict or None   = None,
+                    time_key: str               = "timestamp",
+                    value_key: str              = "mea_val",
+                    bucket_size: float or None  = None) -> list:
+    """=== Function name: QUERY_timerange ==============================================================================
+    SQL action. You use the session entered. Function returns rows of a time series, whose <time_key> is between
+    <t_from> (included) and <t_to> (excluded), and whose columns take the values defined in <filter_dict>.
+    If <bucket_size> is entered, rows are downsampled: one row is returned per <bucket_size> long interval, with the
+    count, min, max and avg of <value_key> - computed by the DB, the raw rows are not transferred.
+    Fast, if an index starting with the columns of <filter_dict> and ending with <time_key> exists,
+    e.g. for Measurement: filter_dict={"mea_loc": ..., "mea_type": ...} -> ix_measurements_loc_type_ts.
+    :param row_obj: Base - the class attached to the table you want to query
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param t_from: float - start of the range (included), same unit as <time_key>
+    :param t_to: float - end of the range (excluded)
+    :param filter_dict: dict - of column: value pairs all rows must match. e.g. {"mea_loc": "room1"}
+    :param time_key: str - the numeric time column
+    :param value_key: str - column aggregated on downsampling
+    :param bucket_size: float - length of a downsampling interval. None: no downsampling, rows are returned.
+    :return: list of rows ordered by time, represented as dictionaries. If downsampled, keys are:
+             "bucket_start", "count", "min", "max", "avg"
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    time_column = table.c[time_key]
+    conditions = [time_column >= t_from, time_column < t_to]
+    conditions += [table.c[key] == value for key, value in (filter_dict or {}).items()]
+    if not bucket_size:
+        statement = select(table).where(*conditions).order_by(time_column)
+        result_list = [dict(_) for _ in session.execute(statement).mappings()]
+        session.commit()
+        return result_list
+    value_column = table.c[value_key]
+    if session.get_bind().dialect.name == "sqlite":  # no floor() in older SQLite: cast truncates (time is positive)
+        bucket = cast(time_column / bucket_size, Integer)
+    else:  # casting rounds on PostgreSQL
+        bucket = func.floor(time_column / bucket_size)
+    bucket = bucket.label("bucket")
+    statement = (select(bucket,
+                        func.count(value_column),
+                        func.min(value_column),
+                        func.max(value_column),
+                        func.avg(value_column))
+                 .where(*conditions)
+                 .group_by(bucket)
+                 .order_by(bucket))
+    result_list = [{"bucket_start": int(_[0]) * bucket_size,
+                    "count": _[1],
+                    "min": _[2],
+                    "max": _[3],
+                    "avg": _[4]} for _ in session.execute(statement)]
+    session.commit()
+    return result_list
+
+
+def QUERY_latest_rows(row_obj: Base,
+                      session: sessionmaker.object_session,
+                      filter_dict: dict or None = None,
+                      n_rows: int = 1,
+                      time_key: str = "timestamp",
+                      t_from: float or None = None) -> list:
+    """=== Function name: QUERY_latest_rows ============================================================================
+    SQL action. You use the session entered. Function returns the <n_rows> latest rows whose columns take the values
+    defined in <filter_dict> - e.g. the last readings of a sensor - without reading the rest of the filtered set.
+    Fast, if an index starting with the columns of <filter_dict> and ending with <time_key> exists.
+    :param row_obj: Base - the class attached to the table you want to query
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param filter_dict: dict - of column: value pairs all rows must match. e.g. {"mea_loc": "room1"}
+    :param n_rows: int - max. number of rows returned
+    :param time_key: str - the numeric time column
+    :param t_from: float - if entered, only rows of <time_key> from <t_from> (included) are returned
+    :return: list of rows ordered by time - oldest first - represented as dictionaries.
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    time_column = table.c[time_key]
+    conditions = [table.c[key] == value for key, value in (filter_dict or {}).items()]
+    if t_from is not None:
+        conditions.append(time_column >= t_from)
+    statement = select(table).where(*conditions).order_by(time_column.desc()).limit(n_rows)
+    result_list = [dict(_) for _ in session.execute(statement).mappings()]
+    session.commit()
+    result_list.reverse()
+    return result_list
+
+
+def STREAM_entire_table(ordered_by: str,
+                        row_obj: Base,
+                        session: sessionmaker.object_session,
+                        chunk_size: int = 1000,
+                        columns: list or None = None,
+                        after: tuple or None = None):
+    """=== Function name: STREAM_entire_table ==========================================================================
+    SQL action. Generator version of < QUERY_entire_table() >: yields the table in chunks, so memory use does not
+    depend on table size.
+    Rows are read by keyset pagination on (<ordered_by>, primary key): every chunk is a separate, index-friendly
+    query continuing after the last row of the previous chunk - no OFFSET, no open cursor between chunks.
+    Rows are read over SQLAlchemy Core: no ORM objects are built.
+    ATTENTION: <ordered_by> column must not contain NULL values.
+    ATTENTION: unlike QUERY_* functions, streams do NOT commit <session>: writes the caller makes between two chunks
+    stay in its own transaction. Chunks are read in <session>'s transaction - end it (commit) once done reading,
+    or stream on a session of its own.
+    :param ordered_by: str - column to order by, e.g. "timestamp"
+    :param row_obj: Base - the class attached to the table you want to query
+    :param session: session-obj - a pre-created session. It is NOT closed, nor committed by the function.
+    :param chunk_size: int - max. number of rows per chunk
+    :param columns: list - of column names to be returned. None: all columns
+    :param after: tuple - (<ordered_by> value, primary key value) of the last row already read: reading resumes
+                          after it. See < stream_cursor() >.
+    :return: generator of lists of the rows requested. Rows are represented as dictionaries.
+    ============================================================================================== by Sziller ==="""
+    yield from _stream_keyset(table=row_obj.__table__, where=None, ordered_by=ordered_by, session=session,
+                              chunk_size=chunk_size, columns=columns, after=after)
+
+
+def STREAM_rows_by_column_filtervalue_list_ordered(filterkey: str,
+                                                   filtervalue_list: list,
+                                                   ordered_by: str,
+                                                   row_obj: Base,
+                                                   session: sessionmaker.object_session,
+                                                   chunk_size: int = 1000,
+                                                   columns: list or None = None,
+                                                   after: tuple or None = None):
+    """=== Function name: STREAM_rows_by_column_filtervalue_list_ordered ==============================================
+    SQL action. Generator version of < QUERY_rows_by_column_filtervalue_list_ordered() >: yields selected rows in
+    chunks. See < STREAM_entire_table() > for pagination, <chunk_size>, <columns> and <after>.
+    :param filterkey: str - the key (column) whoes values must be included in <filtervalue_list> in order
+                            for the parent row to be included in the query
+    :param filtervalue_list: list - of values, one of which the filterkey must take in order for its parent row to be
+                                    subject of this function
+    :return: generator of lists of the rows requested. Rows are represented as dictionaries.
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    yield from _stream_keyset(table=table, where=table.c[filterkey].in_(tuple(filtervalue_list)),
+                              ordered_by=ordered_by, session=session, chunk_size=chunk_size, columns=columns,
+                              after=after)
+
+
+def STREAM_rows_newer_than(ordered_by: str,
+                           high_water_mark,
+                           row_obj: Base,
+                           session: sessionmaker.object_session,
+                           chunk_size: int = 1000,
+                           columns: list or None = None,
+                           after: tuple or None = None):
+    """=== Function name: STREAM_rows_newer_than =======================================================================
+    SQL action. Yields rows whose <ordered_by> value is greater than <high_water_mark>, in chunks - e.g. the rows
+    stored since the last sync. See < STREAM_entire_table() > for pagination, <chunk_size>, <columns> and <after>.
+    :param high_water_mark: - greatest <ordered_by> value already read. None: the entire table is streamed
+    :return: generator of lists of the rows requested. Rows are represented as dictionaries.
+    ============================================================================================== by Sziller ==="""
+    table = row_obj.__table__
+    yield from _stream_keyset(table=table,
+                              where=table.c[ordered_by] > high_water_mark if high_water_mark is not None else None,
+                              ordered_by=ordered_by, session=session, chunk_size=chunk_size, columns=columns,
+                              after=after)
+
+
+def stream_cursor(row: dict, ordered_by: str, row_obj: Base) -> tuple:
+    """=== Function name: stream_cursor ================================================================================
+    Returns the <after> argument of STREAM_* functions needed to resume reading after <row>.
+    <row> must include <ordered_by> and the primary key column.
+    ============================================================================================== by Sziller ==="""
+    return row[ordered_by], row[row_obj.__table__.primary_key.columns.values()[0].name]
+
+
+def _stream_keyset(table, where, ordered_by: str, session, chunk_size: int, columns: list or None,
+                   after: tuple or None):
+    """Yields chunks of rows of <table> matching <where>, by keyset pagination on (<ordered_by>, primary key)"""
+    order_column = table.c[ordered_by]
+    pk_column = table.primary_key.columns.values()[0]
+    names = columns or [_.name for _ in table.columns]
+    statement = select(order_column, pk_column, *[table.c[_] for _ in names]).order_by(order_column, pk_column)
+    if where is not None:
+        statement = statement.where(where)
+    while True:
+        page = statement
+        if after is not None:
+            last_ordered, last_pk = after
+            page = page.where(or_(order_column > last_ordered,
+                                  and_(order_column == last_ordered, pk_column > last_pk)))
+        rows = session.execute(page.limit(chunk_size)).all()  # NOT committed: the transaction is the caller's
+        if not rows:
+            return
+        after = (rows[-1][0], rows[-1][1])
+        yield [dict(zip(names, _[2:])) for _ in rows]
+        if len(rows) < chunk_size:
+            return
+
+
 # DB manipulating functions ENDED                                                           -   ENDED   -
 
 
@@ -0,0 +1,236 @@
+"""
+Durable outbox: store-and-forward of Engine results and measurements, for the times the server is not reachable.
+Entries are appended to a local SQLite DB of their own (durable PRAGMA profile: an entry appended survives power loss),
+each under a sequence number that grows forever. The server uploads them in batches when it is connected:
+- pull(ack=n) acknowledges every entry up to sequence number <n> - the last one the server has stored - and returns
+  the next batch after it. Batches are limited both in entries and bytes, so catching up after hours offline costs
+  many small batches, never one huge read.
+- acknowledged entries are compacted away (deleted in chunks) at once. The acknowledged sequence number is persisted:
+  after a restart, or a lost response, nothing acknowledged is sent again.
+- the outbox is capped by <max_entries> and <max_bytes>. When full, <eviction> decides: "drop_oldest" unacknowledged
+  entries (the server sees a gap in the sequence numbers), or "reject_new" entries.
+by Sziller
+"""
+
+import json
+import time
+import logging
+import inspect
+import threading
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import select
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases.sql_baseOutbox import OutboxEntry
+from shmc_sqlBases.sql_baseOutbox import OutboxState
+
+# Setting up logger                                         logger                      -   START   -
+lg = logging.getLogger()
+# Setting up logger                                         logger                      -   ENDED   -
+
+EVICTION_POLICIES: tuple = ("drop_oldest", "reject_new")
+
+
+class Outbox:
+    """=== Class name: Outbox ==========================================================================================
+    Append-only, acknowledgement based outbox on a local DB. Safe to use from several threads.
+    :param db_fullname: str - DB file of the outbox - keep it apart from the DB of measurements
+    :param style: str - "SQLite" or "PostgreSQL"
+    :param profile: str or dict - SQLite PRAGMA profile, see < SQL_interface.createSession() >
+    :param max_entries: int - max. entries kept
+    :param max_bytes: int - max. bytes of payload kept
+    :param eviction: str - outbox full: "drop_oldest" entries, or "reject_new" ones
+    :param compact_chunk: int - max. entries deleted by one statement on compaction
+    ============================================================================================== by Sziller ==="""
+    ccn = inspect.currentframe().f_code.co_name  # current class name
+
+    def __init__(self,
+                 db_fullname: str,
+                 style: str                 = "SQLite",
+                 profile: str or dict       = "durable",
+                 max_entries: int           = 100000,
+                 max_bytes: int             = 64 * 1024 * 1024,
+                 eviction: str              = "drop_oldest",
+                 compact_chunk: int         = 1000):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError("invalid <eviction>: {} - choose from {}".format(eviction, EVICTION_POLICIES))
+        self.max_entries: int           = max_entries
+        self.max_bytes: int             = max_bytes
+        self.eviction: str              = eviction
+        self.compact_chunk: int         = compact_chunk
+        self.table                      = OutboxEntry.__table__
+        self.session = SQLi.createSession(db_fullname=db_fullname,
+                                          tables=[OutboxEntry.__table__, OutboxState.__table__],
+                                          style=style,
+                                          profile=profile if style == "SQLite" else None)
+        self.n_appended: int            = 0
+        self.n_evicted: int             = 0
+        self.n_rejected: int            = 0
+        self.n_compacted: int           = 0
+        self._lock                      = threading.Lock()
+        state = self.session.get(OutboxState, "acked_seq")
+        self.acked_seq: int             = state.value if state is not None else 0
+        self.n_entries, self.n_bytes, first_seq, last_seq = self.session.execute(
+            select(func.count(), func.coalesce(func.sum(self.table.c.size), 0),
+                   func.min(self.table.c.seq), func.max(self.table.c.seq))).one()
+        self.session.commit()
+        self.first_seq: int             = first_seq or self.acked_seq + 1  # oldest entry kept
+        self.last_seq: int              = max(last_seq or 0, self.acked_seq)  # newest entry appended
+        self.compact()  # entries acknowledged, but not deleted before a restart
+        lg.info("outbox    : {} entries, {} bytes waiting, acknowledged up to {} - says {}".format(
+            self.n_entries, self.n_bytes, self.acked_seq, self.ccn))
+
+    def append(self, kind: str, payload) -> int or None:
+        """=== Method name: append =====================================================================================
+        Stores <payload> as the next entry, durably.
+        :param kind: str - kind of the entry, e.g. "measurements"
+        :param payload: JSON serializable data
+        :return: int or None - sequence number of the entry. None: rejected (outbox full, "reject_new" policy)
+        ========================================================================================== by Sziller ==="""
+        text = json.dumps(payload, separators=(",", ":"))
+        size = len(text)
+        with self._lock:
+            if not self.make_room(size=size):
+                self.n_rejected += 1
+                lg.warning("outbox    : full, {} entry of {} bytes rejected - says {}".format(kind, size, self.ccn))
+                return None
+            seq = self.session.execute(insert(self.table).values(kind=kind, created_at=time.time(), size=size,
+                                                                 payload=text)).inserted_primary_key[0]
+            self.session.commit()
+            self.n_entries += 1
+            self.n_bytes += size
+            self.last_seq = seq
+            self.n_appended += 1
+            return seq
+
+    def make_room(self, size: int) -> bool:
+        """=== Method name: make_room ==================================================================================
+        Frees space for an entry of <size> bytes by the eviction policy. Call with the lock held.
+        "drop_oldest" frees 1% of the caps more than needed: a full outbox does not evict on every append.
+        :return: bool - True if the entry fits
+        ========================================================================================== by Sziller ==="""
+        if size > self.max_bytes:
+            return False
+        while self.n_entries and (self.n_entries + 1 > self.max_entries or self.n_bytes + size > self.max_bytes):
+            if self.eviction == "reject_new":
+                return False
+            oldest = self.session.execute(select(self.table.c.seq, self.table.c.size)
+                                          .order_by(self.table.c.seq)
+                                          .limit(self.compact_chunk)).all()
+            n_freed, bytes_freed = 0, 0
+            for last_evicted, entry_size in oldest:
+                n_freed += 1
+                bytes_freed += entry_size
+                if (self.n_entries - n_freed + 1 <= self.max_entries - self.max_entries // 100
+                        and self.n_bytes - bytes_freed + size <= self.max_bytes - self.max_bytes // 100):
+                    break
+            self.session.execute(delete(self.table).where(self.table.c.seq <= last_evicted))
+            self.session.commit()
+            self.n_entries -= n_freed
+            self.n_bytes -= bytes_freed
+            self.n_evicted += n_freed
+            self.first_seq = last_evicted + 1
+            lg.warning("outbox    : full, {} oldest entries evicted, up to seq. {} - says {}".format(
+                n_freed, last_evicted, self.ccn))
+        return True
+
+    def pull(self, ack: int or None = None, max_entries: int = 500, max_bytes: int = 1024 * 1024) -> dict:
+        """=== Method name: pull =======================================================================================
+        Acknowledges entries up to <ack>, and returns the next batch of entries after the acknowledged ones.
+        Send the "last_seq" of a batch as <ack> of the next pull - once the batch is stored by the server.
+        :param ack: int - greatest sequence number stored by the server. None: nothing new acknowledged
+        :param max_entries: int - max. entries returned. 0: acknowledge only
+        :param max_bytes: int - max. bytes of payload returned - at least one entry is returned, whatever its size
+        :return: dict - "entries": list of {"seq", "kind", "created_at", "payload"}, "acked_seq", "last_seq" (of the
+                 batch), "more" (entries left after the batch), "pending" (entries not acknowledged)
+        ========================================================================================== by Sziller ==="""
+        if ack is not None:
+            self.ack(seq=ack)
+        entries, n_bytes = [], 0
+        with self._lock:
+            if max_entries > 0:
+                statement = (select(self.table.c.seq, self.table.c.kind, self.table.c.created_at, self.table.c.size,
+                                    self.table.c.payload)
+                             .where(self.table.c.seq > self.acked_seq)
+                             .order_by(self.table.c.seq)
+                             .limit(max_entries))
+                for seq, kind, created_at, size, text in self.session.execute(statement):
+                    if entries and n_bytes + size > max_bytes:
+                        break
+                    entries.append({"seq": seq, "kind": kind, "created_at": created_at, "payload": json.loads(text)})
+                    n_bytes += size
+                self.session.commit()
+            last_seq = entries[-1]["seq"] if entries else self.acked_seq
+            return {"entries": entries,
+                    "acked_seq": self.acked_seq,
+                    "last_seq": last_seq,
+                    "more": last_seq < self.last_seq,
+                    "pending": self.n_entries}
+
+    def ack(self, seq: int) -> int:
+        """=== Method name: ack ========================================================================================
+        Acknowledges every entry up to <seq>, persists it, and compacts the acknowledged entries away.
+        Acknowledging less than already acknowledged does nothing: a repeated or late ack is harmless.
+        :return: int - the sequence number acknowledged
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            seq = min(seq, self.last_seq)
+            if seq <= self.acked_seq:
+                return self.acked_seq
+            state = self.session.get(OutboxState, "acked_seq")
+            if state is None:
+                self.session.add(OutboxState(key="acked_seq", value=seq))
+            else:
+                state.value = seq
+            self.session.commit()
+            self.acked_seq = seq
+        self.compact()
+        return seq
+
+    def compact(self) -> int:
+        """=== Method name: compact ====================================================================================
+        Deletes acknowledged entries, by chunks of <self.compact_chunk>: the DB is not locked for long.
+        Freed pages are reused by later entries - the file does not grow while entries are acknowledged.
+        :return: int - number of entries deleted
+        ========================================================================================== by Sziller ==="""
+        n_deleted = 0
+        while True:
+            with self._lock:
+                chunk = self.session.execute(select(func.count(), func.coalesce(func.sum(self.table.c.size), 0),
+                                                    func.max(self.table.c.seq))
+                                             .where(self.table.c.seq.in_(
+                                                 select(self.table.c.seq)
+                                                 .where(self.table.c.seq <= self.acked_seq)
+                                                 .order_by(self.table.c.seq)
+                                                 .limit(self.compact_chunk)))).one()
+                n_chunk, bytes_chunk, last_seq = chunk
+                if not n_chunk:
+                    self.session.commit()
+                    break
+                self.session.execute(delete(self.table).where(self.table.c.seq <= last_seq))
+                self.session.commit()
+                self.n_entries -= n_chunk
+                self.n_bytes -= bytes_chunk
+                self.first_seq = last_seq + 1
+                self.n_compacted += n_chunk
+                n_deleted += n_chunk
+        return n_deleted
+
+    def as_dict(self) -> dict:
+        """=== Method name: as_dict ====================================================================================
+        :return dict: state and counters of the outbox
+        ========================================================================================== by Sziller ==="""
+        with self._lock:
+            return {"entries": self.n_entries,
+                    "bytes": self.n_bytes,
+                    "first_seq": self.first_seq,
+                    "last_seq": self.last_seq,
+                    "acked_seq": self.acked_seq,
+                    "appended": self.n_appended,
+                    "evicted": self.n_evicted,
+                    "rejected": self.n_rejected,
+                    "compacted": self.n_compacted,
+                    "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes,
+                    "eviction": self.eviction}
@@ -0,0 +1,268 @@
+"""
+Rollups: count / min / max / mean of measurements per minute, hour and day, kept up to date incrementally.
+Every batch of measurements stored is aggregated in memory into per-bucket partials - one per sensor and bucket - and
+merged into the rollup tables by an upsert (count and sum added, min and max compared) in the same transaction as the
+raw rows: rollups never count a row that was not stored, nor miss one that was.
+Long range charts read rollups: cost depends on the number of buckets, not of raw rows. Raw rows - and the finer
+rollups - can then be deleted after their horizon by < APPLY_retention() >: data is downsampled to the coarser levels.
+Buckets are aligned to UTC: days start at 00:00 UTC.
+by Sziller
+"""
+
+import time
+import math
+import logging
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import literal_column
+from sqlalchemy.dialects import sqlite as dialect_sqlite
+from sqlalchemy.dialects import postgresql as dialect_postgresql
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases.sql_baseRollup import ROLLUP_LEVELS
+from shmc_sqlBases.sql_baseRollup import RollupBackfill
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+# Setting up logger                                         logger                      -   START   -
+lg = logging.getLogger()
+# Setting up logger                                         logger                      -   ENDED   -
+
+ROLLUP_TABLES: list = [_[1].__table__ for _ in ROLLUP_LEVELS.values()] + [RollupBackfill.__table__]
+
+
+def aggregate_records(records: list, bucket_size: float) -> dict:
+    """=== Function name: aggregate_records ============================================================================
+    Aggregates MeasurementRecord-s into buckets of <bucket_size> seconds. Records without value are skipped.
+    :return: dict - (mea_loc, mea_type, bucket_start): [count, sum, min, max]
+    ============================================================================================== by Sziller ==="""
+    partials = {}
+    for record in records:
+        value = record.mea_val
+        if value is None:
+            continue
+        key = (record.mea_loc, record.mea_type, math.floor(record.timestamp / bucket_size) * bucket_size)
+        partial = partials.get(key)
+        if partial is None:
+            partials[key] = [1, value, value, value]
+        else:
+            partial[0] += 1
+            partial[1] += value
+            if value < partial[2]:
+                partial[2] = value
+            if value > partial[3]:
+                partial[3] = value
+    return partials
+
+
+def ADD_records_to_rollups(records: list, session, levels: list or None = None, commit: bool = True) -> int:
+    """=== Function name: ADD_records_to_rollups =======================================================================
+    SQL action. Merges MeasurementRecord-s - just stored - into the rollup tables.
+    Call it in the transaction the records were stored in (<commit>=False on both), so the two are committed at once.
+    :param records: list - of MeasurementRecord-s, each stored exactly once: a record merged twice is counted twice
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param levels: list - of ROLLUP_LEVELS keys to be updated. None: every level
+    :param commit: bool - if False, caller is responsible to commit
+    :return: int - number of buckets updated, over all levels
+    ============================================================================================== by Sziller ==="""
+    n_buckets = 0
+    for level in levels or ROLLUP_LEVELS:
+        bucket_size, row_obj = ROLLUP_LEVELS[level]
+        partials = aggregate_records(records=records, bucket_size=bucket_size)
+        if partials:
+            _upsert_partials(partials=partials, table=row_obj.__table__, session=session)
+            n_buckets += len(partials)
+    if commit:
+        session.commit()
+    return n_buckets
+
+
+def _upsert_partials(partials: dict, table, session):
+    """Merges bucket <partials> into <table>: by native upsert on SQLite / PostgreSQL, read-modify-write elsewhere"""
+    rows = [{"mea_loc": loc, "mea_type": typ, "bucket_start": bucket,
+             "mea_count": count, "mea_sum": total, "mea_min": low, "mea_max": high}
+            for (loc, typ, bucket), (count, total, low, high) in partials.items()]
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name in ("sqlite", "postgresql"):
+        dialect_insert = {"sqlite": dialect_sqlite.insert, "postgresql": dialect_postgresql.insert}[dialect_name]
+        smaller, greater = (func.min, func.max) if dialect_name == "sqlite" else (func.least, func.greatest)
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.mea_loc, table.c.mea_type, table.c.bucket_start],
+            set_={"mea_count": table.c.mea_count + statement.excluded.mea_count,
+                  "mea_sum": table.c.mea_sum + statement.excluded.mea_sum,
+                  "mea_min": smaller(table.c.mea_min, statement.excluded.mea_min),
+                  "mea_max": greater(table.c.mea_max, statement.excluded.mea_max)})
+        for chunk in SQLi._chunks(rows, 500):
+            session.execute(statement, chunk)
+        return
+    for row in rows:
+        existing = session.execute(select(table).where(table.c.mea_loc == row["mea_loc"],
+                                                       table.c.mea_type == row["mea_type"],
+                                                       table.c.bucket_start == row["bucket_start"])).mappings().first()
+        if existing is None:
+            session.execute(table.insert().values(**row))
+            continue
+        session.execute(table.update()
+                        .where(table.c.mea_loc == row["mea_loc"],
+                               table.c.mea_type == row["mea_type"],
+                               table.c.bucket_start == row["bucket_start"])
+                        .values(mea_count=existing["mea_count"] + row["mea_count"],
+                                mea_sum=existing["mea_sum"] + row["mea_sum"],
+                                mea_min=min(existing["mea_min"], row["mea_min"]),
+                                mea_max=max(existing["mea_max"], row["mea_max"])))
+
+
+def choose_level(t_from: float, t_to: float, max_buckets: int = 1000) -> str:
+    """=== Function name: choose_level =================================================================================
+    Returns the finest rollup level covering <t_from> - <t_to> in at most <max_buckets> buckets - "day" if none does.
+    ============================================================================================== by Sziller ==="""
+    for level, (bucket_size, _) in ROLLUP_LEVELS.items():
+        if (t_to - t_from) / bucket_size <= max_buckets:
+            return level
+    return "day"
+
+
+def QUERY_rollups(level: str,
+                  session,
+                  t_from: float,
+                  t_to: float,
+                  filter_dict: dict or None = None) -> list:
+    """=== Function name: QUERY_rollups ================================================================================
+    SQL action. Returns the buckets of <level> starting between <t_from> (included) and <t_to> (excluded).
+    :param level: str - key of ROLLUP_LEVELS: "minute", "hour" or "day"
+    :param session: session-obj - a pre-created session. It is NOT closed at the end of the function.
+    :param filter_dict: dict - of column: value pairs all buckets must match. e.g. {"mea_loc": "room1"}
+    :return: list of buckets ordered by sensor and time, as dicts: "mea_loc", "mea_type", "bucket_start", "count",
+             "min", "max", "mean"
+    ============================================================================================== by Sziller ==="""
+    row_obj = ROLLUP_LEVELS[level][1]
+    table = row_obj.__table__
+    conditions = [table.c.bucket_start >= t_from, table.c.bucket_start < t_to]
+    conditions += [table.c[key] == value for key, value in (filter_dict or {}).items()]
+    statement = (select(table).where(*conditions)
+                 .order_by(table.c.mea_loc, table.c.mea_type, table.c.bucket_start))
+    result_list = [{"mea_loc": _["mea_loc"],
+                    "mea_type": _["mea_type"],
+                    "bucket_start": _["bucket_start"],
+                    "count": _["mea_count"],
+                    "min": _["mea_min"],
+                    "max": _["mea_max"],
+                    "mean": _["mea_sum"] / _["mea_count"] if _["mea_count"] else None}
+                   for _ in session.execute(statement).mappings()]
+    session.commit()
+    return result_list
+
+
+def PREPARE_backfill(row_obj, session) -> dict:
+    """=== Function name: PREPARE_backfill =============================================================================
+    SQL action. Returns the progress of the backfill of rollups - see < BACKFILL_rollups() >.
+    On the first call on a DB - no progress stored yet - it is created: if there are raw rows but no rollups (DB of a
+    former version), the backfill is to cover every raw row stored until now. Otherwise it is created finished.
+    Call it before any row is stored with its rollups: those would be counted twice.
+    Dialects without rowid (PostgreSQL) are backfilled at once, here.
+    :param row_obj: Base - the class of the raw rows, e.g. Measurement
+    :return: dict - "last_rowid", "cursor", "n_rows", "started_at", "finished_at" (0.0: not finished yet)
+    ============================================================================================== by Sziller ==="""
+    progress = backfill_progress(session=session)
+    if progress is not None:
+        return progress
+    now, last_rowid = time.time(), 0
+    if rollups_empty(session=session):
+        if session.get_bind().dialect.name == "sqlite":
+            last_rowid = session.execute(select(func.max(literal_column("rowid")))
+                                         .select_from(row_obj.__table__)).scalar() or 0
+        else:
+            n_rows = 0
+            for chunk in SQLi.STREAM_entire_table(ordered_by="timestamp", row_obj=row_obj, session=session):
+                ADD_records_to_rollups(records=[MeasurementRecord(**_) for _ in chunk], session=session)
+                n_rows += len(chunk)
+            lg.info("rollups   : {} stored measurements rolled up".format(n_rows))
+    session.execute(RollupBackfill.__table__.insert().values(backfill_id=1, last_rowid=last_rowid, cursor=0,
+                                                             n_rows=0, started_at=now,
+                                                             finished_at=0.0 if last_rowid else now))
+    session.commit()
+    return backfill_progress(session=session)
+
+
+def BACKFILL_rollups(row_obj, session, chunk_size: int = 5000, max_chunks: int or None = None, pause: float = 0.0,
+                     cancel_event=None) -> dict:
+    """=== Function name: BACKFILL_rollups =============================================================================
+    SQL action. Rolls up the raw rows of <row_obj>'s table stored before rollups existed, by chunks in order of
+    insertion. Every chunk is merged into the rollups and the progress is moved in one transaction: rows are never
+    counted twice, and an interrupted backfill resumes after the last chunk committed. Rows may be stored meanwhile.
+    Progress must have been created by < PREPARE_backfill() >.
+    :param chunk_size: int - raw rows per transaction
+    :param max_chunks: int - chunks rolled up by this call - None: until finished
+    :param pause: float - seconds between two chunks: writers get the DB
+    :param cancel_event: threading.Event - if set, backfill stops after the current chunk
+    :return: dict - the progress, see < PREPARE_backfill() >
+    ============================================================================================== by Sziller ==="""
+    table, progress_table = row_obj.__table__, RollupBackfill.__table__
+    rowid = literal_column("rowid")
+    names = [_.name for _ in table.columns]
+    n_chunks = 0
+    progress = backfill_progress(session=session)
+    while not progress["finished_at"] and (max_chunks is None or n_chunks < max_chunks):
+        if n_chunks and (cancel_event is not None and cancel_event.is_set()):
+            break
+        if n_chunks and pause:
+            time.sleep(pause)
+        rows = session.execute(select(rowid, *table.columns)
+                               .where(rowid > progress["cursor"], rowid <= progress["last_rowid"])
+                               .order_by(rowid).limit(chunk_size)).all()
+        ADD_records_to_rollups(records=[MeasurementRecord(**dict(zip(names, _[1:]))) for _ in rows],
+                               session=session, commit=False)
+        cursor = rows[-1][0] if rows else progress["last_rowid"]
+        finished = len(rows) < chunk_size or cursor >= progress["last_rowid"]
+        session.execute(progress_table.update().where(progress_table.c.backfill_id == 1)
+                        .values(cursor=cursor, n_rows=progress_table.c.n_rows + len(rows),
+                                finished_at=time.time() if finished else 0.0))
+        session.commit()
+        n_chunks += 1
+        progress = backfill_progress(session=session)
+    if progress["finished_at"] and n_chunks:
+        lg.info("rollups   : backfill finished, {} stored measurements rolled up".format(progress["n_rows"]))
+    return progress
+
+
+def backfill_progress(session) -> dict or None:
+    """Returns the progress of the backfill of rollups - see < PREPARE_backfill() > - None if not created yet"""
+    table = RollupBackfill.__table__
+    row = session.execute(select(table).where(table.c.backfill_id == 1)).mappings().first()
+    session.commit()
+    return None if row is None else {_: row[_] for _ in ("last_rowid", "cursor", "n_rows", "started_at",
+                                                         "finished_at")}
+
+
+def rollups_empty(session) -> bool:
+    """True if there are no buckets in the finest rollup level"""
+    table = next(iter(ROLLUP_LEVELS.values()))[1].__table__
+    result = session.execute(select(table.c.bucket_start).limit(1)).first() is None
+    session.commit()
+    return result
+
+
+def APPLY_retention(row_obj, session, horizons: dict, chunk_size: int = 2000, pause: float = 0.05,
+                    cancel_event=None, now: float or None = None) -> dict:
+    """=== Function name: APPLY_retention ==============================================================================
+    SQL action. Deletes raw rows, and rollup buckets older than their horizon - by chunks, each in a transaction of
+    its own, with <pause> seconds between them: writers get the DB between two chunks.
+    The data deleted lives on in the coarser rollup levels: e.g. raw rows kept for 30 days, minutes for 90 days,
+    hours for 2 years, days forever.
+    :param row_obj: Base - the class of the raw rows, e.g. Measurement
+    :param horizons: dict - "raw", "minute", "hour", "day": seconds data is kept for. None or missing: forever
+    :param cancel_event: threading.Event - if set, deletion stops after the current chunk
+    :return: dict - level: number of rows deleted
+    ============================================================================================== by Sziller ==="""
+    now = time.time() if now is None else now
+    deleted = {}
+    targets = [("raw", row_obj, "timestamp")] + [(level, _[1], "bucket_start") for level, _ in ROLLUP_LEVELS.items()]
+    for level, target, time_key in targets:
+        horizon = horizons.get(level)
+        if not horizon:
+            continue
+        deleted[level] = SQLi.DELETE_rows_older_than(row_obj=target, session=session, time_key=time_key,
+                                                     cutoff=now - horizon, chunk_size=chunk_size, pause=pause,
+                                                     cancel_event=cancel_event)
+        if deleted[level]:
+            lg.info("retention : {} {} rows deleted, older than {:.0f} s".format(deleted[level], level, horizon))
+    return deleted
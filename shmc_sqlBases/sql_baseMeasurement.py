@@ -4,30 +4,58 @@ by Sziller
 """
 
 # imports for general Base handling START                                                   -   START   -
-from sqlalchemy import Column, Integer, String, JSON, Float
+from sqlalchemy import Column, Integer, String, JSON, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 # imports for general Base handling ENDED                                                   -   ENDED   -
 
 # imports for local Base handling   START                                                   -   START   -
 import time
-from cryptography import HashFunctions as HaFu
+import hashlib
+from typing import NamedTuple
 # imports for local Base handling   ENDED                                                   -   ENDED   -
 
 Base = declarative_base()
 
 
+def measurement_id_blake2b(mea_type: str, mea_loc: str, mea_val: float, timestamp: float) -> str:
+    """=== Function name: measurement_id_blake2b ======================================================================
+    Default ID of a Measurement: 16 hex chars (64 bit) of a BLAKE2b digest over type, location, value and timestamp.
+    Two sensors of the same type measuring in the same instant get different IDs; the same measurement sent twice
+    gets the same ID, so it is stored once. Numbers are hashed as floats: 21 and 21.0 give the same ID.
+    ============================================================================================== by Sziller ==="""
+    return hashlib.blake2b("{}\x1f{}\x1f{!r}\x1f{!r}".format(
+        mea_type, mea_loc,
+        float(mea_val) if mea_val is not None else None,
+        float(timestamp)).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def measurement_id_legacy(mea_type: str, mea_loc: str, mea_val: float, timestamp: float) -> str:
+    """=== Function name: measurement_id_legacy =======================================================================
+    Former ID of a Measurement: first 16 hex chars of SHA-256 over type and timestamp only - location and value are
+    ignored, so simultaneous measurements of the same type collide. Use it to keep matching IDs already stored.
+    ============================================================================================== by Sziller ==="""
+    return hashlib.sha256("{}{}".format(mea_type, timestamp).encode("utf-8")).hexdigest()[:16]
+
+
+ID_SCHEMES: dict = {"blake2b": measurement_id_blake2b,
+                    "legacy": measurement_id_legacy}
+
+
 class Measurement(Base):
     """=== Classname: Record(Base) =====================================================================================
     Class represents general record who's data is to be stored and processed by the DB
     ============================================================================================== by Sziller ==="""
     __tablename__ = "measurements"
+    __table_args__ = (Index("ix_measurements_loc_type_ts", "mea_loc", "mea_type", "timestamp"),  # per-sensor ranges
+                      Index("ix_measurements_ts", "timestamp"))  # ranges over all sensors, ordered exports
     mea_hash: str = Column("mea_hash", String, primary_key=True)
     mea_type: str = Column("mea_type", String)
     mea_loc: str = Column("mea_loc", String)
     mea_val: float = Column("mea_val", Float)
     mea_dim: str = Column("mea_dim", String)
-    mea_time: str = Column("mea_time", String)
-    timestamp: float = Column("timestamp", Integer)
+    mea_time: str = Column("mea_time", String)  # human readable only - query time by <timestamp>
+    timestamp: float = Column("timestamp", Float)  # UNIX time, sec.
+    id_scheme: str = "blake2b"  # key of ID_SCHEMES - set "legacy" to keep generating IDs of former versions
 
     def __init__(self,
                  mea_type: str,
@@ -35,31 +63,28 @@ class Measurement(Base):
                  mea_val: float,
                  mea_dim: str,
                  mea_time: str,
-                 timestamp: int = 0
+                 timestamp: float = 0.0
                  ):
-        self.mea_hash: str = self.generate_id_hash()
+        if timestamp == 0.0:
+            timestamp = time.time()
+        self.mea_hash: str = ID_SCHEMES[self.id_scheme](mea_type, mea_loc, mea_val, timestamp)
         self.mea_type: str = mea_type
         self.mea_loc: str = mea_loc
         self.mea_val: float = mea_val
         self.mea_dim: str = mea_dim
         self.mea_time: str = mea_time
         self.timestamp: float = timestamp
-        if self.timestamp == 0:
-            self.timestamp = time.time()
-        self.mea_hash: str = self.generate_id_hash()
 
     def generate_id_hash(self):
-        """Function adds a unique ID to the row"""
-        return HaFu.single_sha256_byte2byte(bytes(
-            "{}{}".format(self.mea_type, self.timestamp),
-            "utf-8")).hex()[:16]
+        """Function returns the unique ID of the row, by < self.id_scheme >"""
+        return ID_SCHEMES[self.id_scheme](self.mea_type, self.mea_loc, self.mea_val, self.timestamp)
 
     def return_as_dict(self):
         """=== Method name: return_as_dict =============================================================================
         Returns instance as a dictionary
         @return : dict - parameter: argument pairs in a dict
         ========================================================================================== by Sziller ==="""
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        return {_: getattr(self, _) for _ in MEASUREMENT_COLUMNS}
 
     @classmethod
     def construct(cls, d_in):
@@ -77,4 +102,57 @@ class Measurement(Base):
                                                   self.mea_dim,
                                                   self.timestamp)
 
+
+MEASUREMENT_COLUMNS: tuple = tuple(_.name for _ in Measurement.__table__.columns)  # in table order
+
+
+class MeasurementRecord(NamedTuple):
+    """=== Classname: MeasurementRecord(NamedTuple) ====================================================================
+    Lightweight, immutable row of the <measurements> table - for bulk ingest, without ORM instances.
+    Fields follow the column order of Measurement (MEASUREMENT_COLUMNS), so a record can be inserted as it is by
+    < SQL_interface.ADD_records_to_table() >. Instantiate by < new() > to get validated values and the row ID.
+    ============================================================================================== by Sziller ==="""
+    mea_hash: str
+    mea_type: str
+    mea_loc: str
+    mea_val: float
+    mea_dim: str
+    mea_time: str
+    timestamp: float
+
+    @classmethod
+    def new(cls,
+            mea_type: str,
+            mea_loc: str,
+            mea_val: float,
+            mea_dim: str,
+            mea_time: str = "",
+            timestamp: float = 0.0,
+            id_scheme: str or None = None):
+        """=== Classmethod: new ========================================================================================
+        Validates a measurement and returns it as a record, including its ID - as Measurement() would generate it.
+        @param id_scheme: str - key of ID_SCHEMES, None: < Measurement.id_scheme >
+        @return: MeasurementRecord
+        ========================================================================================== by Sziller ==="""
+        if not mea_type or not mea_loc:
+            raise ValueError("<mea_type> and <mea_loc> must not be empty: {!r}, {!r}".format(mea_type, mea_loc))
+        mea_val = float(mea_val)
+        if not float(timestamp):
+            timestamp = time.time()
+        # ID is generated from <timestamp> as entered - "legacy" IDs hash its text: 1700000000 != 1700000000.0
+        return cls(ID_SCHEMES[id_scheme or Measurement.id_scheme](mea_type, mea_loc, mea_val, timestamp),
+                   mea_type, mea_loc, mea_val, mea_dim, mea_time, float(timestamp))
+
+    @classmethod
+    def construct(cls, d_in):
+        """=== Classmethod: construct ==================================================================================
+        Same input as < Measurement.construct() >: a dict of keyword arguments of < new() >.
+        @return: MeasurementRecord
+        ========================================================================================== by Sziller ==="""
+        return cls.new(**d_in)
+
+    def return_as_dict(self):
+        """Returns record as a dictionary, same as < Measurement.return_as_dict() >"""
+        return dict(zip(MEASUREMENT_COLUMNS, self))
+
 # CLASS definitions ENDED                                                                   -   ENDED   -
@@ -0,0 +1,35 @@
+"""
+SQLAlchemy powered DB Bases: local outbox of Engines - results and measurements waiting for upload.
+by Sziller
+"""
+
+# imports for general Base handling START                                                   -   START   -
+from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy.ext.declarative import declarative_base
+# imports for general Base handling ENDED                                                   -   ENDED   -
+
+Base = declarative_base()
+
+
+class OutboxEntry(Base):
+    """=== Classname: OutboxEntry(Base) ===============================================================================
+    One entry of the outbox, identified by its sequence number.
+    AUTOINCREMENT: sequence numbers are never reused, not even after every entry has been compacted away - the server
+    can always tell new entries from acknowledged ones.
+    ============================================================================================== by Sziller ==="""
+    __tablename__ = "outbox_entries"
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq: int = Column("seq", Integer, primary_key=True, autoincrement=True)
+    kind: str = Column("kind", String)  # e.g. "measurements", "result"
+    created_at: float = Column("created_at", Float)  # UNIX time, sec.
+    size: int = Column("size", Integer)  # bytes of <payload>
+    payload: str = Column("payload", Text)  # JSON
+
+
+class OutboxState(Base):
+    """=== Classname: OutboxState(Base) ===============================================================================
+    Key - value state of the outbox, e.g. "acked_seq": the greatest sequence number acknowledged by the server.
+    ============================================================================================== by Sziller ==="""
+    __tablename__ = "outbox_state"
+    key: str = Column("key", String, primary_key=True)
+    value: int = Column("value", Integer)
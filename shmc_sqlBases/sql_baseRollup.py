@@ -0,0 +1,76 @@
+"""
+SQLAlchemy powered DB Bases: rollups - aggregates of measurements per minute, hour and day.
+by Sziller
+"""
+
+# imports for general Base handling START                                                   -   START   -
+from sqlalchemy import Column, Integer, String, Float, Index
+from sqlalchemy.ext.declarative import declarative_base
+# imports for general Base handling ENDED                                                   -   ENDED   -
+
+Base = declarative_base()
+
+
+class RollupColumns:
+    """=== Classname: RollupColumns ====================================================================================
+    Columns of every rollup table: one row per sensor (mea_loc, mea_type) and bucket.
+    Sum is kept instead of mean, so buckets can be updated incrementally: mean = mea_sum / mea_count.
+    NOTE: no type annotations on mixin columns - SQLAlchemy would take them for annotated declarative mappings.
+    ============================================================================================== by Sziller ==="""
+    mea_loc = Column("mea_loc", String, primary_key=True)
+    mea_type = Column("mea_type", String, primary_key=True)
+    bucket_start = Column("bucket_start", Float, primary_key=True)  # UNIX time, sec. - UTC aligned
+    mea_count = Column("mea_count", Integer)
+    mea_sum = Column("mea_sum", Float)
+    mea_min = Column("mea_min", Float)
+    mea_max = Column("mea_max", Float)
+
+    def return_as_dict(self):
+        """Returns row as a dictionary, mean included"""
+        return {"mea_loc": self.mea_loc,
+                "mea_type": self.mea_type,
+                "bucket_start": self.bucket_start,
+                "count": self.mea_count,
+                "min": self.mea_min,
+                "max": self.mea_max,
+                "mean": self.mea_sum / self.mea_count if self.mea_count else None}
+
+
+class RollupMinute(RollupColumns, Base):
+    """Aggregates of measurements per minute"""
+    __tablename__ = "rollup_minute"
+    __table_args__ = (Index("ix_rollup_minute_bucket", "bucket_start"),)  # ranges over all sensors, retention
+
+
+class RollupHour(RollupColumns, Base):
+    """Aggregates of measurements per hour"""
+    __tablename__ = "rollup_hour"
+    __table_args__ = (Index("ix_rollup_hour_bucket", "bucket_start"),)  # ranges over all sensors, retention
+
+
+class RollupDay(RollupColumns, Base):
+    """Aggregates of measurements per (UTC) day"""
+    __tablename__ = "rollup_day"
+    __table_args__ = (Index("ix_rollup_day_bucket", "bucket_start"),)  # ranges over all sensors, retention
+
+
+# level: (bucket size in sec., table class) - finest first
+ROLLUP_LEVELS: dict = {"minute": (60, RollupMinute),
+                       "hour": (3600, RollupHour),
+                       "day": (86400, RollupDay)}
+
+
+class RollupBackfill(Base):
+    """=== Classname: RollupBackfill(Base) =============================================================================
+    Progress of rolling up the raw rows stored before rollups existed - one row per DB. Raw rows are identified by
+    their insertion order (SQLite rowid): the backfill covers rowids up to <last_rowid>, rows stored later are rolled
+    up when stored. <cursor> is moved in the transaction of every chunk rolled up: an interrupted backfill resumes
+    right after the last chunk committed.
+    ============================================================================================== by Sziller ==="""
+    __tablename__ = "rollup_backfill"
+    backfill_id: int = Column("backfill_id", Integer, primary_key=True)  # always 1
+    last_rowid: int = Column("last_rowid", Integer)  # newest raw row to be rolled up by the backfill
+    cursor: int = Column("cursor", Integer)  # last raw row rolled up
+    n_rows: int = Column("n_rows", Integer)  # raw rows rolled up so far
+    started_at: float = Column("started_at", Float)  # UNIX time, sec.
+    finished_at: float = Column("finished_at", Float)  # UNIX time, sec. - 0.0 while in progress
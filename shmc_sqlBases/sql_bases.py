@@ -4,15 +4,16 @@ by Sziller
 """
 
 # imports for general Base handling START                                                   -   START   -
-from sqlalchemy import Column, Integer, String, JSON, Float
+from sqlalchemy import Column, Integer, String, JSON, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 # imports for general Base handling ENDED                                                   -   ENDED   -
 
 # imports for local Base handling   START                                                   -   START   -
 import time
 import random as rnd
-from cryptography import HashFunctions as HaFu
 from shmc_basePackage import models
+from shmc_sqlBases.sql_baseMeasurement import ID_SCHEMES
+from shmc_sqlBases.sql_baseMeasurement import MEASUREMENT_COLUMNS
 
 # imports for local Base handling   ENDED                                                   -   ENDED   -
 
@@ -24,13 +25,16 @@ class Measurement(Base):
     Class represents general record who's data is to be stored and processed by the DB
     ============================================================================================== by Sziller ==="""
     __tablename__ = "measurements"
+    __table_args__ = (Index("ix_measurements_loc_type_ts", "mea_loc", "mea_type", "timestamp"),  # per-sensor ranges
+                      Index("ix_measurements_ts", "timestamp"))  # ranges over all sensors, ordered exports
     mea_hash: str = Column("mea_hash", String, primary_key=True)
     mea_type: str = Column("mea_type", String)
     mea_loc: str = Column("mea_loc", String)
     mea_val: float = Column("mea_val", Float)
     mea_dim: str = Column("mea_dim", String)
-    mea_time: str = Column("mea_time", String)
-    timestamp: float = Column("timestamp", Float)
+    mea_time: str = Column("mea_time", String)  # human readable only - query time by <timestamp>
+    timestamp: float = Column("timestamp", Float)  # UNIX time, sec.
+    id_scheme: str = "blake2b"  # key of ID_SCHEMES - set "legacy" to keep generating IDs of former versions
 
     def __init__(self,
                  mea_type: str,
@@ -40,29 +44,26 @@ class Measurement(Base):
                  mea_time: str,
                  timestamp: float = 0.0
                  ):
-        self.mea_hash: str = self.generate_id_hash()
+        if timestamp == 0.0:
+            timestamp = time.time()
+        self.mea_hash: str = ID_SCHEMES[self.id_scheme](mea_type, mea_loc, mea_val, timestamp)
         self.mea_type: str = mea_type
         self.mea_loc: str = mea_loc
         self.mea_val: float = mea_val
         self.mea_dim: str = mea_dim
         self.mea_time: str = mea_time
         self.timestamp: float = timestamp
-        if self.timestamp == 0.0:
-            self.timestamp = time.time()
-        self.mea_hash: str = self.generate_id_hash()
 
     def generate_id_hash(self):
-        """Function adds a unique ID to the row"""
-        return HaFu.single_sha256_byte2byte(bytes(
-            "{}{}".format(self.mea_type, self.timestamp),
-            "utf-8")).hex()[:16]
+        """Function returns the unique ID of the row, by < self.id_scheme >"""
+        return ID_SCHEMES[self.id_scheme](self.mea_type, self.mea_loc, self.mea_val, self.timestamp)
 
     def return_as_dict(self):
         """=== Method name: return_as_dict =============================================================================
         Returns instance as a dictionary
         @return : dict - parameter: argument pairs in a dict
         ========================================================================================== by Sziller ==="""
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        return {_: getattr(self, _) for _ in MEASUREMENT_COLUMNS}
 
     @classmethod
     def construct(cls, d_in):
@@ -0,0 +1,55 @@
+"""
+Shared fixtures of the tests: an EngineObservatory on a temporary DB, with a synthetic camera and no main loop.
+by Sziller
+"""
+
+import queue
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from engine_Observatory.Engine_Observatory import EngineObservatory
+
+
+class LooplessEngine(EngineObservatory):
+    """EngineObservatory whose main loop is not started on init: tests call its methods directly"""
+    def go(self):
+        pass
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """Returns a factory of Engines on DB-s in <tmp_path>, every one of them stopped at teardown"""
+    engines = []
+
+    def factory(hcdd: dict or None = None, **kwargs):
+        settings = {"camera_backend": "synthetic",
+                    "camera_warm_start": False,
+                    "photo_dir": str(tmp_path / "photos"),
+                    "archive_dir": str(tmp_path / "archive"),
+                    "outbox_enabled": False,
+                    "retention_every": 0.0}
+        settings.update(hcdd or {})
+        kwargs.setdefault("session_name", str(tmp_path / "engine.db"))
+        engine = LooplessEngine(schedule=[], room_id="test", queue_eng_to_hub=queue.Queue(), hcdd=settings,
+                                **kwargs)
+        engines.append(engine)
+        return engine
+
+    yield factory
+    for engine in engines:
+        engine.sensor_ingest.stop(timeout=2.0)
+        if engine.writer is not None:
+            engine.writer.close(timeout=2.0)
+        engine.executor.shutdown(wait=True)
+        engine.camera.close()
+    SQLi.dispose_engines()
+
+
+def responses(engine) -> dict:
+    """Takes every response the Engine has sent so far: timestamp of the request answered: response"""
+    answered = {}
+    while True:
+        try:
+            response = engine.queue_eng_to_hub.get_nowait()
+        except queue.Empty:
+            return answered
+        answered[response.timestamp] = response
@@ -0,0 +1,133 @@
+"""
+Tests of the camera stage: Engine_Camera backends, Engine_FrameWriter, and GET_photo driving both.
+by Sziller
+"""
+
+import sys
+import types
+import threading
+import numpy as np
+import pytest
+from engine_Observatory.Engine_Camera import Picamera2Backend
+from engine_Observatory.Engine_Camera import SyntheticBackend
+from engine_Observatory.Engine_FrameWriter import FrameBufferPool
+from engine_Observatory.Engine_FrameWriter import FrameWriter
+
+
+class GatedSaver:
+    """save_frame() of a FrameWriter blocking until <gate> is set: frames pile up in the queue meanwhile"""
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.saved = []
+
+    def __call__(self, frame: np.ndarray, filename: str):
+        self.started.set()
+        self.gate.wait(5.0)
+        self.saved.append((filename, int(frame[0, 0, 0])))
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_pool_blocks_when_exhausted_until_a_buffer_is_released():
+    pool = FrameBufferPool(size=2)
+    first, _ = pool.acquire(shape=(4, 4, 3)), pool.acquire(shape=(4, 4, 3))
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(shape=(4, 4, 3))))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive() and not acquired
+    pool.release(first)
+    waiter.join(2.0)
+    assert acquired and acquired[0] is first  # buffers are reused, not reallocated
+
+
+def test_block_policy_waits_for_the_writer_and_drops_nothing(tmp_path):
+    saver = GatedSaver()
+    writer = FrameWriter(save_frame=saver, output_dir=str(tmp_path), n_workers=1, queue_size=2, policy="block")
+    writer.submit(buffer=frame(0), filename="0")
+    assert saver.started.wait(2.0)  # frame 0 in progress, the queue is empty
+    writer.submit(buffer=frame(1), filename="1")
+    writer.submit(buffer=frame(2), filename="2")
+    producer = threading.Thread(target=writer.submit, kwargs={"buffer": frame(3), "filename": "3"})
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()  # queue full: producer blocked
+    saver.gate.set()
+    producer.join(2.0)
+    assert writer.flush(timeout=2.0)
+    assert [_[1] for _ in saver.saved] == [0, 1, 2, 3]
+    assert writer.as_dict()["dropped"] == 0 and writer.as_dict()["written"] == 4
+
+
+def test_drop_oldest_policy_keeps_the_newest_frames_and_returns_dropped_buffers(tmp_path):
+    saver = GatedSaver()
+    writer = FrameWriter(save_frame=saver, output_dir=str(tmp_path), n_workers=1, queue_size=2, policy="drop_oldest")
+    buffers = [writer.acquire_buffer(shape=(4, 4, 3)) for _ in range(4)]  # pool: queue + worker + 1 = 4 buffers
+    for value, buffer in enumerate(buffers):
+        buffer[:] = value
+    writer.submit(buffer=buffers[0], filename="0")
+    assert saver.started.wait(2.0)
+    for value in (1, 2, 3):
+        writer.submit(buffer=buffers[value], filename=str(value))  # never blocks
+    assert writer.as_dict()["dropped"] == 1
+    assert len(writer.pool.free) == 1  # the dropped frame's buffer is back in the pool
+    assert not writer.flush(timeout=0.1)  # still writing
+    saver.gate.set()
+    assert writer.flush(timeout=2.0)
+    assert [_[1] for _ in saver.saved] == [0, 2, 3]
+    assert len(writer.pool.free) == 4
+
+
+def test_get_photo_writes_every_frame_of_the_loop(make_engine, tmp_path):
+    engine = make_engine(hcdd={"camera_kwargs": {"fps": 200.0, "size": (32, 24)}, "camera_settle_time": 0.0,
+                               "writer_queue_size": 2, "writer_workers": 1, "writer_policy": "block"},
+                         finite_looping=6, rotation=0)
+    filenames = engine.GET_photo(timestamp=1000.0)
+    assert filenames == ["1000-photo_{}.jpg".format(_) for _ in range(1, 7)]
+    frame_numbers = []
+    for filename in filenames:  # no PIL: the synthetic backend saves raw arrays under the name
+        with open(tmp_path / "photos" / filename, "rb") as file:
+            saved = np.load(file)
+        frame_numbers.append(int.from_bytes(saved[0, :8, 0].tobytes(), "little"))
+    assert frame_numbers == sorted(frame_numbers) and len(set(frame_numbers)) == 6
+    assert engine.frame_writer.as_dict()["written"] == 6
+    assert engine.camera.as_dict()["n_captures"] == 6
+
+
+def test_synthetic_rotation_turns_the_frame():
+    upright, turned = SyntheticBackend(size=(16, 8)), SyntheticBackend(size=(16, 8), rotation=180)
+    upright.start()
+    turned.start()
+    assert np.array_equal(turned.base_frame, upright.base_frame[::-1, ::-1])
+    with pytest.raises(ValueError):
+        SyntheticBackend(rotation=90)
+
+
+def test_picamera2_requests_rgb_ordered_frames_and_sensor_rotation(monkeypatch):
+    configured = {}
+
+    class FakePicamera2:
+        def create_video_configuration(self, **kwargs):
+            configured.update(kwargs)
+            return kwargs
+
+        def configure(self, config):
+            pass
+
+        def start(self):
+            pass
+
+    class FakeTransform:
+        def __init__(self, hflip=0, vflip=0):
+            self.hflip, self.vflip = hflip, vflip
+
+    monkeypatch.setitem(sys.modules, "picamera2", types.SimpleNamespace(Picamera2=FakePicamera2))
+    monkeypatch.setitem(sys.modules, "libcamera", types.SimpleNamespace(Transform=FakeTransform))
+    Picamera2Backend(rotation=180).start()
+    assert configured["main"]["format"] == "BGR888"  # libcamera's BGR888 is R, G, B in memory
+    assert (configured["transform"].hflip, configured["transform"].vflip) == (1, 1)
+    with pytest.raises(ValueError):
+        Picamera2Backend(rotation=90)
@@ -0,0 +1,58 @@
+"""
+Tests of Engine_CommandExecutor: the job store, and the process pool used by the Engine's export.
+by Sziller
+"""
+
+import os
+import threading
+import pytest
+from shmc_messages import codec
+from shmc_messages import msg
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+from engine_Observatory.Engine_CommandExecutor import CommandExecutor
+
+
+def test_record_rejects_a_used_job_id_and_keeps_the_stored_job():
+    executor = CommandExecutor(n_threads=1)
+    release = threading.Event()
+    executor.submit(job_id=1.0, command="GET_slow", function=lambda cancel_event: release.wait(5.0), kwargs={})
+    with pytest.raises(ValueError):
+        executor.record(job_id=1.0, command="GET_fast", result="fast")
+    executor.record(job_id=2.0, command="GET_fast", result="fast")
+    with pytest.raises(ValueError):
+        executor.record(job_id=2.0, command="GET_other", result="other")
+    release.set()
+    executor.shutdown(wait=True)
+    assert executor.status(1.0)["command"] == "GET_slow" and executor.status(1.0)["result"] is True
+    assert executor.status(2.0)["result"] == "fast"
+
+
+def test_engine_keeps_the_first_fire_and_forget_job_of_a_timestamp(make_engine):
+    engine = make_engine()
+    engine.process_requests(requests=[msg.InternalMsg(payload=None, timestamp=5.0, synced=False,
+                                                      command="GET_basic_config")])
+    engine.process_requests(requests=[msg.InternalMsg(payload={"job_id": 5.0}, timestamp=5.0, synced=False,
+                                                      command="GET_job_status")])
+    assert engine.executor.status(5.0)["command"] == "GET_basic_config"
+
+
+def test_run_in_process_runs_in_the_pool_or_in_the_calling_thread():
+    pooled, inline = CommandExecutor(n_processes=1), CommandExecutor()
+    assert pooled.run_in_process(os.getpid) != os.getpid()
+    assert inline.run_in_process(os.getpid) == os.getpid()
+    pooled.shutdown()
+    inline.shutdown()
+
+
+def test_export_pages_are_encoded_in_the_process_pool(make_engine, monkeypatch):
+    engine = make_engine(hcdd={"executor_processes": 1})
+    records = [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=float(_), mea_dim="C",
+                                     timestamp=1_700_000_000.0 + _) for _ in range(10)]
+    engine.store_measurements(records=records)
+    encoded = []
+    submit = engine.executor.processes.submit
+    monkeypatch.setattr(engine.executor.processes, "submit",
+                        lambda function, *args: encoded.append(function) or submit(function, *args))
+    page = engine.GET_full_db_data(payload={"since": None, "after": None, "page_size": None})
+    assert encoded == [codec.encode_columns]
+    assert codec.decode_columns(page["data"])["mea_val"] == [float(_) for _ in range(10)]
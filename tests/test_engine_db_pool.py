@@ -0,0 +1,44 @@
+"""
+Tests of the Engine's DB connection pool: sized for every thread holding a session at once.
+by Sziller
+"""
+
+import threading
+from shmc_sqlAccess import SQL_interface as SQLi
+
+
+def test_pool_has_a_connection_for_every_db_thread(make_engine):
+    engine = make_engine(hcdd={"executor_threads": 4, "executor_lanes": {"camera": 1, "db": 2, "network": 1},
+                               "sensors": [{"driver": "simulated", "mea_type": "temperature", "mea_loc": "test",
+                                            "mea_dim": "C", "interval": 10.0}]})
+    assert engine.db_pool_kwargs["pool_size"] == 1 + 4 + 1 + 1  # loop, lane threads, sensor flusher, writer
+    stats = engine.GET_basic_config()["db_pools"]
+    pool = next(_ for url, _ in stats.items() if url.endswith("engine.db"))
+    assert pool["size"] == 7
+
+
+def test_busy_threads_do_not_wait_for_each_other(make_engine):
+    engine = make_engine(hcdd={"executor_threads": 4, "executor_lanes": {"db": 4}, "db_pool_timeout": 1.0})
+    holding, release, errors = threading.Barrier(5), threading.Event(), []
+
+    def hold_a_connection():
+        try:
+            session = engine.db_session()
+            session.connection()  # checked out until the session is closed
+            holding.wait(5.0)
+            release.wait(5.0)
+            session.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hold_a_connection) for _ in range(4)]  # more than the former 1 + 2 overflow
+    for thread in threads:
+        thread.start()
+    holding.wait(5.0)
+    engine.session.connection()  # the loop's own session still gets one, at once
+    engine.session.close()
+    release.set()
+    for thread in threads:
+        thread.join(5.0)
+    assert not errors
+    assert max(_["checked_out"] for _ in SQLi.get_pool_stats().values()) == 0
@@ -0,0 +1,117 @@
+"""
+Tests of the Engine's dispatch: < EngineObservatory.process_requests() >.
+by Sziller
+"""
+
+import time
+import threading
+from shmc_messages import msg
+from tests.conftest import responses
+
+
+def request(command: str, timestamp: float, payload=None, synced: bool = True) -> msg.InternalMsg:
+    return msg.InternalMsg(payload=payload, timestamp=timestamp, synced=synced, command=command)
+
+
+def test_rejected_first_request_calls_on_finished_once(make_engine):
+    engine = make_engine()
+    calls = []
+    engine.commands.register(name="GET_lane", handler=lambda **kwargs: "ok", lane="db")
+    engine.process_requests(requests=[request("GET_nonexistent", 1.0), request("GET_lane", 2.0)],
+                            on_finished=lambda: calls.append(1))
+    assert calls == [1]  # at once: the first request is rejected, the lane job of the second one is not waited for
+    time.sleep(0.1)
+    assert calls == [1]
+    answered = responses(engine)
+    assert "unknown command" in answered[1.0].message
+    assert answered[2.0].payload == "ok"
+
+
+def test_lane_first_request_calls_on_finished_once_when_job_is_done(make_engine):
+    engine = make_engine()
+    release = threading.Event()
+    finished = threading.Event()
+    calls = []
+    engine.commands.register(name="GET_slow", handler=lambda **kwargs: release.wait(5.0), lane="db")
+    engine.process_requests(requests=[request("GET_slow", 1.0), request("GET_basic_config", 2.0)],
+                            on_finished=lambda: (calls.append(1), finished.set()))
+    assert calls == []  # first request still running on the executor
+    release.set()
+    assert finished.wait(5.0)
+    time.sleep(0.05)
+    assert calls == [1]
+
+
+def test_on_finished_called_once_if_processing_fails(make_engine):
+    engine = make_engine()
+    calls = []
+
+    def failing_respond(*args, **kwargs):
+        raise RuntimeError("hub gone")
+
+    engine.respond = failing_respond
+    try:
+        engine.process_requests(requests=[request("GET_basic_config", 1.0)], on_finished=lambda: calls.append(1))
+    except RuntimeError:
+        pass
+    assert calls == [1]
+
+
+def test_wake_to_dispatch_excludes_inline_runs(make_engine):
+    engine = make_engine()
+    engine.commands.register(name="GET_sleepy", handler=lambda **kwargs: time.sleep(0.2))
+    woken_at = time.perf_counter()
+    engine.process_requests(requests=[request("GET_sleepy", 1.0), request("GET_basic_config", 2.0),
+                                      request("GET_nonexistent", 3.0)], woken_at=woken_at)
+    metric = engine.metric_wake_to_dispatch.as_dict()
+    assert metric["count"] == 3
+    assert metric["max"] < 0.1
+
+
+def test_clashing_id_rejects_only_its_own_request(make_engine):
+    engine = make_engine()
+    release = threading.Event()
+    finished = threading.Event()
+    calls = []
+    engine.commands.register(name="GET_slow", handler=lambda **kwargs: release.wait(5.0) and "ok", lane="db")
+    engine.executor.record(job_id=3.0, command="GET_basic_config", result=None)  # id 3.0 is used
+    engine.process_requests(requests=[request("GET_slow", 1.0)])
+    engine.process_requests(requests=[request("GET_slow", 2.0), request("GET_slow", 3.0), request("GET_slow", 4.0)],
+                            on_finished=lambda: (calls.append(1), finished.set()))
+    assert "job id already used" in responses(engine)[3.0].message
+    assert calls == []  # the leader still waits for the job it joined
+    release.set()
+    assert finished.wait(5.0)
+    time.sleep(0.05)
+    answered = responses(engine)
+    assert sorted(answered) == [1.0, 2.0, 4.0] and all(_.payload == "ok" for _ in answered.values())
+    assert calls == [1]
+
+
+def test_clashing_leader_id_is_rejected_and_the_rest_of_its_group_runs(make_engine):
+    engine = make_engine()
+    calls = []
+    engine.commands.register(name="GET_lane", handler=lambda **kwargs: "ok", lane="db")
+    engine.executor.record(job_id=1.0, command="GET_basic_config", result=None)
+    engine.process_requests(requests=[request("GET_lane", 1.0), request("GET_lane", 2.0)],
+                            on_finished=lambda: calls.append(1))
+    assert calls == [1]  # at once: the first request is rejected
+    time.sleep(0.1)
+    answered = responses(engine)
+    assert "job id already used" in answered[1.0].message
+    assert answered[2.0].payload == "ok" and engine.executor.jobs[2.0].result == "ok"
+
+
+def test_commands_without_schema_accept_and_ignore_any_payload(make_engine):
+    engine = make_engine(hcdd={"camera_kwargs": {"fps": 200.0, "size": (32, 24)}, "camera_settle_time": 0.0},
+                         finite_looping=1, rotation=0)
+    finished = threading.Event()
+    engine.process_requests(requests=[request("GET_photo", 1000.0, payload={"id": "obsr"}),
+                                      request("GET_basic_config", 2.0, payload="legacy")],
+                            on_finished=finished.set)
+    assert finished.wait(5.0)
+    time.sleep(0.05)
+    answered = responses(engine)
+    assert answered[1000.0].message == "" and answered[1000.0].payload == ["1000-photo_1.jpg"]
+    assert answered[2.0].message == ""
+    assert engine.commands.as_dict()["rejected"] == 0
@@ -0,0 +1,51 @@
+"""
+Tests of the incremental sync of the measurement history: < EngineObservatory.GET_full_db_data() >.
+by Sziller
+"""
+
+import time
+import pytest
+from shmc_messages import codec
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def reading(timestamp: float, value: float = 20.0) -> MeasurementRecord:
+    return MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=value, mea_dim="C",
+                                 timestamp=timestamp)
+
+
+def sync(engine, since, page_size: int = 2) -> tuple:
+    """Pages through every row newer than <since> like a client does. Returns the hashes read and the new mark"""
+    hashes, after = [], None
+    while True:
+        page = engine.GET_full_db_data(payload={"since": since, "after": after, "page_size": page_size})
+        hashes += codec.decode_columns(page["data"])["mea_hash"] if page["n_rows"] else []
+        after = page["cursor"]
+        if not page["more"]:
+            return hashes, page["high_water_mark"]
+
+
+def test_row_committed_late_is_exported_by_the_next_sync(make_engine):
+    engine = make_engine(hcdd={"export_hwm_lag": 60.0})
+    now = time.time()
+    engine.store_measurements(records=[reading(now - 30.0 + _) for _ in range(5)])
+    first, high_water_mark = sync(engine, since=None)
+    assert len(first) == 5 and high_water_mark == pytest.approx(now - 26.0 - 60.0)
+    late = reading(now - 40.0, value=99.0)  # read before the last row exported, committed after the sync
+    engine.store_measurements(records=[late])
+    second, next_mark = sync(engine, since=high_water_mark)
+    assert late.mea_hash in second
+    assert set(second) - {late.mea_hash} <= set(first)  # the overlap: rows of the lag window are sent again
+    assert next_mark == high_water_mark  # nothing newer: the mark does not move
+
+
+def test_high_water_mark_never_goes_back_or_into_the_future(make_engine):
+    engine = make_engine(hcdd={"export_hwm_lag": 60.0})
+    now = time.time()
+    assert sync(engine, since=None) == ([], None)
+    engine.store_measurements(records=[reading(now - 10.0)])
+    _, high_water_mark = sync(engine, since=now - 20.0)
+    assert high_water_mark == now - 20.0  # the lag would take it before <since>
+    engine.store_measurements(records=[reading(now + 3600.0)])  # clock of a sensor ahead
+    _, high_water_mark = sync(engine, since=None)
+    assert high_water_mark <= time.time() - 60.0
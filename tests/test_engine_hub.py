@@ -0,0 +1,71 @@
+"""
+Tests of the ROUTER mode bookkeeping of EngineMessageHandler: requests are fed to handle_router_request() directly, and
+responses are recorded instead of being sent.
+by Sziller
+"""
+
+import queue
+import socket
+import zmq
+from shmc_messages import codec
+from shmc_messages import msg
+from engine_Observatory.Engine_MessageHandlerHub import EngineMessageHandler
+
+
+class RecordingHub(EngineMessageHandler):
+    """ROUTER mode EngineMessageHandler whose loop is not started: responses are kept in <self.sent>"""
+    def listen_router(self):
+        self.sent = []
+        self.init_router_state()
+
+    def send_router_response(self, envelope: list, msg_eng_to_hub: msg.ExternalResponseMsg, wire_format: str):
+        self.sent.append((envelope[0].bytes, msg_eng_to_hub))
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def request_frames(client_id: bytes, msg_id: float) -> list:
+    frames = [client_id, b""] + codec.pack(msg.InternalMsg(payload={"msg_id": msg_id}, timestamp=msg_id,
+                                                           command="GET_ping"))
+    return [zmq.Frame(_) for _ in frames]
+
+
+def make_hub(**hcdd) -> RecordingHub:
+    settings = {"socket_mode": "ROUTER", "max_in_flight_per_client": 1}
+    settings.update(hcdd)
+    return RecordingHub(zmq_port=free_port(), queue_hub_to_eng=queue.Queue(), queue_eng_to_hub=queue.Queue(),
+                        hcdd=settings)
+
+
+def test_duplicate_of_a_backlog_request_is_refused():
+    hub = make_hub()
+    hub.handle_router_request(frames=request_frames(client_id=b"a", msg_id=1.0))
+    hub.handle_router_request(frames=request_frames(client_id=b"a", msg_id=2.0))  # waits: client's limit is 1
+    hub.handle_router_request(frames=request_frames(client_id=b"b", msg_id=2.0))
+    assert list(hub.in_flight) == [1.0] and hub.backlog_ids == {2.0}
+    assert [(_[0], _[1].message) for _ in hub.sent] == [(b"b", "duplicate message id")]
+
+
+def test_admitting_a_duplicate_keeps_the_request_in_flight():
+    hub = make_hub()
+    hub.handle_router_request(frames=request_frames(client_id=b"a", msg_id=1.0))
+    entry = hub.in_flight[1.0]
+    duplicate = request_frames(client_id=b"b", msg_id=1.0)
+    hub.admit(envelope=duplicate[:2], wire_format="codec", msg_hub_to_eng=codec.unpack(duplicate[2:])[0])
+    assert hub.in_flight[1.0] is entry and hub.client_in_flight == {b"a": 1}
+    assert [(_[0], _[1].message) for _ in hub.sent] == [(b"b", "duplicate message id")]
+
+
+def test_backlog_ids_are_freed_on_admission():
+    hub = make_hub()
+    hub.handle_router_request(frames=request_frames(client_id=b"a", msg_id=1.0))
+    hub.handle_router_request(frames=request_frames(client_id=b"a", msg_id=2.0))
+    hub.queue_eng_to_hub.put(msg.ExternalResponseMsg(payload=None, message="ok", timestamp=1.0))
+    hub.in_flight[1.0][3].result(timeout=2.0)
+    hub.finish_in_flight(msg_id=1.0, timed_out=False)
+    hub.admit_backlog()
+    assert list(hub.in_flight) == [2.0] and not hub.backlog_ids and not hub.backlog
@@ -0,0 +1,139 @@
+"""
+Tests of Engine_MotionDetector on the "moving_square" stream of the synthetic camera: frames 0-9 are still, a square
+crosses the frame on 10-19, and the scene is still again on 20-29.
+by Sziller
+"""
+
+import threading
+import tracemalloc
+import numpy as np
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from engine_Observatory.Engine_Camera import SyntheticBackend
+from engine_Observatory.Engine_FrameWriter import FrameWriter
+from engine_Observatory.Engine_MotionDetector import MotionDetector
+from engine_Observatory.Engine_MotionDetector import MotionWatch
+
+MOTION_PERIOD = 10
+
+
+class ReplayCamera:
+    """Camera serving frames 0 .. <n_frames>-1 of a synthetic stream without waiting, then cancelling the watch"""
+    def __init__(self, n_frames: int):
+        self.backend = SyntheticBackend(size=(80, 60), pattern="moving_square", motion_period=MOTION_PERIOD)
+        self.backend.start()
+        self.frame_shape = self.backend.frame_shape
+        self.n_frames = n_frames
+        self.frame_nr = 0
+        self.finished = threading.Event()
+
+    def start(self):
+        pass
+
+    def capture_into(self, buffer: np.ndarray):
+        self.backend.generate_frame(frame_nr=self.frame_nr, out=buffer)
+        self.frame_nr += 1
+        if self.frame_nr >= self.n_frames:
+            self.finished.set()
+
+
+class FrameRecorder:
+    """save_frame() of a FrameWriter keeping the number of every frame saved, instead of writing it"""
+    def __init__(self):
+        self.frame_numbers = []
+
+    def __call__(self, frame: np.ndarray, filename: str):
+        self.frame_numbers.append(int.from_bytes(frame[0, :8, 0].tobytes(), "little"))
+
+
+@pytest.fixture
+def recorder_writer(tmp_path):
+    recorder = FrameRecorder()
+    return recorder, FrameWriter(save_frame=recorder, output_dir=str(tmp_path), n_workers=1, queue_size=4)
+
+
+def watch_frames(watch: MotionWatch, n_frames: int) -> list:
+    camera = ReplayCamera(n_frames=n_frames)
+    return watch.run(camera=camera, duration=60.0, cancel_event=camera.finished)
+
+
+def test_still_frames_are_not_moving():
+    backend = SyntheticBackend(size=(80, 60), pattern="moving_square", motion_period=MOTION_PERIOD)
+    backend.start()
+    detector = MotionDetector(downscale=2)
+    ratios = [detector.update(backend.generate_frame(frame_nr=_)) for _ in range(MOTION_PERIOD)]
+    assert ratios == [0.0] * MOTION_PERIOD
+    moving = detector.update(backend.generate_frame(frame_nr=MOTION_PERIOD))
+    assert detector.is_moving(moving)
+
+
+def test_update_allocates_no_frame_sized_memory():
+    backend = SyntheticBackend(size=(80, 60), pattern="moving_square", motion_period=MOTION_PERIOD)
+    backend.start()
+    frames = [backend.generate_frame(frame_nr=_).copy() for _ in range(2 * MOTION_PERIOD)]
+    detector = MotionDetector(downscale=2)
+    detector.update(frames[0])  # buffers are allocated on the first frame
+    tracemalloc.start()
+    try:
+        ratios = [detector.update(_) for _ in frames[1:]]
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert any(detector.is_moving(_) for _ in ratios)
+    assert peak < detector.gray.nbytes  # not even one downscaled gray frame
+
+
+def test_still_stream_opens_no_event(recorder_writer):
+    recorder, writer = recorder_writer
+    watch = MotionWatch(detector=MotionDetector(downscale=2), frame_writer=writer, pre_event_frames=4,
+                        post_event_frames=3)
+    assert watch_frames(watch, n_frames=MOTION_PERIOD) == []
+    assert writer.flush(timeout=2.0)
+    assert recorder.frame_numbers == [] and watch.n_events == 0
+
+
+def test_moving_square_event_persists_pre_event_ring_and_closes_after_quiet_frames(recorder_writer):
+    recorder, writer = recorder_writer
+    watch = MotionWatch(detector=MotionDetector(downscale=2), frame_writer=writer, pre_event_frames=4,
+                        post_event_frames=3)
+    events = watch_frames(watch, n_frames=3 * MOTION_PERIOD)
+    assert writer.flush(timeout=2.0)
+    assert len(events) == 1 and not watch.as_dict()["in_event"]
+    # on frame 19 the square is over the white end of the gradient: the 1st quiet frame
+    assert events[0]["n_frames"] == 4 + (MOTION_PERIOD - 1) + 3  # pre-event ring, moving frames, quiet frames
+    assert events[0]["peak"] > watch.detector.min_area
+    assert recorder.frame_numbers == list(range(6, 22))  # 6-9 from the ring, closed by the 3rd quiet frame: 21
+
+
+def test_event_still_moving_at_the_end_is_closed(recorder_writer):
+    recorder, writer = recorder_writer
+    watch = MotionWatch(detector=MotionDetector(downscale=2), frame_writer=writer, pre_event_frames=2,
+                        post_event_frames=3)
+    events = watch_frames(watch, n_frames=MOTION_PERIOD + 5)
+    assert len(events) == 1 and events[0]["n_frames"] == 2 + 5
+    assert watch.event is None
+
+
+def test_roi_excludes_motion_outside_it(recorder_writer):
+    recorder, writer = recorder_writer
+    top_strip = MotionDetector(downscale=2, roi=[(0.0, 0.0, 1.0, 0.25)])  # the square crosses the middle
+    watch = MotionWatch(detector=top_strip, frame_writer=writer, pre_event_frames=4, post_event_frames=3)
+    assert watch_frames(watch, n_frames=3 * MOTION_PERIOD) == []
+    middle_strip = MotionDetector(downscale=2, roi=[(0.0, 0.4, 1.0, 0.6)])
+    watch = MotionWatch(detector=middle_strip, frame_writer=writer, pre_event_frames=4, post_event_frames=3)
+    events = watch_frames(watch, n_frames=3 * MOTION_PERIOD)
+    assert len(events) == 1
+    assert writer.flush(timeout=2.0)
+    assert recorder.frame_numbers[0] == 6  # the top strip persisted nothing
+
+
+def test_get_motion_watch_stores_events_as_measurements(make_engine):
+    engine = make_engine(hcdd={"camera_kwargs": {"fps": 500.0, "size": (80, 60), "pattern": "moving_square",
+                                                 "motion_period": MOTION_PERIOD},
+                               "camera_settle_time": 0.0, "motion_downscale": 2, "motion_pre_frames": 2,
+                               "motion_post_frames": 3})
+    events = engine.GET_motion_watch(timestamp=1000.0, payload={"duration": 0.3})
+    assert events and all(_["filenames"][0].startswith("1000-motion_") for _ in events)
+    rows = SQLi.QUERY_entire_table(ordered_by="timestamp", row_obj=Measurement, session=engine.db_session())
+    assert [_["mea_type"] for _ in rows].count("motion") == len(events)
@@ -0,0 +1,40 @@
+"""
+Tests of the Engine's retention of measurements: < EngineObservatory.GET_retention() >.
+by Sziller
+"""
+
+import time
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def stored_rows(engine) -> int:
+    return len(SQLi.QUERY_entire_table(ordered_by="timestamp", row_obj=Measurement, session=engine.db_session()))
+
+
+def old_readings(days: int) -> list:
+    return [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=float(_), mea_dim="C",
+                                  timestamp=time.time() - _ * 86400) for _ in range(1, days + 1)]
+
+
+def test_raw_measurements_are_kept_by_default(make_engine):
+    engine = make_engine()
+    engine.store_measurements(records=old_readings(days=400))
+    deleted = engine.GET_retention()
+    assert "raw" not in deleted and "archived" not in deleted and stored_rows(engine) == 400
+    assert deleted["minute"] > 0  # rollups are downsampled as before
+
+
+def test_archive_is_disabled_by_default(make_engine):
+    engine = make_engine()
+    assert engine.archive is None
+    with pytest.raises(ValueError):
+        engine.GET_archive()
+
+
+def test_raw_horizon_deletes_older_measurements(make_engine):
+    engine = make_engine(hcdd={"retention_horizons": {"raw": 30 * 86400 + 3600}, "archive_enabled": False})
+    engine.store_measurements(records=old_readings(days=40))
+    assert engine.GET_retention()["raw"] == 10 and stored_rows(engine) == 30
@@ -0,0 +1,129 @@
+"""
+Tests of Engine_SensorIngest: the reading ring, and batching, retrying and draining of the flusher.
+by Sziller
+"""
+
+import time
+import random
+import threading
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+from engine_Observatory.Engine_SensorIngest import ReadingRing
+from engine_Observatory.Engine_SensorIngest import SensorIngest
+from engine_Observatory.Engine_SensorIngest import SimulatedSensor
+
+
+def reading(value: float) -> MeasurementRecord:
+    return MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=value, mea_dim="C",
+                                 timestamp=1_700_000_000.0 + value)
+
+
+class FailingStore:
+    """store() of a SensorIngest failing its first <n_failures> calls - all of them if None - and keeping the rest"""
+    def __init__(self, n_failures: int or None = 0):
+        self.n_failures = n_failures
+        self.calls = []  # monotonic time of every call
+        self.stored = []
+        self.stored_event = threading.Event()
+
+    def __call__(self, records: list):
+        self.calls.append(time.monotonic())
+        if self.n_failures is None or len(self.calls) <= self.n_failures:
+            raise IOError("DB unavailable")
+        self.stored += [_.mea_val for _ in records]
+        self.stored_event.set()
+
+
+def started_ingest(store, **kwargs) -> SensorIngest:
+    ingest = SensorIngest(drivers=[], store=store, **kwargs)  # readings are appended by the test
+    ingest.start()
+    return ingest
+
+
+def test_full_ring_drops_and_counts_the_oldest_reading():
+    ring = ReadingRing(capacity=3)
+    for value in range(5):
+        ring.append(reading(value))
+    assert len(ring) == 3 and ring.n_dropped == 2
+    assert [_[1].mea_val for _ in ring.take(n_max=10)] == [2, 3, 4]
+
+
+def test_put_back_returns_a_batch_in_front_of_newer_readings():
+    ring = ReadingRing(capacity=5)
+    for value in range(3):
+        ring.append(reading(value))
+    batch = ring.take(n_max=3)
+    for value in (3, 4, 5):
+        ring.append(reading(value))
+    ring.put_back(batch)  # 2 places left: the oldest reading of the batch is dropped
+    assert [_[1].mea_val for _ in ring.take(n_max=10)] == [1, 2, 3, 4, 5]
+    assert ring.n_dropped == 1
+
+
+def test_failed_batch_is_stored_later_in_order():
+    store = FailingStore(n_failures=1)
+    ingest = started_ingest(store, flush_rows=10, max_batch_rows=4, retry_delay=0.05)
+    for value in range(10):
+        ingest.ring.append(reading(value))
+    assert ingest.flush(timeout=5.0)
+    ingest.stop(timeout=2.0)
+    assert store.stored == list(range(10))
+    assert ingest.as_dict()["store_errors"] == 1 and ingest.as_dict()["dropped"] == 0
+
+
+def test_flush_when_flush_rows_are_buffered():
+    store = FailingStore()
+    ingest = started_ingest(store, flush_rows=3, flush_age=60.0)
+    ingest.ring.append(reading(0))
+    ingest.ring.append(reading(1))
+    assert not store.stored_event.wait(0.2)
+    ingest.ring.append(reading(2))
+    assert store.stored_event.wait(2.0)
+    assert store.stored == [0, 1, 2]
+    ingest.stop(timeout=2.0)
+
+
+def test_flush_when_the_oldest_reading_is_flush_age_old():
+    store = FailingStore()
+    ingest = started_ingest(store, flush_rows=1000, flush_age=0.3)
+    appended_at = time.monotonic()
+    ingest.ring.append(reading(0))
+    assert store.stored_event.wait(3.0)
+    assert store.calls[0] - appended_at >= 0.3
+    ingest.stop(timeout=2.0)
+
+
+def test_retry_delay_grows_up_to_its_limit():
+    store = FailingStore(n_failures=None)
+    ingest = started_ingest(store, flush_rows=1, retry_delay=0.05, max_retry_delay=0.2)
+    ingest.ring.append(reading(0))
+    deadline = time.monotonic() + 5.0
+    while len(store.calls) < 6 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    ingest.stop(timeout=2.0)
+    gaps = [later - earlier for earlier, later in zip(store.calls, store.calls[1:])][:5]
+    for gap, delay in zip(gaps, (0.05, 0.1, 0.2, 0.2, 0.2)):
+        assert delay <= gap < delay + 0.15
+    assert len(ingest.ring) == 1  # never stored: kept buffered, not lost
+
+
+def test_stop_stores_the_readings_buffered():
+    store = FailingStore()
+    ingest = started_ingest(store, flush_rows=1000, flush_age=60.0)
+    for value in range(5):
+        ingest.ring.append(reading(value))
+    ingest.stop(timeout=2.0)
+    assert store.stored == list(range(5)) and not len(ingest.ring)
+    assert ingest.as_dict()["running"] is False
+
+
+def test_failing_reads_are_counted_and_the_rest_stored():
+    random.seed(1)
+    sensor = SimulatedSensor(mea_type="temperature", mea_loc="test", interval=0.01, failure_rate=0.5)
+    store = FailingStore(n_failures=2)
+    ingest = SensorIngest(drivers=[sensor], store=store, flush_rows=5, retry_delay=0.02)
+    ingest.start()
+    time.sleep(0.5)
+    ingest.stop(timeout=2.0)
+    counters = ingest.as_dict()
+    assert counters["reads"] > 0 and counters["read_errors"] > 0
+    assert counters["stored"] == counters["reads"] == len(store.stored)
@@ -0,0 +1,62 @@
+"""
+Tests of < SQL_archive.ARCHIVE_measurements() >: rows moved from the DB into the archive, none lost.
+by Sziller
+"""
+
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlAccess.SQL_archive import DAY
+from shmc_sqlAccess.SQL_archive import MeasurementArchive
+from shmc_sqlAccess.SQL_archive import ARCHIVE_measurements
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+DAY_1 = 1_700_006_400.0  # 2023-11-15 00:00 UTC
+
+
+def readings(values: list, day: float = DAY_1) -> list:
+    return [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=float(_), mea_dim="C",
+                                  timestamp=day + 60.0 * _) for _ in values]
+
+
+@pytest.fixture
+def session(tmp_path):
+    yield SQLi.createSession(db_fullname=str(tmp_path / "archive.db"), tables=[Measurement.__table__])
+    SQLi.dispose_engines()
+
+
+def stored_values(session) -> list:
+    return [_["mea_val"] for _ in SQLi.QUERY_entire_table(ordered_by="timestamp", row_obj=Measurement,
+                                                          session=session)]
+
+
+def test_row_committed_while_its_day_is_archived_is_not_lost(tmp_path, session):
+    SQLi.ADD_records_to_table(primary_key="mea_hash", records=readings(list(range(5))), row_obj=Measurement,
+                              session=session)
+    archive = MeasurementArchive(root=str(tmp_path / "archive"))
+    write_partition = archive.write_partition
+
+    def write_while_a_row_arrives(**kwargs):  # between reading the day and deleting it
+        archive.write_partition = write_partition
+        other = SQLi.createSession(db_fullname=str(tmp_path / "archive.db"), tables=[Measurement.__table__])
+        SQLi.ADD_records_to_table(primary_key="mea_hash", records=readings([100]), row_obj=Measurement,
+                                  session=other)
+        other.close()
+        return write_partition(**kwargs)
+
+    archive.write_partition = write_while_a_row_arrives
+    archived = ARCHIVE_measurements(row_obj=Measurement, session=session, archive=archive, before=DAY_1 + 3 * DAY,
+                                    chunk_size=2)
+    assert archived["rows"] == 6  # the late row was left in the DB by the first pass, and archived by the next
+    assert stored_values(session) == []
+    assert archive.read()["mea_val"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 100.0]
+
+
+def test_days_before_the_cutoff_only_are_archived(tmp_path, session):
+    records = readings([0, 1]) + readings([0, 1], day=DAY_1 + DAY) + readings([7], day=DAY_1 + 2 * DAY)
+    SQLi.ADD_records_to_table(primary_key="mea_hash", records=records, row_obj=Measurement, session=session)
+    archive = MeasurementArchive(root=str(tmp_path / "archive"))
+    archived = ARCHIVE_measurements(row_obj=Measurement, session=session, archive=archive,
+                                    before=DAY_1 + 2 * DAY + 3600.0)
+    assert (archived["days"], archived["rows"]) == (2, 4)
+    assert stored_values(session) == [7.0]
@@ -0,0 +1,117 @@
+"""
+Tests of < SQL_groupCommit.GroupCommitWriter >, and of the Engine storing measurements through it.
+by Sziller
+"""
+
+import time
+import threading
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlAccess import SQL_rollup as SQLr
+from shmc_sqlAccess.SQL_groupCommit import GroupCommitWriter
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def records(n: int, t0: float = 1_700_000_000.0) -> list:
+    return [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=_, mea_dim="C", timestamp=t0 + _)
+            for _ in range(n)]
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = GroupCommitWriter(db_fullname=str(tmp_path / "writer.db"), tables=[Measurement.__table__],
+                               max_delay=0.05)
+    yield writer
+    writer.close(timeout=2.0)
+    SQLi.dispose_engines()
+
+
+def test_submitters_share_a_commit_and_get_their_keys(writer):
+    batch = records(10)
+    futures = [writer.submit(primary_key="mea_hash", data_list=[_.return_as_dict() for _ in batch[i:i + 5]],
+                             row_obj=Measurement) for i in (0, 5)]
+    assert [sorted(_.result(timeout=5.0)) for _ in futures] == [sorted(r.mea_hash for r in batch[i:i + 5])
+                                                                for i in (0, 5)]
+    assert writer.as_dict()["commits"] == 1
+    again = writer.submit(primary_key="mea_hash", data_list=[batch[0].return_as_dict()], row_obj=Measurement)
+    assert again.result(timeout=5.0) == []  # already stored
+
+
+def test_before_commit_failure_fails_the_batch_only(writer):
+    def failing_hook(session, added):
+        raise ValueError("hook failed")
+
+    writer.before_commit = failing_hook
+    future = writer.submit(primary_key="mea_hash", data_list=[records(1)[0].return_as_dict()], row_obj=Measurement)
+    with pytest.raises(ValueError):
+        future.result(timeout=5.0)
+    writer.before_commit = None
+    assert writer.is_alive
+    retry = writer.submit(primary_key="mea_hash", data_list=[records(1)[0].return_as_dict()], row_obj=Measurement)
+    assert len(retry.result(timeout=5.0)) == 1  # the failed batch was rolled back
+
+
+def test_dead_writer_fails_pending_futures_and_refuses_new_ones(tmp_path, monkeypatch):
+    opened = threading.Event()
+
+    def failing_create_session(**kwargs):
+        opened.wait(5.0)
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(SQLi, "createSession", failing_create_session)
+    writer = GroupCommitWriter(db_fullname=str(tmp_path / "dead.db"), tables=[Measurement.__table__])
+    future = writer.submit(primary_key="mea_hash", data_list=[records(1)[0].return_as_dict()], row_obj=Measurement)
+    opened.set()
+    with pytest.raises(OSError):
+        future.result(timeout=5.0)
+    writer.thread.join(5.0)
+    assert not writer.is_alive
+    with pytest.raises(RuntimeError):
+        writer.submit(primary_key="mea_hash", data_list=[records(1)[0].return_as_dict()], row_obj=Measurement)
+    assert writer.flush(timeout=1.0)
+
+
+def test_writer_dying_mid_batch_fails_the_batch(writer, monkeypatch):
+    def broken_write(session, batch, n_rows):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(writer, "write_batch", broken_write)
+    future = writer.submit(primary_key="mea_hash", data_list=[records(1)[0].return_as_dict()], row_obj=Measurement)
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5.0)
+    assert not writer.is_alive
+
+
+def test_engine_stores_measurements_through_the_writer(make_engine):
+    engine = make_engine(hcdd={"group_commit_delay": 0.05})
+    batch = records(20, t0=time.time() - 100)
+    threads = [threading.Thread(target=engine.store_measurements, args=(batch[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5.0)
+    stats = engine.writer.as_dict()
+    assert stats["rows_committed"] == 20 and stats["commits"] < 4
+    buckets = SQLr.QUERY_rollups(level="day", session=engine.db_session(), t_from=0, t_to=time.time() + 86400)
+    assert sum(_["count"] for _ in buckets) == 20  # rollups committed together with the rows
+    assert engine.store_measurements(batch[:3]) == []
+
+
+def test_cancelled_submission_is_dropped_and_writer_stays_alive(tmp_path):
+    writer = GroupCommitWriter(db_fullname=str(tmp_path / "writer.db"), tables=[Measurement.__table__],
+                               max_delay=0.2)
+    try:
+        batch = records(3)
+        cancelled = writer.submit(primary_key="mea_hash", data_list=[batch[0].return_as_dict()], row_obj=Measurement)
+        assert cancelled.cancel()  # still waiting in the window
+        kept = writer.submit(primary_key="mea_hash", data_list=[batch[1].return_as_dict()], row_obj=Measurement)
+        assert kept.result(timeout=5.0) == [batch[1].mea_hash]
+        alone = writer.submit(primary_key="mea_hash", data_list=[batch[2].return_as_dict()], row_obj=Measurement)
+        assert alone.cancel() and writer.flush(timeout=5.0)
+        later = writer.submit(primary_key="mea_hash", data_list=[batch[0].return_as_dict()], row_obj=Measurement)
+        assert later.result(timeout=5.0) == [batch[0].mea_hash]  # the cancelled row was never written
+        assert writer.is_alive and writer.as_dict()["pending_rows"] == 0
+    finally:
+        writer.close(timeout=2.0)
+        SQLi.dispose_engines()
@@ -0,0 +1,29 @@
+"""
+Tests of the Measurement ID schemes: IDs already stored by former versions must be generated unchanged.
+by Sziller
+"""
+
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def test_legacy_id_of_an_int_timestamp_matches_former_versions():
+    record = MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=21, mea_dim="C",
+                                   timestamp=1700000000, id_scheme="legacy")
+    assert record.mea_hash == "526699cb1c50df4a"
+    assert record.timestamp == 1700000000.0 and isinstance(record.timestamp, float)
+
+
+def test_record_and_orm_row_get_the_same_id():
+    for timestamp in (1700000000, 1700000000.25):
+        record = MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=21, mea_dim="C",
+                                       timestamp=timestamp)
+        row = Measurement(mea_type="temperature", mea_loc="test", mea_val=21, mea_dim="C", mea_time="",
+                          timestamp=timestamp)
+        assert record.mea_hash == row.mea_hash
+
+
+def test_blake2b_id_tells_simultaneous_sensors_apart():
+    ids = {MeasurementRecord.new(mea_type="temperature", mea_loc=_, mea_val=21, mea_dim="C",
+                                 timestamp=1700000000).mea_hash for _ in ("kitchen", "garden")}
+    assert len(ids) == 2
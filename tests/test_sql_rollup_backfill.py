@@ -0,0 +1,105 @@
+"""
+Tests of the resumable backfill of rollups on a DB of a former version: raw rows stored, no rollups.
+by Sziller
+"""
+
+import time
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlAccess import SQL_rollup as SQLr
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+T0 = 1_700_000_000.0
+
+
+def readings(values: range) -> list:
+    return [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=float(_), mea_dim="C",
+                                  timestamp=T0 + _) for _ in values]
+
+
+def former_version_db(db_fullname: str, n_rows: int):
+    """Creates a DB holding <n_rows> raw measurements stored without rollups"""
+    session = SQLi.createSession(db_fullname=db_fullname, tables=[Measurement.__table__] + SQLr.ROLLUP_TABLES)
+    SQLi.ADD_records_to_table(primary_key="mea_hash", records=readings(range(n_rows)), row_obj=Measurement,
+                              session=session)
+    return session
+
+
+def counted(session) -> int:
+    return sum(_["count"] for _ in SQLr.QUERY_rollups(level="day", session=session, t_from=0, t_to=T0 * 2))
+
+
+@pytest.fixture
+def db_fullname(tmp_path):
+    yield str(tmp_path / "former.db")
+    SQLi.dispose_engines()
+
+
+def test_backfill_resumes_by_chunks_and_counts_rows_stored_meanwhile_once(db_fullname):
+    session = former_version_db(db_fullname, n_rows=10)
+    progress = SQLr.PREPARE_backfill(row_obj=Measurement, session=session)
+    assert (progress["last_rowid"], progress["cursor"], progress["finished_at"]) == (10, 0, 0.0)
+    progress = SQLr.BACKFILL_rollups(row_obj=Measurement, session=session, chunk_size=3, max_chunks=2)
+    assert (progress["cursor"], progress["n_rows"], progress["finished_at"]) == (6, 6, 0.0)
+    new = readings(range(100, 105))  # stored with their rollups, while the backfill is in progress
+    SQLi.ADD_records_to_table(primary_key="mea_hash", records=new, row_obj=Measurement, session=session,
+                              commit=False)
+    SQLr.ADD_records_to_rollups(records=new, session=session)
+    session.close()
+    SQLi.dispose_engines()  # the Engine is restarted
+
+    session = SQLi.createSession(db_fullname=db_fullname, tables=[Measurement.__table__] + SQLr.ROLLUP_TABLES)
+    assert SQLr.PREPARE_backfill(row_obj=Measurement, session=session)["cursor"] == 6
+    progress = SQLr.BACKFILL_rollups(row_obj=Measurement, session=session, chunk_size=3)
+    assert progress["finished_at"] and progress["n_rows"] == 10
+    assert counted(session) == 15
+
+
+def test_failed_chunk_is_rolled_back_and_redone(db_fullname, monkeypatch):
+    session = former_version_db(db_fullname, n_rows=10)
+    SQLr.PREPARE_backfill(row_obj=Measurement, session=session)
+    merge = SQLr.ADD_records_to_rollups
+    calls = []
+
+    def failing_on_second_chunk(**kwargs):
+        calls.append(1)
+        merge(**kwargs)
+        if len(calls) == 2:
+            raise OSError("power cut")
+
+    monkeypatch.setattr(SQLr, "ADD_records_to_rollups", failing_on_second_chunk)
+    with pytest.raises(OSError):
+        SQLr.BACKFILL_rollups(row_obj=Measurement, session=session, chunk_size=4)
+    session.rollback()
+    monkeypatch.setattr(SQLr, "ADD_records_to_rollups", merge)
+    assert SQLr.backfill_progress(session=session)["cursor"] == 4
+    assert SQLr.BACKFILL_rollups(row_obj=Measurement, session=session, chunk_size=4)["finished_at"]
+    assert counted(session) == 10
+
+
+def test_new_db_needs_no_backfill(db_fullname):
+    session = SQLi.createSession(db_fullname=db_fullname, tables=[Measurement.__table__] + SQLr.ROLLUP_TABLES)
+    progress = SQLr.PREPARE_backfill(row_obj=Measurement, session=session)
+    assert progress["finished_at"] and progress["last_rowid"] == 0
+
+
+def test_engine_backfills_in_a_scheduled_job_and_holds_retention_meanwhile(make_engine, db_fullname):
+    former_version_db(db_fullname, n_rows=25).close()
+    engine = make_engine(hcdd={"rollup_backfill_chunk_rows": 4, "rollup_backfill_chunks": 2,
+                               "rollup_backfill_every": 0.01, "retention_pause": 0.0},
+                         session_name=db_fullname)
+    assert [_.command for _ in engine.scheduler.jobs] == ["GET_rollup_backfill"]
+    assert engine.GET_retention() == {"postponed": "rollup backfill in progress"}
+    runs = 0
+    while engine.scheduler.jobs and runs < 20:
+        time.sleep(0.02)  # the job is due again
+        engine.run_due_jobs()
+        deadline = time.monotonic() + 5.0
+        while engine.executor.as_dict()["active_jobs"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        runs += 1
+    assert engine.rollup_backfill["finished_at"] and engine.rollup_backfill["n_rows"] == 25
+    assert runs >= 4  # 8 rows per run
+    assert not engine.scheduler.jobs
+    assert counted(engine.db_session()) == 25
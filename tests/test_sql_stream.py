@@ -0,0 +1,43 @@
+"""
+Tests of the STREAM_* functions of SQL_interface: keyset pagination, resuming, and the caller's transaction.
+by Sziller
+"""
+
+import pytest
+from shmc_sqlAccess import SQL_interface as SQLi
+from shmc_sqlBases.sql_baseMeasurement import Measurement
+from shmc_sqlBases.sql_baseMeasurement import MeasurementRecord
+
+
+def readings(values: list) -> list:
+    return [MeasurementRecord.new(mea_type="temperature", mea_loc="test", mea_val=float(_), mea_dim="C",
+                                  timestamp=1_700_000_000.0 + 60.0 * _) for _ in values]
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = SQLi.createSession(db_fullname=str(tmp_path / "stream.db"), tables=[Measurement.__table__])
+    SQLi.ADD_records_to_table(primary_key="mea_hash", records=readings(list(range(7))), row_obj=Measurement,
+                              session=session)
+    yield session
+    SQLi.dispose_engines()
+
+
+def test_stream_yields_every_row_once_in_chunks_and_resumes(session):
+    chunks = list(SQLi.STREAM_entire_table(ordered_by="timestamp", row_obj=Measurement, session=session,
+                                           chunk_size=3, columns=["timestamp", "mea_hash", "mea_val"]))
+    assert [len(_) for _ in chunks] == [3, 3, 1]
+    assert [_["mea_val"] for chunk in chunks for _ in chunk] == [float(_) for _ in range(7)]
+    after = SQLi.stream_cursor(row=chunks[0][-1], ordered_by="timestamp", row_obj=Measurement)
+    resumed = list(SQLi.STREAM_entire_table(ordered_by="timestamp", row_obj=Measurement, session=session,
+                                            chunk_size=3, after=after))
+    assert [_["mea_val"] for chunk in resumed for _ in chunk] == [float(_) for _ in range(3, 7)]
+
+
+def test_stream_does_not_commit_writes_made_between_chunks(session):
+    for chunk in SQLi.STREAM_entire_table(ordered_by="timestamp", row_obj=Measurement, session=session,
+                                          chunk_size=2):
+        session.execute(Measurement.__table__.delete().where(Measurement.__table__.c.mea_hash == chunk[0]["mea_hash"]))
+    session.rollback()
+    rows = SQLi.QUERY_entire_table(ordered_by="timestamp", row_obj=Measurement, session=session)
+    assert len(rows) == 7